@@ -0,0 +1,118 @@
+"""
+Production runtime profile for alkana_kpi.
+
+Loads the server's own alkana_kpi/settings.py (kept out of git) and switches
+on the runtime optimizations, each driven by an environment variable:
+
+- persistent MySQL connections with health checks (DB_CONN_MAX_AGE,
+  DB_CONN_HEALTH_CHECKS), so a wfastcgi worker does not open a new TCP
+  connection to the database host on every request;
+- a real cache backend (KPI_CACHE_BACKEND=file|locmem, KPI_CACHE_DIR). The
+  file cache is shared by every wfastcgi worker process, so the cache
+  versions bumped by the portal (employee context, filter choices, period
+  catalogue, row fragments) reach all of them; locmem is per process, so
+  the employee context, filter choices and period catalogue are then only
+  cached per request (kpi_app.shared_cache);
+- cached_db sessions;
+- the cached template loader;
+- request timing (KPI_REQUEST_TIMING, KPI_SLOW_REQUEST_MS,
+  KPI_SLOW_REQUEST_LOG): Server-Timing header, rotating slow-request log and
+  the staff page /portal/timings/. Off by default.
+
+SECRET_KEY, DEBUG, ALLOWED_HOSTS and DB_NAME / DB_USER / DB_PASSWORD /
+DB_HOST / DB_PORT are also read from the environment when set.
+
+Use it with DJANGO_SETTINGS_MODULE=alkana_kpi.settings_production (web.config)
+and check it on the server with `python manage.py check_runtime_profile`.
+"""
+import copy
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, DATABASES, MIDDLEWARE, TEMPLATES
+
+
+def env_bool(name, default):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def env_list(name):
+    return [item.strip() for item in os.getenv(name, '').split(',') if item.strip()]
+
+
+if os.getenv('SECRET_KEY'):
+    SECRET_KEY = os.environ['SECRET_KEY']
+DEBUG = env_bool('DEBUG', False)
+if env_list('ALLOWED_HOSTS'):
+    ALLOWED_HOSTS = env_list('ALLOWED_HOSTS')
+
+# Database: giữ kết nối giữa các request (mặc định 10 phút), kiểm tra trước khi dùng lại
+DATABASES = copy.deepcopy(DATABASES)
+for key, name in (('NAME', 'DB_NAME'), ('USER', 'DB_USER'), ('PASSWORD', 'DB_PASSWORD'),
+                  ('HOST', 'DB_HOST'), ('PORT', 'DB_PORT')):
+    if os.getenv(name):
+        DATABASES['default'][key] = os.environ[name]
+DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('DB_CONN_MAX_AGE', '600'))
+DATABASES['default']['CONN_HEALTH_CHECKS'] = env_bool('DB_CONN_HEALTH_CHECKS', True)
+
+# Cache
+CACHE_BACKEND = os.getenv('KPI_CACHE_BACKEND', 'file')
+if CACHE_BACKEND == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('KPI_CACHE_DIR', str(BASE_DIR / '.django_cache')),
+            'TIMEOUT': 3600,
+            'OPTIONS': {'MAX_ENTRIES': 20000},
+        }
+    }
+elif CACHE_BACKEND == 'locmem':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'alkana_kpi',
+            'TIMEOUT': 3600,
+            'OPTIONS': {'MAX_ENTRIES': 20000},
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"KPI_CACHE_BACKEND must be 'file' or 'locmem', not {CACHE_BACKEND!r}")
+
+# Session: đọc từ cache, ghi xuống DB
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# Template: cached loader (APP_DIRS không dùng chung được với 'loaders')
+TEMPLATES = copy.deepcopy(TEMPLATES)
+for engine in TEMPLATES:
+    if engine['BACKEND'] != 'django.template.backends.django.DjangoTemplates':
+        continue
+    loaders = ['django.template.loaders.filesystem.Loader']
+    if engine.pop('APP_DIRS', False):
+        loaders.append('django.template.loaders.app_directories.Loader')
+    engine.setdefault('OPTIONS', {})['loaders'] = [('django.template.loaders.cached.Loader', loaders)]
+
+# Request timing: đo SQL / template / view mỗi request (MiddlewareNotUsed khi tắt)
+KPI_REQUEST_TIMING = env_bool('KPI_REQUEST_TIMING', False)
+KPI_SLOW_REQUEST_MS = int(os.getenv('KPI_SLOW_REQUEST_MS', '1000'))
+MIDDLEWARE = ['kpi_app.request_timing.RequestTimingMiddleware'] + [
+    name for name in MIDDLEWARE if name != 'kpi_app.request_timing.RequestTimingMiddleware'
+]
+if KPI_REQUEST_TIMING:
+    SLOW_REQUEST_LOG = os.getenv('KPI_SLOW_REQUEST_LOG', str(BASE_DIR / 'logs' / 'slow_requests.log'))
+    os.makedirs(os.path.dirname(SLOW_REQUEST_LOG), exist_ok=True)
+    LOGGING = copy.deepcopy(globals().get('LOGGING') or {'version': 1, 'disable_existing_loggers': False})
+    LOGGING.setdefault('handlers', {})['slow_requests'] = {
+        'class': 'logging.handlers.RotatingFileHandler',
+        'filename': SLOW_REQUEST_LOG,
+        'maxBytes': 5 * 1024 * 1024,
+        'backupCount': 5,
+        'encoding': 'utf-8',
+    }
+    LOGGING.setdefault('loggers', {})['kpi_app.slow_requests'] = {
+        'handlers': ['slow_requests'], 'level': 'WARNING', 'propagate': False,
+    }
@@ -1,12 +1,23 @@
 from django.contrib import admin
 from import_export.admin import ImportExportModelAdmin
-from .models import alk_dept, alk_job_title, alk_kpi, alk_perspective, alk_dept_objective, alk_dept_group, alk_employee, alk_kpi_result
+from .models import alk_dept, alk_job_title, alk_kpi, alk_perspective, alk_dept_objective, alk_dept_group, alk_employee, alk_kpi_result, alk_kpi_summary, alk_job
+from .employee_context import get_request_employee
+from .exports import stream_export
+from . import filter_choices
+from .formatting import format_result
+from .forms import KpiResultBulkImportForm
+from .jobs import enqueue
+from .paginators import EstimatedCountPaginator
 from .resources import AlkKpiResultImportResource, AlkKpiResultExportResource
 from .resources import alk_deptResource, alk_job_titleResource, alk_perspectiveResource, alk_dept_objectiveResource, alk_dept_groupResource, alk_employeeResource, alk_kpiResource
 from django.contrib.admin import SimpleListFilter
+from django.core.exceptions import PermissionDenied
+from django.shortcuts import redirect, render
+from django.urls import path
 from django.db import models
 from django.utils.safestring import mark_safe
 from django.utils.html import format_html
+from django.utils import timezone
 #test
 
 # Đăng ký model alk_dept với giao diện admin, hỗ trợ import/export và các tuỳ chỉnh hiển thị.
@@ -94,6 +105,37 @@ class alk_kpiAdmin(ImportExportModelAdmin, admin.ModelAdmin):
     # list_editable = ('dept_obj', 'perspective', 'kpi_type', 'from_sap', 'active')
     # list_display_links = None
 
+class CachedChoicesFilter(SimpleListFilter):
+    """
+    Bộ lọc có danh sách lựa chọn lấy từ cache theo phạm vi user (filter_choices),
+    thay cho các query DISTINCT trên toàn bảng kết quả mỗi lần mở changelist.
+    """
+    field_path = None
+    choices_name = None  # 'year' | 'dept' | 'kpi' (filter_choices.CHOICES)
+
+    def lookups(self, request, model_admin):
+        return filter_choices.get_choices(self.choices_name, request)
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.field_path: self.value()})
+        return queryset
+
+
+class ResultYearFilter(CachedChoicesFilter):
+    title = 'year'
+    parameter_name = 'year__exact'  # Giữ tham số URL của bộ lọc mặc định
+    field_path = 'year'
+    choices_name = 'year'
+
+
+class ResultDeptFilter(CachedChoicesFilter):
+    title = 'dept'
+    parameter_name = 'employee__dept__dept_id__exact'
+    field_path = 'employee__dept__dept_id'
+    choices_name = 'dept'
+
+
 class AlkKpiResultAdmin(ImportExportModelAdmin, admin.ModelAdmin):
     def has_change_permission(self, request, obj=None):
         # Superuser được edit tất cả
@@ -164,19 +206,27 @@ class AlkKpiResultAdmin(ImportExportModelAdmin, admin.ModelAdmin):
     get_approved_status.short_description = "Approved"
     get_approved_status.admin_order_field = 'is_locked' # Allow sorting
 
+    def get_row_attrs(self, obj):
+        # Thuộc tính <tr> của changelist (xem change_list_results.html): tô màu dòng đã duyệt
+        return {'class': 'row-locked'} if obj.is_locked else {}
+
     # Class Media configuration
     class Media:
         # Thêm CSS cho giao diện admin (cuộn ngang)
         css = {
             'all': ('kpi_app/css/admin_horizontal_scroll.css',)
         }
-        js = ('admin/js/jquery.init.js', 'kpi_app/js/admin_lock_highlight.js',)
     fields = [
         'year', 'semester', 'employee', 'kpi', 'weigth', 'min', 'target_set', 'max',
         'target_input', 'achievement', 'month'
     ]
     list_per_page = 15
     list_display_links = ('get_kpi_name',)  # Cho phép nhấp vào tên KPI để xem chi tiết
+    # Các cột get_* đọc employee / dept / job_title / kpi: lấy trong cùng một query JOIN
+    list_select_related = ('employee__dept', 'employee__job_title', 'employee__user_id', 'kpi')
+    # Bảng lớn: không đếm chính xác toàn bảng mỗi trang
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     # list_editable = ('target_input', 'achievement','month')
     readonly_fields = ('year', 'semester', 'weigth', 'target_set', 'month', 'min', 'final_result')
 
@@ -185,12 +235,13 @@ class AlkKpiResultAdmin(ImportExportModelAdmin, admin.ModelAdmin):
     def lock_kpi_results(self, request, queryset):
         # Superuser: Lock ALL
         if request.user.is_superuser:
-            updated = queryset.update(is_locked=True)
+            updated = queryset.update(is_locked=True, updated_at=timezone.now())
+            alk_kpi_summary.refresh_queryset(queryset)
             self.message_user(request, f"Successfully approved {updated} records.")
             return
 
         try:
-            employee = alk_employee.objects.get(user_id=request.user)
+            employee = get_request_employee(request)
             # Level 0: Lock employees in same Dept Group
             if employee.level == 0:
                 dept_group = employee.dept.group
@@ -198,7 +249,8 @@ class AlkKpiResultAdmin(ImportExportModelAdmin, admin.ModelAdmin):
                     # Filter queryset to only include records from employees in the same group
                     depts_in_group = alk_dept.objects.filter(group=dept_group)
                     valid_qs = queryset.filter(employee__dept__in=depts_in_group)
-                    updated = valid_qs.update(is_locked=True)
+                    updated = valid_qs.update(is_locked=True, updated_at=timezone.now())
+                    alk_kpi_summary.refresh_queryset(valid_qs)
                     self.message_user(request, f"Successfully approved {updated} records (Group Scope).")
                     if updated < queryset.count():
                         self.message_user(request, "Some records were skipped due to permission scope.", level='WARNING')
@@ -208,7 +260,8 @@ class AlkKpiResultAdmin(ImportExportModelAdmin, admin.ModelAdmin):
             # Level 1: Lock employees in same Dept
             elif employee.level == 1:
                 valid_qs = queryset.filter(employee__dept=employee.dept)
-                updated = valid_qs.update(is_locked=True)
+                updated = valid_qs.update(is_locked=True, updated_at=timezone.now())
+                alk_kpi_summary.refresh_queryset(valid_qs)
                 self.message_user(request, f"Successfully approved {updated} records (Dept Scope).")
                 if updated < queryset.count():
                      self.message_user(request, "Some records were skipped due to permission scope.", level='WARNING')
@@ -223,19 +276,21 @@ class AlkKpiResultAdmin(ImportExportModelAdmin, admin.ModelAdmin):
     def unlock_kpi_results(self, request, queryset):
         # Superuser: Unlock ALL
         if request.user.is_superuser:
-            updated = queryset.update(is_locked=False)
+            updated = queryset.update(is_locked=False, updated_at=timezone.now())
+            alk_kpi_summary.refresh_queryset(queryset)
             self.message_user(request, f"Successfully set {updated} records to Pending.")
             return
 
         try:
-            employee = alk_employee.objects.get(user_id=request.user)
+            employee = get_request_employee(request)
             # Level 0: Unlock employees in same Dept Group
             if employee.level == 0:
                 dept_group = employee.dept.group
                 if dept_group:
                     depts_in_group = alk_dept.objects.filter(group=dept_group)
                     valid_qs = queryset.filter(employee__dept__in=depts_in_group)
-                    updated = valid_qs.update(is_locked=False)
+                    updated = valid_qs.update(is_locked=False, updated_at=timezone.now())
+                    alk_kpi_summary.refresh_queryset(valid_qs)
                     self.message_user(request, f"Successfully set {updated} records to Pending (Group Scope).")
                 else:
                      self.message_user(request, "Your Department Group is not defined.", level='ERROR')
@@ -243,7 +298,8 @@ class AlkKpiResultAdmin(ImportExportModelAdmin, admin.ModelAdmin):
             # Level 1: Unlock employees in same Dept
             elif employee.level == 1:
                 valid_qs = queryset.filter(employee__dept=employee.dept)
-                updated = valid_qs.update(is_locked=False)
+                updated = valid_qs.update(is_locked=False, updated_at=timezone.now())
+                alk_kpi_summary.refresh_queryset(valid_qs)
                 self.message_user(request, f"Successfully set {updated} records to Pending (Dept Scope).")
             
             else:
@@ -252,11 +308,84 @@ class AlkKpiResultAdmin(ImportExportModelAdmin, admin.ModelAdmin):
         except alk_employee.DoesNotExist:
              self.message_user(request, "Employee profile not found.", level='ERROR')
 
-    actions = [lock_kpi_results, unlock_kpi_results]
+    @admin.action(description='[EXPORT] Export selected to Excel (streaming)')
+    def export_kpi_results_xlsx(self, request, queryset):
+        # Một query values() + write-only workbook, không qua import-export (tốn RAM khi nhiều dòng)
+        return stream_export(queryset, file_format='xlsx')
+
+    @admin.action(description='[EXPORT] Export selected to CSV (streaming)')
+    def export_kpi_results_csv(self, request, queryset):
+        return stream_export(queryset, file_format='csv')
+
+    @admin.action(description='[JOB] Re-score selected periods in background')
+    def queue_rescore_kpi_results(self, request, queryset):
+        if not request.user.is_superuser:
+            self.message_user(request, "Permission Denied: only superusers can re-score.", level='ERROR')
+            return
+        periods = queryset.order_by().values_list('year', 'semester', 'month').distinct()
+        jobs = [
+            enqueue('rescore_kpi_results', user=request.user, params={'year': y, 'semester': s, 'month': m})
+            for y, s, m in periods
+        ]
+        self.message_user(request, f"Queued {len(jobs)} re-score job(s): " + ", ".join(f"#{j.id}" for j in jobs))
+
+    actions = [
+        lock_kpi_results, unlock_kpi_results, export_kpi_results_xlsx, export_kpi_results_csv,
+        queue_rescore_kpi_results,
+    ]
+
+    change_list_template = 'admin/kpi_app/alk_kpi_result/change_list_jobs.html'
+
+    def get_urls(self):
+        opts = self.model._meta
+        urls = [
+            path('bulk-import/', self.admin_site.admin_view(self.bulk_import_view),
+                 name=f'{opts.app_label}_{opts.model_name}_bulk_import'),
+        ]
+        return urls + super().get_urls()
+
+    def bulk_import_view(self, request):
+        """Upload file mẫu -> tạo job import_kpi_results chạy nền."""
+        if not self.has_import_permission(request):
+            raise PermissionDenied
+        form = KpiResultBulkImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            job = enqueue('import_kpi_results', user=request.user, input_file=form.cleaned_data['import_file'])
+            return redirect('job_detail', job_id=job.id)
+        return render(request, 'admin/kpi_app/alk_kpi_result/bulk_import.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'form': form,
+            'title': 'Bulk import KPI results',
+        })
+
+    def import_action(self, request, **kwargs):
+        # Nút Import mặc định: import chạy nền (import trực tiếp trong request bị timeout trên IIS)
+        if not self.has_import_permission(request):
+            raise PermissionDenied
+        opts = self.model._meta
+        return redirect(f'admin:{opts.app_label}_{opts.model_name}_bulk_import')
+
+    def export_action(self, request):
+        """Nút Export mặc định: job export_kpi_results với bộ lọc / tìm kiếm hiện tại của changelist."""
+        if not self.has_export_permission(request):
+            raise PermissionDenied
+        params = request.GET.copy()
+        file_format = 'csv' if params.pop('format', None) == ['csv'] else 'xlsx'
+        job = enqueue('export_kpi_results', user=request.user, params={
+            'changelist': params.urlencode(), 'format': file_format,
+        })
+        return redirect('job_detail', job_id=job.id)
+
+    def delete_queryset(self, request, queryset):
+        """Xoá hàng loạt không gọi delete() của model nên cập nhật bảng tổng hợp tại đây."""
+        keys = list(queryset.order_by().values_list('employee_id', 'year', 'semester', 'month').distinct())
+        super().delete_queryset(request, queryset)
+        alk_kpi_summary.refresh_keys(keys)
 
     list_filter = (
         'is_locked', # Add filter
-        'year', 'semester', 'month','employee__dept',
+        ResultYearFilter, 'semester', 'month', ResultDeptFilter,
         'kpi__kpi_type',
         'kpi__percentage_cal',
         'kpi__get_1_is_zero',
@@ -343,7 +472,7 @@ class AlkKpiResultAdmin(ImportExportModelAdmin, admin.ModelAdmin):
         if user.is_superuser:
             return qs
         try:
-            employee = alk_employee.objects.get(user_id=user)
+            employee = get_request_employee(request)
         except alk_employee.DoesNotExist:
             return qs.none()
         if employee.level == 1:
@@ -386,7 +515,7 @@ class AlkKpiResultAdmin(ImportExportModelAdmin, admin.ModelAdmin):
                 user_level = -1 # Superuser has special privileges
             else:
                 try:
-                    emp = alk_employee.objects.get(user_id=user)
+                    emp = get_request_employee(request)
                     user_level = emp.level
                 except alk_employee.DoesNotExist:
                     pass
@@ -417,7 +546,7 @@ class AlkKpiResultAdmin(ImportExportModelAdmin, admin.ModelAdmin):
             return ro
         # Kiểm tra nếu user có employee level 1
         try:
-            employee = alk_employee.objects.get(user_id=user)
+            employee = get_request_employee(request)
             if employee.level == 1:
                 if 'kpi' in ro:
                     ro.remove('kpi')
@@ -468,90 +597,46 @@ class AlkKpiResultAdmin(ImportExportModelAdmin, admin.ModelAdmin):
         return ''
     weigth_percent.short_description = 'Weigth (%)'
 
+    # Các cột *_1f dùng chung bộ định dạng với portal và export (kpi_app.formatting)
     def weigth_percent_1f(self, obj):
         """Hiển thị trọng số dạng phần trăm (1 chữ số thập phân)."""
-        if obj.weigth is not None:
-            return f"{round(obj.weigth * 100, 1)}%"
-        return ''
+        return format_result(obj)['weigth']
     weigth_percent_1f.short_description = 'Weigth (%)'
 
     def min_1f(self, obj):
         """Hiển thị giá trị min với 1 chữ số thập phân."""
-        if obj.min is not None:
-            return f"{round(obj.min, 1)}"
-        return ''
+        return format_result(obj)['min']
     min_1f.short_description = 'Min'
 
     def target_set_1f(self, obj):
         """
-        Hiển thị target_set với định dạng phần trăm nếu có percentage_cal,
-        hoặc nếu percentage_cal=False và target_set<1 thì cũng hiển thị phần trăm,
-        hoặc nếu percent_display=True thì luôn hiển thị phần trăm,
-        ngược lại hiển thị 4 chữ số thập phân.
-        Nếu target_set == 0 thì không hiển thị phần trăm.
+        Hiển thị target_set dạng phần trăm nếu percent_display, percentage_cal
+        hoặc target_set<1; ngược lại (hoặc target_set == 0) 4 chữ số thập phân.
         """
-        if obj.target_set is not None:
-            if obj.target_set == 0:
-                return f"{obj.target_set:,.4f}"
-            if obj.kpi and hasattr(obj.kpi, 'percent_display') and obj.kpi.percent_display:
-                return f"{round(obj.target_set * 100, 3):,.3f}%"
-            if obj.kpi and hasattr(obj.kpi, 'percentage_cal'):
-                if obj.kpi.percentage_cal:
-                    return f"{round(obj.target_set * 100, 3):,.3f}%"
-                elif obj.target_set < 1:
-                    return f"{round(obj.target_set * 100, 3):,.3f}%"
-            return f"{obj.target_set:,.4f}"
-        return ''
+        return format_result(obj)['target_set']
     target_set_1f.short_description = 'Target Set'
 
     def max_1f(self, obj):
         """Hiển thị giá trị max với 1 chữ số thập phân."""
-        if obj.max is not None:
-            return f"{round(obj.max, 1)}"
-        return ''
+        return format_result(obj)['max']
     max_1f.short_description = 'Max'
 
     def target_input_1f(self, obj):
         """
-        Hiển thị target_input với 4 chữ số thập phân,
-        hoặc nếu percentage_cal=False và target_set<1 thì hiển thị phần trăm,
-        hoặc nếu percent_display=True thì luôn hiển thị phần trăm.
-        Nếu target_set == 0 thì không hiển thị phần trăm.
+        Hiển thị target_input dạng phần trăm nếu percent_display, hoặc
+        percentage_cal=False và target_set<1; ngược lại 4 chữ số thập phân.
         """
-        if obj.target_input is not None:
-            if obj.target_set == 0:
-                return f"{obj.target_input:,.4f}"
-            if obj.kpi and hasattr(obj.kpi, 'percent_display') and obj.kpi.percent_display:
-                return f"{round(obj.target_input * 100, 3):,.3f}%"
-            if obj.kpi and hasattr(obj.kpi, 'percentage_cal') and obj.kpi.percentage_cal is False and obj.target_set is not None and obj.target_set < 1:
-                return f"{round(obj.target_input * 100, 3):,.3f}%"
-            return f"{obj.target_input:,.4f}"
-        return ''
+        return format_result(obj)['target_input']
     target_input_1f.short_description = 'Target Input'
 
     def achievement_1f(self, obj):
-        """
-        Hiển thị achievement với 4 chữ số thập phân,
-        hoặc nếu percentage_cal=False và target_set<1 thì hiển thị phần trăm,
-        hoặc nếu percent_display=True thì luôn hiển thị phần trăm.
-        Nếu target_set == 0 thì không hiển thị phần trăm.
-        """
-        if obj.achievement is not None:
-            if obj.target_set == 0:
-                return f"{obj.achievement:,.4f}"
-            if obj.kpi and hasattr(obj.kpi, 'percent_display') and obj.kpi.percent_display:
-                return f"{round(obj.achievement * 100, 3):,.3f}%"
-            if obj.kpi and hasattr(obj.kpi, 'percentage_cal') and obj.kpi.percentage_cal is False and obj.target_set is not None and obj.target_set < 1:
-                return f"{round(obj.achievement * 100, 3):,.3f}%"
-            return f"{obj.achievement:,.4f}"
-        return ''
+        """Hiển thị achievement, cùng quy tắc với target_input."""
+        return format_result(obj)['achievement']
     achievement_1f.short_description = 'Achievement'
 
     def final_result_percent_1f(self, obj):
         """Hiển thị kết quả cuối cùng dạng phần trăm (1 chữ số thập phân)."""
-        if obj.final_result is not None:
-            return f"{round(obj.final_result * 100, 1)}%"
-        return ''
+        return format_result(obj)['final_result']
     final_result_percent_1f.short_description = 'Final Result (%)'
 
     def get_kpi_from_sap(self, obj):
@@ -563,54 +648,22 @@ class AlkKpiResultAdmin(ImportExportModelAdmin, admin.ModelAdmin):
         """
         Hiển thị hệ số (factor) dạng phần trăm, tính bằng final_result / weigth.
         """
-        if obj.final_result is not None and obj.weigth:
-            try:
-                value = obj.final_result / obj.weigth
-                return f"{round(value * 100, 1)}%"
-            except Exception:
-                return ''
-        return ''
+        return format_result(obj)['factor']
     factor_percent_1f.short_description = 'Factor (%)'
 
 class KpiUserFilter(SimpleListFilter):
     """
     Bộ lọc KPI theo user:
     - Superuser: xem tất cả KPI.
-    - Employee level 0: xem KPI của tất cả employee có cùng alk_dept.group với mình.
-    - Employee level 1: xem KPI của phòng ban.
-    - Khác: chỉ xem KPI đã có bản ghi alk_kpi_result cho employee đó.
+    - Employee level 0 / level 1 / khác: KPI đã có bản ghi alk_kpi_result của
+      employee trong group / phòng ban / chính mình.
     """
     title = 'kpi'
     parameter_name = 'kpi'
 
     def lookups(self, request, model_admin):
-        user = request.user
-        if user.is_superuser:
-            kpis = alk_kpi.objects.all()
-        else:
-            try:
-                employee = alk_employee.objects.get(user_id__username=user.username)
-            except alk_employee.DoesNotExist:
-                return []
-            if employee.level == 1:
-                # KPI của toàn bộ phòng ban
-                kpis = alk_kpi.objects.filter(dept_obj__alk_dept__alk_employee__dept=employee.dept).distinct()
-            elif employee.level == 0:
-                # KPI của employee có cùng alk_dept.group với alk_dept.group của employee đó
-                dept_group = employee.dept.group if employee.dept and hasattr(employee.dept, 'group') else None
-                if dept_group:
-                    # Lấy tất cả employee thuộc các phòng ban cùng group
-                    depts_in_group = alk_dept.objects.filter(group=dept_group)
-                    employees_in_group = alk_employee.objects.filter(dept__in=depts_in_group)
-                    emp_kpis = alk_kpi_result.objects.filter(employee__in=employees_in_group).values_list('kpi', flat=True)
-                    kpis = alk_kpi.objects.filter(id__in=emp_kpis).distinct()
-                else:
-                    kpis = alk_kpi.objects.none()
-            else:
-                # KPI chỉ của employee đó (chỉ những KPI đã có bản ghi alk_kpi_result cho employee này)
-                emp_kpis = alk_kpi_result.objects.filter(employee=employee).values_list('kpi', flat=True)
-                kpis = alk_kpi.objects.filter(id__in=emp_kpis).distinct()
-        return [(k.id, k.kpi_name) for k in kpis]
+        # Lựa chọn được cache theo phạm vi (filter_choices.kpi_choices)
+        return filter_choices.kpi_choices(request)
 
     def queryset(self, request, queryset):
         if self.value():
@@ -633,3 +686,14 @@ admin.site.site_title = "Alkana KPI App"
 admin.site.index_title = mark_safe('Welcome to Alkana KPI App | <a href="/home/">Report</a>')
 
 
+# Theo dõi các job nền (import / export / re-score)
+class alk_jobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'job_type', 'status', 'processed', 'total', 'created_by', 'created_at', 'finished_at')
+    list_filter = ('status', 'job_type')
+    readonly_fields = [f.name for f in alk_job._meta.fields]
+    list_per_page = 30
+
+    def has_add_permission(self, request):
+        return False
+
+admin.site.register(alk_job, alk_jobAdmin)
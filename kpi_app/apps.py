@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class KpiAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'kpi_app'
+
+    def ready(self):
+        # Đăng ký signal huỷ cache employee context / lựa chọn bộ lọc admin / danh mục kỳ / fragment dòng KPI
+        from . import employee_context, filter_choices, period_catalogue, row_versions  # noqa: F401
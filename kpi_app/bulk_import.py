@@ -0,0 +1,227 @@
+"""
+Bulk import of alk_kpi_result from the semester template (xlsx / csv).
+
+Same columns and natural key as AlkKpiResultImportResource, but employees
+and KPIs are resolved from two maps loaded once, the whole batch is scored
+with scoring.score_frame, and rows are upserted on the natural key with
+bulk_create(update_conflicts=True) instead of one save() per row.
+"""
+import csv
+from decimal import Decimal
+from pathlib import Path
+
+import pandas as pd
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+
+from .filter_choices import invalidate_filter_choices
+from .period_catalogue import invalidate_period_catalogue
+from .models import alk_employee, alk_kpi, alk_kpi_result, alk_kpi_summary
+from .periods import period_code
+from .scoring import SCORING_FIELDS, score_frame
+
+# Cột trong file mẫu -> field của alk_kpi_result (giống AlkKpiResultImportResource)
+COLUMN_FIELDS = {
+    'year': 'year',
+    'semester': 'semester',
+    'employee': 'employee',
+    'kpi': 'kpi',
+    'weigth': 'weigth',
+    'min': 'min',
+    'target_set': 'target_set',
+    'max': 'max',
+    'target_input': 'target_input',
+    'achivement': 'achievement',
+    'month': 'month',
+}
+FIELD_COLUMNS = {name: column for column, name in COLUMN_FIELDS.items()}
+KEY_FIELDS = ('employee', 'year', 'semester', 'month', 'kpi')
+DECIMAL_FIELDS = ('weigth', 'min', 'target_set', 'max', 'target_input', 'achievement')
+
+
+class BulkImportError(Exception):
+    """Raised with every row error; nothing is written when it is raised."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(f"{len(errors)} row(s) could not be imported:\n" + "\n".join(errors))
+
+
+def read_rows(path):
+    """Yield one dict per data row of an .xlsx or .csv template."""
+    path = Path(path)
+    if path.suffix.lower() == '.csv':
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            yield from csv.DictReader(f)
+        return
+
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        headers = [str(h).strip() if h is not None else '' for h in next(rows, [])]
+        for values in rows:
+            if any(v not in (None, '') for v in values):
+                yield dict(zip(headers, values))
+    finally:
+        workbook.close()
+
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip()) or (
+        isinstance(value, float) and pd.isna(value)
+    )
+
+
+def _clean_decimal(field, value):
+    if _blank(value):
+        return None
+    if isinstance(value, str):
+        value = value.replace(',', '').strip()
+    number = field.to_python(value)
+    # Làm tròn như khi lưu vào DB để điểm tính ra khớp với save()
+    return number.quantize(Decimal(1).scaleb(-field.decimal_places))
+
+
+def _field_default(name):
+    default = alk_kpi_result._meta.get_field(name).get_default()
+    return Decimal(str(default)) if default is not None else None
+
+
+def import_kpi_results(rows, batch_size=2000, progress=None):
+    """
+    Upsert KPI results from template rows (dicts keyed by template column).
+
+    Every row is validated first; on any error BulkImportError is raised and
+    nothing is written. The valid rows are then written one transaction per
+    batch (with their alk_kpi_summary rows), so a database error part-way
+    leaves the earlier batches committed. Columns missing from the file keep
+    their stored value on existing rows. `progress(done, total)` is called
+    after each batch commits. Returns {'created': n, 'updated': n}.
+    """
+    rows = list(rows)
+    columns = {column for row in rows for column in row if column in COLUMN_FIELDS}
+    missing = [c for c in ('year', 'semester', 'employee', 'kpi', 'month') if c not in columns]
+    if missing:
+        raise BulkImportError([f"Missing column(s): {', '.join(missing)}"])
+
+    # Nạp một lần các map username -> employee_id và kpi_name -> kpi
+    usernames = {str(row['employee']).strip() for row in rows if not _blank(row.get('employee'))}
+    kpi_names = {str(row['kpi']).strip() for row in rows if not _blank(row.get('kpi'))}
+    employees = dict(
+        alk_employee.objects.filter(user_id__username__in=usernames).values_list('user_id__username', 'id')
+    )
+    kpis, duplicate_kpis = {}, set()
+    for kpi in alk_kpi.objects.filter(kpi_name__in=kpi_names):
+        if kpi.kpi_name in kpis:
+            duplicate_kpis.add(kpi.kpi_name)
+        kpis[kpi.kpi_name] = kpi
+
+    fields = {name: alk_kpi_result._meta.get_field(name) for name in COLUMN_FIELDS.values()}
+    present = {COLUMN_FIELDS[c] for c in columns}
+    records = {}
+    errors = []
+    for line, row in enumerate(rows, start=2):
+        try:
+            username = str(row['employee']).strip()
+            kpi_name = str(row['kpi']).strip()
+            if username not in employees:
+                raise ValidationError(f"Không tìm thấy nhân viên với username: {username}")
+            if kpi_name not in kpis:
+                raise ValidationError(f"KPI not found: {kpi_name}")
+            if kpi_name in duplicate_kpis:
+                raise ValidationError(f"KPI name is not unique: {kpi_name}")
+            record = {
+                'employee': employees[username],
+                'kpi': kpis[kpi_name],
+                'year': fields['year'].to_python(row['year']),
+                'semester': str(row['semester']).strip(),
+                'month': str(row['month']).strip(),
+            }
+            for name in DECIMAL_FIELDS:
+                if name in present:
+                    record[name] = _clean_decimal(fields[name], row.get(FIELD_COLUMNS[name]))
+            if record['year'] is None or not record['semester'] or not record['month']:
+                raise ValidationError("year, semester and month are required")
+        except (ValidationError, TypeError, ValueError) as e:
+            message = '; '.join(e.messages) if isinstance(e, ValidationError) else str(e)
+            errors.append(f"Row {line}: {message}")
+            continue
+        # Trùng khoá trong file: dòng sau ghi đè dòng trước (giống import từng dòng)
+        records[_key(record)] = record
+
+    if errors:
+        raise BulkImportError(errors)
+
+    update_fields = sorted((present - set(KEY_FIELDS)) | {'target_input', 'final_result', 'period_code', 'updated_at'})
+    records = list(records.values())
+    created = updated = 0
+    for start in range(0, len(records), batch_size):
+        batch = records[start:start + batch_size]
+        with transaction.atomic():
+            batch_created, batch_updated = _write_batch(batch, present, update_fields)
+            alk_kpi_summary.refresh_keys(
+                {(r['employee'], r['year'], r['semester'], r['month']) for r in batch}
+            )
+        created += batch_created
+        updated += batch_updated
+        # Ngoài transaction để job_status thấy tiến độ ngay và không giữ khoá dòng alk_job
+        if progress:
+            progress(created + updated, len(records))
+    # bulk_create không gửi post_save
+    if created:
+        invalidate_filter_choices()
+        invalidate_period_catalogue()
+    return {'created': created, 'updated': updated}
+
+
+def _key(record):
+    kpi = record['kpi']
+    return (record['employee'], record['year'], record['semester'], record['month'], getattr(kpi, 'id', kpi))
+
+
+def _write_batch(records, present, update_fields):
+    # Giá trị hiện có của các cột không có trong file, để tính điểm đúng khi cập nhật
+    existing = {
+        _key(row): row
+        for row in alk_kpi_result.objects.filter(
+            employee_id__in={r['employee'] for r in records},
+            kpi_id__in={r['kpi'].id for r in records},
+            year__in={r['year'] for r in records},
+        ).values('id', 'employee', 'year', 'semester', 'month', 'kpi', *DECIMAL_FIELDS)
+    }
+    frame_rows = []
+    for record in records:
+        current = existing.get(_key(record))
+        for name in DECIMAL_FIELDS:
+            if name not in present:
+                record[name] = current[name] if current else _field_default(name)
+        kpi = record['kpi']
+        frame_rows.append({
+            'id': current['id'] if current else None,
+            **{name: record[name] for name in DECIMAL_FIELDS},
+            'kpi__kpi_type': kpi.kpi_type,
+            'kpi__percentage_cal': kpi.percentage_cal,
+            'kpi__get_1_is_zero': kpi.get_1_is_zero,
+        })
+
+    scored = score_frame(pd.DataFrame.from_records(frame_rows, columns=SCORING_FIELDS))
+    objs = []
+    for record, target_input, final_result in zip(records, scored['target_input'], scored['final_result']):
+        values = {name: record[name] for name in DECIMAL_FIELDS}
+        values['target_input'] = target_input
+        objs.append(alk_kpi_result(
+            employee_id=record['employee'], kpi=record['kpi'], year=record['year'],
+            semester=record['semester'], month=record['month'], final_result=final_result,
+            period_code=period_code(record['year'], record['semester'], record['month']),
+            **values,
+        ))
+
+    # MySQL dùng ON DUPLICATE KEY (không nhận unique_fields), PostgreSQL/SQLite dùng ON CONFLICT
+    unique_fields = list(KEY_FIELDS) if connection.features.supports_update_conflicts_with_target else None
+    alk_kpi_result.objects.bulk_create(
+        objs, update_conflicts=True, unique_fields=unique_fields, update_fields=update_fields,
+    )
+    updated = sum(1 for record in records if _key(record) in existing)
+    return len(records) - updated, updated
@@ -0,0 +1,109 @@
+"""
+Employee / role context of the logged-in user.
+
+Portal views and admin hooks all need the requester's alk_employee (dept,
+group, level) and, for managers, the ids of the team in scope. It is resolved
+once per request, memoized on the request and kept in the cache framework
+between requests. Any change to alk_employee or alk_dept bumps a cache
+version, which drops every cached context at once. Unless that cache is
+shared by every server process (shared_cache), the context is only kept
+for the request.
+"""
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import alk_dept, alk_employee
+from .shared_cache import cache_is_shared
+
+CACHE_TIMEOUT = 300
+VERSION_KEY = 'kpi_app:employee_context:version'
+_MISSING = object()
+
+
+class EmployeeContext:
+    """The requester's employee row plus the ids of the employees in their scope."""
+
+    def __init__(self, employee, team_scope_ids):
+        self.employee = employee
+        self.team_scope_ids = frozenset(team_scope_ids)
+
+    @property
+    def level(self):
+        return self.employee.level
+
+    @property
+    def dept(self):
+        return self.employee.dept
+
+    @property
+    def group(self):
+        return self.employee.dept.group if self.employee.dept else None
+
+    @property
+    def is_manager(self):
+        return self.employee.level is not None and self.employee.level <= 1
+
+    @property
+    def scope_key(self):
+        """Identifies the team scope, shared by every manager of the same group / dept."""
+        if self.level == 0 and self.group:
+            return f'group:{self.group}'
+        if self.level == 1 and self.employee.dept_id:
+            return f'dept:{self.employee.dept_id}'
+        return f'employee:{self.employee.id}'
+
+    def in_scope(self, employee_id):
+        """Level 0: same dept group, level 1: same dept, others: only themselves."""
+        return employee_id in self.team_scope_ids
+
+
+def build_employee_context(user):
+    employee = alk_employee.objects.select_related('dept', 'dept_gr', 'job_title').filter(user_id=user).first()
+    if employee is None:
+        return None
+    if employee.level == 0 and employee.dept and employee.dept.group:
+        team = alk_employee.objects.filter(dept__group=employee.dept.group)
+    elif employee.level == 1 and employee.dept_id:
+        team = alk_employee.objects.filter(dept_id=employee.dept_id)
+    else:
+        team = alk_employee.objects.filter(id=employee.id)
+    return EmployeeContext(employee, team.values_list('id', flat=True))
+
+
+def get_employee_context(request):
+    """EmployeeContext of request.user, or None (anonymous / no employee profile)."""
+    if hasattr(request, '_employee_context'):
+        return request._employee_context
+    user = getattr(request, 'user', None)
+    context = None
+    if user is not None and user.is_authenticated:
+        if cache_is_shared():
+            key = f'kpi_app:employee_context:{cache.get_or_set(VERSION_KEY, 1, None)}:{user.pk}'
+            context = cache.get(key, _MISSING)
+            if context is _MISSING:
+                context = build_employee_context(user)
+                cache.set(key, context, CACHE_TIMEOUT)
+        else:
+            # Cache riêng từng process: đổi phạm vi quản lý không xoá được bản cache ở process khác
+            context = build_employee_context(user)
+    request._employee_context = context
+    return context
+
+
+def get_request_employee(request):
+    """Drop-in for alk_employee.objects.get(user_id=request.user); raises DoesNotExist the same way."""
+    context = get_employee_context(request)
+    if context is None:
+        raise alk_employee.DoesNotExist("alk_employee matching query does not exist.")
+    return context.employee
+
+
+@receiver([post_save, post_delete], sender=alk_employee)
+@receiver([post_save, post_delete], sender=alk_dept)
+def invalidate_employee_contexts(**kwargs):
+    # Đổi phòng ban / level / group ảnh hưởng phạm vi của cả quản lý -> bỏ toàn bộ cache
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 2, None)
@@ -0,0 +1,248 @@
+"""
+Streaming export of alk_kpi_result.
+
+Same columns as AlkKpiResultExportResource, but the rows come from one
+values() query with every join, read in primary-key order in fixed-size
+chunks (keyset pagination, so MySQL never buffers the whole result), and are
+written as CSV chunks or an openpyxl write-only workbook. Memory stays flat
+whatever the row count.
+"""
+import csv
+import tempfile
+
+from django.http import FileResponse, StreamingHttpResponse
+
+from .formatting import format_row
+
+CHUNK_SIZE = 2000
+
+KPI_TYPE_LABELS = {
+    1: "1 - Bigger better result = achieve/target",
+    2: "2 - Smaller better result = target/achieve",
+    3: "3 - Mistake",
+}
+
+# values() lookups used by the export, all fetched in one query
+EXPORT_VALUES = (
+    'id', 'year', 'semester', 'month', 'employee_id', 'kpi_id',
+    'weigth', 'min', 'target_set', 'max', 'target_input', 'achievement',
+    'period_code', 'final_result', 'active', 'is_locked',
+    'employee__dept__dept_name', 'employee__user_id__username', 'employee__name',
+    'employee__level', 'employee__job_title__job_title',
+    'kpi__perspective__perspective_name', 'kpi__dept_obj__objective_name', 'kpi__kpi_name',
+    'kpi__kpi_type', 'kpi__percentage_cal', 'kpi__get_1_is_zero', 'kpi__from_sap', 'kpi__percent_display',
+)
+
+
+def _text(key):
+    return lambda row: row[key] if row[key] is not None else ''
+
+
+def _kpi(key):
+    # Giống dehydrate_*: rỗng khi không có KPI
+    return lambda row: row[key] if row['kpi_id'] is not None else ''
+
+
+def _display(key):
+    # Chuỗi hiển thị từ kpi_app.formatting (giống cột *_1f của admin)
+    return lambda row: row['display'][key]
+
+
+def _flag(key):
+    # BooleanWidget của import-export xuất 1 / 0
+    return lambda row: '' if row[key] is None else int(row[key])
+
+
+def _kpi_type(row):
+    if row['kpi_id'] is None:
+        return ''
+    return KPI_TYPE_LABELS.get(row['kpi__kpi_type'], row['kpi__kpi_type'])
+
+
+# (header, value) in AlkKpiResultExportResource.get_export_headers() order
+EXPORT_COLUMNS = (
+    ('year', _text('year')),
+    ('semester', _text('semester')),
+    ('get_dept', _text('employee__dept__dept_name')),
+    ('get_employee_userid', _text('employee__user_id__username')),
+    ('get_employee_name', _text('employee__name')),
+    ('get_level', lambda row: row['employee__level'] if row['employee_id'] is not None else ''),
+    ('get_job_title', _text('employee__job_title__job_title')),
+    ('get_perspective', _text('kpi__perspective__perspective_name')),
+    ('get_dept_obj', _text('kpi__dept_obj__objective_name')),
+    ('get_kpi_name', _text('kpi__kpi_name')),
+    ('weigth_percent_1f', _display('weigth')),
+    ('min_1f', _display('min')),
+    ('target_set_1f', _display('target_set')),
+    ('max_1f', _display('max')),
+    ('target_input_1f', _display('target_input')),
+    ('achivement_1f', _display('achievement')),
+    ('final_result_percent_1f', _display('final_result')),
+    ('month', _text('month')),
+    ('get_kpi_type', _kpi_type),
+    ('get_percentage_cal', _kpi('kpi__percentage_cal')),
+    ('get_get_1_is_zero', _kpi('kpi__get_1_is_zero')),
+    ('get_kpi_from_sap', _kpi('kpi__from_sap')),
+    ('id', _text('id')),
+    ('employee', _text('employee_id')),
+    ('kpi', _text('kpi_id')),
+    ('weigth', _text('weigth')),
+    ('min', _text('min')),
+    ('target_set', _text('target_set')),
+    ('max', _text('max')),
+    ('target_input', _text('target_input')),
+    ('achievement', _text('achievement')),
+    ('period_code', _text('period_code')),
+    ('final_result', _text('final_result')),
+    ('active', _flag('active')),
+    ('is_locked', _flag('is_locked')),
+)
+EXPORT_HEADERS = [header for header, _ in EXPORT_COLUMNS]
+
+
+def iter_export_rows(queryset, chunk_size=CHUNK_SIZE):
+    """Yield one list of cell values per row, CHUNK_SIZE rows per query."""
+    rows = queryset.order_by('pk').values(*EXPORT_VALUES)
+    last_pk = None
+    while True:
+        chunk = rows.filter(pk__gt=last_pk) if last_pk is not None else rows
+        chunk = list(chunk[:chunk_size])
+        for row in chunk:
+            row['display'] = format_row(row)
+            yield [value(row) for _, value in EXPORT_COLUMNS]
+        if len(chunk) < chunk_size:
+            return
+        last_pk = chunk[-1]['id']
+
+
+class _Echo:
+    """File-like object for csv.writer that returns the line instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def _report(progress, total):
+    """Wrap a job progress callback: called with the row count every CHUNK_SIZE rows."""
+    def report(count, force=False):
+        if progress and (force or count % CHUNK_SIZE == 0):
+            progress(count, total)
+    return report
+
+
+def write_csv(queryset, output, progress=None):
+    """Write the export as UTF-8 CSV to a binary file object; returns the row count."""
+    report = _report(progress, queryset.count() if progress else None)
+    writer = csv.writer(_Echo())
+    output.write(('\ufeff' + writer.writerow(EXPORT_HEADERS)).encode('utf-8'))
+    count = 0
+    for count, row in enumerate(iter_export_rows(queryset), start=1):
+        output.write(writer.writerow(row).encode('utf-8'))
+        report(count)
+    report(count, force=True)
+    return count
+
+
+def write_xlsx(queryset, output, progress=None):
+    """Write the export with an openpyxl write-only workbook; returns the row count."""
+    import openpyxl
+
+    report = _report(progress, queryset.count() if progress else None)
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('alk_kpi_result')
+    sheet.append(EXPORT_HEADERS)
+    count = 0
+    for count, row in enumerate(iter_export_rows(queryset), start=1):
+        sheet.append(row)
+        report(count)
+    workbook.save(output)
+    report(count, force=True)
+    return count
+
+
+REPORT_COLUMNS = {
+    'year': 'Year',
+    'semester': 'Semester',
+    'month': 'Month',
+    'employee__user_id__username': 'Employee User ID',
+    'employee__name': 'Employee Name',
+    'employee__dept__dept_name': 'Department',
+    'subtotal': 'Subtotal (Final Result)',
+}
+
+
+def write_report_xlsx(queryset, output):
+    """Subtotal of final_result per employee and period (report of the home page); returns the row count."""
+    import openpyxl
+    from django.db.models import Sum
+
+    grouped = (
+        queryset.values(*list(REPORT_COLUMNS)[:-1]).annotate(subtotal=Sum('final_result'))
+        .order_by('year', 'semester', 'employee__user_id__username', 'month')
+    )
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('KPI Report')
+    sheet.append(list(REPORT_COLUMNS.values()))
+    count = 0
+    for count, row in enumerate(grouped.iterator(chunk_size=CHUNK_SIZE), start=1):
+        sheet.append([row[key] for key in REPORT_COLUMNS])
+    workbook.save(output)
+    return count
+
+
+def write_ranking_xlsx(ranking, output, title):
+    """Ranking of the manager reports screen (kpi_app.ranking.employee_ranking rows); returns the row count."""
+    import openpyxl
+    from openpyxl.styles import Alignment, Font, PatternFill
+
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = title
+
+    sheet.append(['RANK', 'EMPLOYEE NAME', 'JOB TITLE', 'TOTAL SCORE (%)', 'PERCENT RANK'])
+    for cell in sheet[1]:
+        cell.font = Font(bold=True, color='FFFFFF')
+        cell.fill = PatternFill(start_color='4E73DF', end_color='4E73DF', fill_type='solid')
+        cell.alignment = Alignment(horizontal='center')
+    for column, width in zip('ABCDE', (10, 30, 25, 20, 16)):
+        sheet.column_dimensions[column].width = width
+
+    count = 0
+    for count, row in enumerate(ranking, start=1):
+        sheet.append([row['rank'], row['name'], row['job_title'], float(row['score']), round(row['percent_rank'], 4)])
+    workbook.save(output)
+    return count
+
+
+def stream_csv(queryset, filename):
+    writer = csv.writer(_Echo())
+
+    def lines():
+        yield '\ufeff'  # BOM để Excel đọc đúng tiếng Việt
+        yield writer.writerow(EXPORT_HEADERS)
+        for row in iter_export_rows(queryset):
+            yield writer.writerow(row)
+
+    response = StreamingHttpResponse(lines(), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
+
+
+def stream_xlsx(queryset, filename):
+    """
+    openpyxl write-only workbook spooled to a temporary file, then streamed.
+    XLSX is a zip, so it cannot be sent before the last row is written.
+    """
+    output = tempfile.TemporaryFile()
+    write_xlsx(queryset, output)
+    output.seek(0)
+    return FileResponse(
+        output, as_attachment=True, filename=f'{filename}.xlsx',
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    )
+
+
+def stream_export(queryset, filename='alk_kpi_result', file_format='xlsx'):
+    if file_format == 'csv':
+        return stream_csv(queryset, filename)
+    return stream_xlsx(queryset, filename)
@@ -0,0 +1,108 @@
+"""
+Cached choice lists for the alk_kpi_result admin filters.
+
+The year / department / KPI filters of the changelist used to run DISTINCT
+and multi-join queries over the result table on every hit. Their choices
+are now computed once per team scope (superuser, dept group, dept or single
+employee) and kept in the cache framework. Creating, deleting or re-keying a
+result, or changing a KPI, employee or department, bumps a cache version,
+which drops every cached choice list at once. Unless that cache is shared by
+every server process (shared_cache), the lists are only kept for the request.
+"""
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .employee_context import get_employee_context
+from .models import alk_dept, alk_employee, alk_kpi, alk_kpi_result
+from .shared_cache import cache_is_shared
+
+CACHE_TIMEOUT = 3600
+VERSION_KEY = 'kpi_app:filter_choices:version'
+
+
+def _scope(request):
+    """(cache key part, result queryset in scope) of the requester, or (None, None)."""
+    if request.user.is_superuser:
+        return 'all', alk_kpi_result.objects.all()
+    context = get_employee_context(request)
+    if context is None:
+        return None, None
+    return context.scope_key, alk_kpi_result.objects.filter(employee_id__in=context.team_scope_ids)
+
+
+def _cached(request, name, build):
+    scope_key, results = _scope(request)
+    if scope_key is None:
+        return []
+    if not cache_is_shared():
+        if not hasattr(request, '_filter_choices'):
+            request._filter_choices = {}
+        memo = request._filter_choices
+        if name not in memo:
+            memo[name] = build(scope_key, results)
+        return memo[name]
+    key = f'kpi_app:filter_choices:{cache.get_or_set(VERSION_KEY, 1, None)}:{name}:{scope_key}'
+    choices = cache.get(key)
+    if choices is None:
+        choices = build(scope_key, results)
+        cache.set(key, choices, CACHE_TIMEOUT)
+    return choices
+
+
+def year_choices(request):
+    """[(year, year)] of the results in scope, oldest first."""
+    def build(scope_key, results):
+        years = results.order_by('year').values_list('year', flat=True).distinct()
+        return [(year, str(year)) for year in years]
+    return _cached(request, 'year', build)
+
+
+def dept_choices(request):
+    """Every department for a superuser, otherwise the departments of the team in scope."""
+    def build(scope_key, results):
+        depts = alk_dept.objects.all()
+        if scope_key != 'all':
+            depts = depts.filter(alk_employee__id__in=results.values('employee_id')).distinct()
+        return list(depts.values_list('dept_id', 'dept_name'))
+    return _cached(request, 'dept', build)
+
+
+def kpi_choices(request):
+    """Every KPI for a superuser, otherwise the KPIs that have results for the team in scope."""
+    def build(scope_key, results):
+        kpis = alk_kpi.objects.all()
+        if scope_key != 'all':
+            kpis = kpis.filter(id__in=results.values('kpi_id'))
+        return list(kpis.values_list('id', 'kpi_name'))
+    return _cached(request, 'kpi', build)
+
+
+CHOICES = {'year': year_choices, 'dept': dept_choices, 'kpi': kpi_choices}
+
+
+def get_choices(name, request):
+    """Choice list `name` ('year', 'dept' or 'kpi') of the requester's scope."""
+    return CHOICES[name](request)
+
+
+def invalidate_filter_choices():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 2, None)
+
+
+@receiver([post_save, post_delete], sender=alk_kpi)
+@receiver([post_save, post_delete], sender=alk_employee)
+@receiver([post_save, post_delete], sender=alk_dept)
+def invalidate_on_change(**kwargs):
+    invalidate_filter_choices()
+
+
+@receiver(post_delete, sender=alk_kpi_result)
+@receiver(post_save, sender=alk_kpi_result)
+def invalidate_on_result_change(instance, **kwargs):
+    # Chỉ nhập số liệu (không đổi năm / nhân viên / KPI) thì danh sách lựa chọn không đổi
+    if kwargs['signal'] is post_delete or instance.lookup_keys_changed():
+        invalidate_filter_choices()
@@ -0,0 +1,166 @@
+"""
+Display formats of alk_kpi_result values, shared by the admin, the portal and
+the exports.
+
+How target_set / target_input / achievement are shown only depends on the
+KPI flags (percent_display, percentage_cal) and on the class of target_set
+(missing, zero, below 1, 1 or more). The pair of formatters for each of those
+few combinations is chosen once (format_plan) and applied to model
+instances, values() rows or a whole DataFrame.
+"""
+from functools import lru_cache
+
+# Cột hiển thị (giống các cột *_1f của AlkKpiResultAdmin)
+DISPLAY_FIELDS = (
+    'weigth', 'min', 'target_set', 'max', 'target_input', 'achievement', 'final_result', 'factor',
+)
+# Các field cần có trong values() / DataFrame để định dạng
+VALUE_FIELDS = (
+    'weigth', 'min', 'target_set', 'max', 'target_input', 'achievement', 'final_result',
+    'kpi__percent_display', 'kpi__percentage_cal',
+)
+
+
+def percent_3f(value):
+    return f"{value * 100:,.3f}%"
+
+
+def number_4f(value):
+    return f"{value:,.4f}"
+
+
+def percent_1f(value):
+    return f"{value * 100:.1f}%"
+
+
+def number_1f(value):
+    return f"{value:.1f}"
+
+
+def target_set_class(target_set):
+    if _blank(target_set):
+        return None
+    if target_set == 0:
+        return 'zero'
+    return 'fraction' if target_set < 1 else 'number'
+
+
+@lru_cache(maxsize=None)
+def format_plan(percent_display, percentage_cal, ts_class):
+    """
+    (target_set formatter, target_input / achievement formatter).
+
+    percentage_cal is None when the result has no KPI. target_set == 0 is never
+    shown as a percentage; percent_display always is; otherwise target_set is
+    a percentage for percentage_cal KPIs or below 1, target_input /
+    achievement only when percentage_cal is False and target_set is below 1.
+    """
+    if ts_class == 'zero':
+        return number_4f, number_4f
+    if percent_display:
+        return percent_3f, percent_3f
+    fraction = ts_class == 'fraction'
+    target_set = percent_3f if percentage_cal is not None and (percentage_cal or fraction) else number_4f
+    value = percent_3f if percentage_cal is False and fraction else number_4f
+    return target_set, value
+
+
+def _blank(value):
+    return value is None or value != value  # None / NaN
+
+
+def _plan(percent_display, percentage_cal, target_set):
+    return format_plan(
+        bool(percent_display) if not _blank(percent_display) else False,
+        None if _blank(percentage_cal) else bool(percentage_cal),
+        target_set_class(target_set),
+    )
+
+
+def format_values(weigth, min, target_set, max, target_input, achievement, final_result,
+                  percent_display=None, percentage_cal=None):
+    """Display strings ('' when missing) keyed by DISPLAY_FIELDS."""
+    ts_format, value_format = _plan(percent_display, percentage_cal, target_set)
+    return {
+        'weigth': '' if _blank(weigth) else percent_1f(weigth),
+        'min': '' if _blank(min) else number_1f(min),
+        'target_set': '' if _blank(target_set) else ts_format(target_set),
+        'max': '' if _blank(max) else number_1f(max),
+        'target_input': '' if _blank(target_input) else value_format(target_input),
+        'achievement': '' if _blank(achievement) else value_format(achievement),
+        'final_result': '' if _blank(final_result) else percent_1f(final_result),
+        'factor': '' if _blank(final_result) or _blank(weigth) or not weigth else percent_1f(final_result / weigth),
+    }
+
+
+def format_row(row):
+    """Display strings of one values() row with VALUE_FIELDS."""
+    return format_values(*(row[name] for name in VALUE_FIELDS))
+
+
+def format_result(result, refresh=False):
+    """Display strings of an alk_kpi_result, computed once and kept on the instance."""
+    formats = None if refresh else getattr(result, '_display_formats', None)
+    if formats is None:
+        kpi = result.kpi if result.kpi_id is not None else None
+        formats = result._display_formats = format_values(
+            result.weigth, result.min, result.target_set, result.max, result.target_input,
+            result.achievement, result.final_result,
+            kpi.percent_display if kpi else None, kpi.percentage_cal if kpi else None,
+        )
+    return formats
+
+
+def attach_formats(results):
+    """
+    Set the portal template attributes (display_*, form_value_*) on every
+    result of a list / queryset. Returns the results.
+    """
+    for result in results:
+        formats = format_result(result, refresh=True)
+        result.display_weight = formats['weigth']
+        result.display_target_set = formats['target_set']
+        result.display_target_input = formats['target_input']
+        result.display_achievement = formats['achievement']
+        result.display_final_result = formats['final_result']
+        # Giá trị cho ô nhập: số gốc có dấu phẩy ngăn cách
+        result.form_value_target_input = '' if result.target_input is None else number_4f(result.target_input)
+        result.form_value_achievement = '' if result.achievement is None else number_4f(result.achievement)
+    return results
+
+
+def format_frame(frame):
+    """
+    DataFrame of display strings (DISPLAY_FIELDS columns) for a frame with
+    VALUE_FIELDS columns. Rows are grouped by format plan and each column of
+    a group is formatted in one pass.
+    """
+    import pandas as pd  # chỉ các bản xuất dùng DataFrame mới cần pandas
+
+    out = pd.DataFrame('', index=frame.index, columns=list(DISPLAY_FIELDS), dtype=object)
+    if frame.empty:
+        return out
+
+    def fill(column, values, formatter):
+        present = values.notna()
+        out.loc[values.index[present], column] = values[present].map(formatter)
+
+    fill('weigth', frame['weigth'], percent_1f)
+    fill('min', frame['min'], number_1f)
+    fill('max', frame['max'], number_1f)
+    fill('final_result', frame['final_result'], percent_1f)
+    has_weight = frame['final_result'].notna() & frame['weigth'].notna() & (frame['weigth'] != 0)
+    factor = frame['final_result'][has_weight] / frame['weigth'][has_weight]
+    fill('factor', factor, percent_1f)
+
+    by_plan = {}
+    for index, percent_display, percentage_cal, target_set in zip(
+        frame.index, frame['kpi__percent_display'], frame['kpi__percentage_cal'], frame['target_set'],
+    ):
+        by_plan.setdefault(_plan(percent_display, percentage_cal, target_set), []).append(index)
+    for (ts_format, value_format), index in by_plan.items():
+        rows = frame.loc[index]
+        fill('target_set', rows['target_set'], ts_format)
+        fill('target_input', rows['target_input'], value_format)
+        fill('achievement', rows['achievement'], value_format)
+    return out
@@ -0,0 +1,12 @@
+from django import forms
+
+
+class KpiResultBulkImportForm(forms.Form):
+    """Upload form of the background bulk import (AlkKpiResultAdmin)."""
+    import_file = forms.FileField(help_text="Semester template (.xlsx or .csv), same columns as the Import button.")
+
+    def clean_import_file(self):
+        import_file = self.cleaned_data['import_file']
+        if not import_file.name.lower().endswith(('.xlsx', '.csv')):
+            raise forms.ValidationError("Only .xlsx and .csv files are supported.")
+        return import_file
@@ -0,0 +1,269 @@
+"""
+DB-backed background jobs (no external broker).
+
+Views enqueue an alk_job row and return immediately; `manage.py run_jobs`
+(a Windows scheduled task / service next to IIS) claims queued jobs and
+runs the handler registered for their job_type, reporting progress on the
+row. Each job type has a concurrency limit, overridable with the
+KPI_JOB_CONCURRENCY setting.
+"""
+import os
+import socket
+import tempfile
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import F, Min
+from django.utils import timezone
+
+from .models import alk_employee, alk_job, alk_kpi_result
+
+JOB_HANDLERS = {}
+
+DEFAULT_CONCURRENCY = {
+    'import_kpi_results': 1,
+    'export_kpi_results': 2,
+    'export_kpi_report': 2,
+    'export_manager_ranking': 2,
+    'rescore_kpi_results': 1,
+}
+
+# Job "running" mà không cập nhật tiến độ quá lâu -> coi như worker đã chết
+STALE_AFTER = timedelta(minutes=30)
+
+
+def job_handler(job_type):
+    """Register `func(job, progress)` as the handler of `job_type`."""
+    def register(func):
+        JOB_HANDLERS[job_type] = func
+        return func
+    return register
+
+
+def concurrency_limits():
+    limits = dict(DEFAULT_CONCURRENCY)
+    limits.update(getattr(settings, 'KPI_JOB_CONCURRENCY', {}))
+    return limits
+
+
+def enqueue(job_type, user=None, params=None, input_file=None):
+    if job_type not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job type: {job_type}")
+    job = alk_job(job_type=job_type, created_by=user, params=params or {})
+    if input_file is not None:
+        job.input_file.save(os.path.basename(input_file.name), input_file, save=False)
+    job.save()
+    return job
+
+
+def fail_stale_jobs():
+    return alk_job.objects.filter(
+        status=alk_job.STATUS_RUNNING, updated_at__lt=timezone.now() - STALE_AFTER,
+    ).update(status=alk_job.STATUS_FAILED, message="Worker stopped responding.", finished_at=timezone.now())
+
+
+def claim_next_job(worker=None):
+    """
+    Mark the oldest queued job whose type is under its concurrency limit as running.
+
+    Safe with several workers: the limit check and the claim of one job type
+    run in a transaction that first locks that type's queued / running rows,
+    so workers claiming the same type take turns, and the claim is a
+    conditional UPDATE that skips a job another worker already took.
+    """
+    limits = concurrency_limits()
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    job_types = list(
+        alk_job.objects.filter(status=alk_job.STATUS_QUEUED, job_type__in=list(JOB_HANDLERS))
+        .values('job_type').annotate(oldest=Min('created_at')).order_by('oldest')
+        .values_list('job_type', flat=True)
+    )
+    for job_type in job_types:
+        job = _claim_job_of_type(job_type, limits.get(job_type, 1), worker)
+        if job is not None:
+            return job
+    return None
+
+
+def _claim_job_of_type(job_type, limit, worker):
+    lost = set()
+    with transaction.atomic():
+        # UPDATE không đổi dữ liệu, chỉ để giữ khoá các dòng queued / running của loại này đến khi commit
+        # (SQLite: khoá ghi cả DB; select_for_update không có tác dụng trên SQLite)
+        alk_job.objects.filter(
+            job_type=job_type, status__in=[alk_job.STATUS_QUEUED, alk_job.STATUS_RUNNING],
+        ).update(job_type=F('job_type'))
+        while alk_job.objects.filter(job_type=job_type, status=alk_job.STATUS_RUNNING).count() < limit:
+            job = (
+                alk_job.objects.filter(job_type=job_type, status=alk_job.STATUS_QUEUED)
+                .exclude(pk__in=lost).order_by('created_at', 'id').first()
+            )
+            if job is None:
+                return None
+            if _claim(job, worker):
+                return job
+            # Worker khác đã nhận job này trước
+            lost.add(job.pk)
+    return None
+
+
+def _claim(job, worker):
+    """queued -> running only if the job is still queued; False if another worker took it first."""
+    now = timezone.now()
+    claimed = alk_job.objects.filter(pk=job.pk, status=alk_job.STATUS_QUEUED).update(
+        status=alk_job.STATUS_RUNNING, worker=worker, started_at=now, updated_at=now,
+    )
+    if claimed:
+        job.status, job.worker, job.started_at, job.updated_at = alk_job.STATUS_RUNNING, worker, now, now
+    return bool(claimed)
+
+
+def run_job(job):
+    def progress(processed, total=None):
+        changes = {'processed': processed, 'updated_at': timezone.now()}
+        if total is not None:
+            changes['total'] = total
+        alk_job.objects.filter(pk=job.pk).update(**changes)
+
+    try:
+        message = JOB_HANDLERS[job.job_type](job, progress) or ''
+    except Exception as e:
+        job.refresh_from_db()
+        job.status = alk_job.STATUS_FAILED
+        job.message = f"{e}\n\n{traceback.format_exc()}"
+    else:
+        job.refresh_from_db()
+        job.status = alk_job.STATUS_DONE
+        job.message = message
+    job.finished_at = timezone.now()
+    job.save()
+    return job
+
+
+def release_job(job, message):
+    """Fail a job its worker could not finish (e.g. a database error), if it is still running."""
+    return alk_job.objects.filter(pk=job.pk, status=alk_job.STATUS_RUNNING).update(
+        status=alk_job.STATUS_FAILED, message=message, finished_at=timezone.now(),
+    )
+
+
+def _scoped_results(job):
+    """alk_kpi_result rows the job creator may see (same scope as the portal, or the admin changelist's)."""
+    from .employee_context import build_employee_context
+    from .periods import period_lookup
+
+    user = job.created_by
+    if 'changelist' in job.params:
+        return _changelist_results(job) if user is not None else alk_kpi_result.objects.none()
+    results = alk_kpi_result.objects.all()
+    if user is None or not user.is_superuser:
+        context = build_employee_context(user) if user else None
+        if context is None:
+            return results.none()
+        results = results.filter(employee__id__in=context.team_scope_ids)
+    params = job.params
+    if params.get('year') or params.get('semester') or params.get('month'):
+        results = results.filter(**period_lookup(params.get('year'), params.get('semester'), params.get('month')))
+    return results
+
+
+def _changelist_results(job):
+    """Rows of the alk_kpi_result admin changelist, with the filters and search of the admin export link."""
+    from django.contrib import admin
+    from django.http import HttpRequest, QueryDict
+
+    request = HttpRequest()
+    request.method = 'GET'
+    request.GET = QueryDict(job.params['changelist'])
+    request.user = job.created_by
+    return admin.site._registry[alk_kpi_result].get_export_queryset(request)
+
+
+def _save_result_file(job, filename, write):
+    """Run `write(output)` into a temporary file and attach it to the job; returns what write returned."""
+    with tempfile.TemporaryFile() as output:
+        value = write(output)
+        output.seek(0)
+        job.result_file.save(filename, File(output), save=False)
+    alk_job.objects.filter(pk=job.pk).update(result_file=job.result_file.name)
+    return value
+
+
+@job_handler('export_kpi_results')
+def export_kpi_results(job, progress):
+    from .exports import write_csv, write_xlsx
+
+    file_format = 'csv' if job.params.get('format') == 'csv' else 'xlsx'
+    writer = write_csv if file_format == 'csv' else write_xlsx
+    rows = _save_result_file(
+        job, f'alk_kpi_result_{job.pk}.{file_format}',
+        lambda output: writer(_scoped_results(job), output, progress=progress),
+    )
+    return f"Exported {rows} row(s)."
+
+
+@job_handler('export_kpi_report')
+def export_kpi_report(job, progress):
+    """Subtotals per employee and period of the home page report (same filters and scope)."""
+    from .exports import write_report_xlsx
+
+    params = job.params
+    results = alk_kpi_result.objects.all()
+    user = job.created_by
+    if user is None or not user.is_superuser:
+        # Giống trang home: người không phải superuser chỉ thấy phòng của mình
+        employee = alk_employee.objects.filter(user_id=user).first() if user else None
+        results = results.filter(employee__dept=employee.dept) if employee else results.none()
+    for field in ('year', 'semester', 'month'):
+        if params.get(field):
+            results = results.filter(**{field: params[field]})
+    if params.get('user_id'):
+        results = results.filter(employee__user_id__username__icontains=params['user_id'])
+    if params.get('name'):
+        results = results.filter(employee__name__icontains=params['name'])
+    rows = _save_result_file(
+        job, f'alk_kpi_result_report_{job.pk}.xlsx', lambda output: write_report_xlsx(results, output),
+    )
+    return f"Exported {rows} row(s)."
+
+
+@job_handler('export_manager_ranking')
+def export_manager_ranking(job, progress):
+    """Ranking of the manager reports screen for the job creator (scope checked when queued)."""
+    from .exports import write_ranking_xlsx
+    from .ranking import employee_ranking
+
+    params = job.params
+    employee = alk_employee.objects.get(user_id=job.created_by)
+    ranking = employee_ranking(employee, params['scope'], params['year'], params['semester'], params['month'])
+    rows = _save_result_file(
+        job, f"KPI_Ranking_{params['year']}_{params['month']}_{job.pk}.xlsx",
+        lambda output: write_ranking_xlsx(ranking, output, f"Ranking {params['month']} {params['year']}"),
+    )
+    return f"Exported {rows} row(s)."
+
+
+@job_handler('import_kpi_results')
+def import_kpi_results(job, progress):
+    from .bulk_import import import_kpi_results as bulk_import, read_rows
+
+    counts = bulk_import(
+        read_rows(job.input_file.path), batch_size=job.params.get('batch_size', 2000), progress=progress,
+    )
+    return f"{counts['created']} created, {counts['updated']} updated."
+
+
+@job_handler('rescore_kpi_results')
+def rescore_kpi_results(job, progress):
+    from .scoring import rescore_queryset
+
+    results = alk_kpi_result.objects.filter(year=job.params['year'])
+    if job.params.get('semester'):
+        results = results.filter(semester=job.params['semester'])
+    if job.params.get('month'):
+        results = results.filter(month=job.params['month'])
+    updated = rescore_queryset(results, progress=progress)
+    return f"Re-scored {updated} KPI result(s)."
@@ -0,0 +1,246 @@
+"""
+Month-end load simulation: many employees saving KPI cells while their
+managers approve, replayed in-process through Django's test Client from a
+thread or process pool (simulate_month_end).
+
+- An employee session logs in, opens input_form for the period and saves
+  its cells one by one through portal_save_kpi, as the HTMX grid does.
+- A manager session logs in, opens the review page of every team member and
+  approves their rows with manager_toggle_approval.
+
+Every request is timed. Errors that mention a database lock ('database is
+locked' on SQLite, lock wait timeout / deadlock on MySQL) are counted
+separately from other errors, and a save refused because the row was
+approved in the meantime is an expected outcome, not an error.
+
+Afterwards the rows are read back and compared with what the server
+acknowledged with a 200: an achievement that differs from the last saved
+value, or an approved row that is no longer locked, is a lost update.
+"""
+import multiprocessing
+import random
+import re
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connections, transaction
+from django.test import Client
+from django.urls import reverse
+
+from .models import alk_employee, alk_kpi_result, alk_kpi_summary
+from .request_timing import percentile
+
+LOCK_ERROR = re.compile(r'database (table )?is locked|lock wait timeout|deadlock', re.IGNORECASE)
+# Thứ tự các hành động trong báo cáo
+ACTIONS = ('login', 'open_input', 'save', 'open_review', 'approve')
+RESTORED_FIELDS = ['achievement', 'target_input', 'final_result', 'is_locked']
+
+
+def plan_sessions(year, semester, month, employees=50, cells=5, username_prefix='', seed=0):
+    """
+    Employee sessions (cells to save, with new values) and one manager session
+    per department of those employees. Only active, unlocked, non-SAP rows are saved.
+    """
+    rng = random.Random(seed)
+    editable = (
+        alk_kpi_result.objects.filter(
+            year=year, semester=semester, month=month, active=True, is_locked=False, kpi__from_sap=False,
+            employee__level__gte=2, employee__user_id__username__startswith=username_prefix,
+        )
+        .order_by('employee_id', 'id').values_list('employee_id', 'id')
+    )
+    cells_by_employee = defaultdict(list)
+    for employee_id, result_id in editable.iterator():
+        cells_by_employee[employee_id].append(result_id)
+    staff = list(
+        alk_employee.objects.filter(id__in=sorted(cells_by_employee)[:employees])
+        .select_related('user_id').order_by('id')
+    )
+
+    # Quản lý trực tiếp của phòng: level 1, hoặc level 0 nếu phòng không có level 1
+    managers = {
+        e.dept_id: e for e in alk_employee.objects.filter(
+            level__lte=1, dept__in={e.dept_id for e in staff}, user_id__isnull=False,
+        ).select_related('user_id').order_by('level', '-id')
+    }
+    teams = defaultdict(list)
+    approvals = defaultdict(list)
+    for result_id, employee_id in alk_kpi_result.objects.filter(
+        year=year, semester=semester, month=month, active=True, employee__in=staff,
+    ).order_by('id').values_list('id', 'employee_id'):
+        approvals[employee_id].append(result_id)
+
+    sessions = []
+    for employee in staff:
+        saves = [
+            (result_id, f'{rng.uniform(1, 100000):.2f}')
+            for result_id in rng.sample(cells_by_employee[employee.id], min(cells, len(cells_by_employee[employee.id])))
+        ]
+        sessions.append({'kind': 'employee', 'username': employee.user_id.username, 'saves': saves})
+        if employee.dept_id in managers:
+            teams[employee.dept_id].append((employee.id, approvals[employee.id]))
+    manager_sessions = [
+        {'kind': 'manager', 'username': managers[dept_id].user_id.username, 'team': team}
+        for dept_id, team in teams.items()
+    ]
+    # Rải các phiên quản lý vào giữa các phiên nhân viên để duyệt chạy song song với lưu
+    for session in manager_sessions:
+        sessions.insert(rng.randint(0, len(sessions)), session)
+    return sessions
+
+
+def snapshot(sessions):
+    """Current values of every row the sessions touch (to restore them afterwards)."""
+    ids = set()
+    for session in sessions:
+        ids.update(result_id for result_id, _ in session.get('saves', ()))
+        for _, result_ids in session.get('team', ()):
+            ids.update(result_ids)
+    return list(alk_kpi_result.objects.filter(id__in=ids))
+
+
+def restore(rows):
+    with transaction.atomic():
+        alk_kpi_result.objects.bulk_update(rows, RESTORED_FIELDS, batch_size=1000)
+        alk_kpi_summary.refresh_keys({row.period_key() for row in rows})
+
+
+def run_session(session, period, password=None, host='localhost', think_ms=0):
+    """
+    Replay one session. Returns its timed requests as (action, ms, status, outcome,
+    error) and the values the server acknowledged: {'saved': {id: value}, 'approved': [ids]}.
+    """
+    client = Client(HTTP_HOST=host, raise_request_exception=False)
+    requests = []
+    saved = {}
+    approved = []
+
+    def call(action, method, url, data=None, **headers):
+        start = time.perf_counter()
+        response = getattr(client, method)(url, data, **headers)
+        ms = (time.perf_counter() - start) * 1000
+        outcome, error = _classify(action, response)
+        requests.append((action, ms, response.status_code, outcome, error))
+        return outcome == 'ok'
+
+    try:
+        if password:
+            logged_in = call('login', 'post', reverse('login'),
+                             {'username': session['username'], 'password': password})
+        else:
+            start = time.perf_counter()
+            client.force_login(User.objects.get(username=session['username']))
+            requests.append(('login', (time.perf_counter() - start) * 1000, 200, 'ok', ''))
+            logged_in = True
+
+        if logged_in and session['kind'] == 'employee':
+            call('open_input', 'get', reverse('portal_input'), period)
+            for result_id, value in session['saves']:
+                if think_ms:
+                    time.sleep(think_ms / 1000)
+                if call('save', 'post', reverse('portal_save_kpi', args=[result_id]),
+                        {'achievement': value}, HTTP_HX_REQUEST='true'):
+                    saved[result_id] = value
+        elif logged_in:
+            for employee_id, result_ids in session['team']:
+                call('open_review', 'get', reverse('manager_review_employee', args=[employee_id]), period)
+                if think_ms:
+                    time.sleep(think_ms / 1000)
+                if call('approve', 'post', reverse('manager_toggle_approval', args=[employee_id]),
+                        {**period, 'selected_kpi': result_ids, 'action': 'approve'}, HTTP_HX_REQUEST='true'):
+                    approved.extend(result_ids)
+    finally:
+        # Mỗi luồng / tiến trình có kết nối DB riêng
+        connections.close_all()
+    return {'requests': requests, 'saved': saved, 'approved': approved}
+
+
+def _classify(action, response):
+    """('ok' | 'locked' | 'lock_error' | 'error', error text) of one response."""
+    if response.exc_info:
+        error = f'{response.exc_info[0].__name__}: {response.exc_info[1]}'
+    elif action == 'login':
+        # Đăng nhập thành công thì chuyển hướng; sai mật khẩu thì hiện lại form (200)
+        return ('ok', '') if response.status_code == 302 else ('error', 'login failed')
+    elif response.status_code == 200:
+        body = response.content.decode(errors='replace')
+        # manager_toggle_approval báo lỗi trong badge với status 200
+        if action == 'approve' and 'bg-danger' in body:
+            error = re.sub(r'<[^>]+>', '', body).strip()
+        else:
+            return 'ok', ''
+    elif action == 'save' and response.status_code == 403 and b'Locked' in response.content:
+        return 'locked', ''
+    else:
+        error = f'HTTP {response.status_code}: {response.content[:200].decode(errors="replace")}'
+    return ('lock_error' if LOCK_ERROR.search(error) else 'error'), error
+
+
+def simulate(sessions, period, workers=20, processes=False, password=None, host='localhost', think_ms=0):
+    """Run every session on a thread (or process) pool. Returns (session results, elapsed seconds)."""
+    if processes:
+        # Tiến trình con (fork) không được dùng chung kết nối DB của tiến trình cha
+        connections.close_all()
+        pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'))
+    else:
+        pool = ThreadPoolExecutor(workers)
+    start = time.perf_counter()
+    with pool:
+        futures = [
+            pool.submit(run_session, session, period, password, host, think_ms) for session in sessions
+        ]
+        results = [future.result() for future in futures]
+    return results, time.perf_counter() - start
+
+
+def verify(results):
+    """Acknowledged writes that are not in the database any more: (lost saves, lost approvals)."""
+    saved = {}
+    approved = set()
+    for result in results:
+        saved.update(result['saved'])
+        approved.update(result['approved'])
+    rows = alk_kpi_result.objects.in_bulk(set(saved) | approved)
+    lost_saves = sorted(
+        result_id for result_id, value in saved.items()
+        if result_id in rows and rows[result_id].achievement != Decimal(value)
+    )
+    lost_approvals = sorted(result_id for result_id in approved if result_id in rows and not rows[result_id].is_locked)
+    return lost_saves, lost_approvals
+
+
+def report(results, elapsed):
+    """Throughput, latency percentiles per action, outcome counts and lost updates."""
+    requests = [request for result in results for request in result['requests']]
+    by_action = defaultdict(list)
+    for action, ms, status, outcome, error in requests:
+        by_action[action].append((ms, outcome))
+    lost_saves, lost_approvals = verify(results)
+    outcomes = Counter(outcome for _, _, _, outcome, _ in requests)
+    return {
+        'sessions': len(results),
+        'requests': len(requests),
+        'elapsed_s': round(elapsed, 2),
+        'throughput_rps': round(len(requests) / elapsed, 1) if elapsed else 0.0,
+        'actions': {
+            action: {
+                'count': len(by_action[action]),
+                'p50_ms': round(percentile([ms for ms, _ in by_action[action]], 50), 1),
+                'p95_ms': round(percentile([ms for ms, _ in by_action[action]], 95), 1),
+                'p99_ms': round(percentile([ms for ms, _ in by_action[action]], 99), 1),
+                'max_ms': round(max(ms for ms, _ in by_action[action]), 1),
+                'errors': sum(outcome in ('error', 'lock_error') for _, outcome in by_action[action]),
+            }
+            for action in ACTIONS if by_action[action]
+        },
+        'statuses': dict(Counter(str(status) for _, _, status, _, _ in requests)),
+        'locked_rejections': outcomes['locked'],
+        'lock_errors': outcomes['lock_error'],
+        'other_errors': outcomes['error'],
+        'error_samples': sorted({error for *_, error in requests if error})[:10],
+        'lost_saves': lost_saves,
+        'lost_approvals': lost_approvals,
+    }
@@ -0,0 +1,129 @@
+import statistics
+import time
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncRequestFactory, RequestFactory
+from django.urls import reverse
+
+from kpi_app.models import alk_employee
+from kpi_app.request_timing import percentile
+from kpi_app.views import portal_views
+
+VIEWS = (
+    ('dashboard', portal_views.dashboard, portal_views.dashboard_async, 'portal_dashboard'),
+    ('manager_dashboard', portal_views.manager_dashboard, portal_views.manager_dashboard_async, 'manager_dashboard'),
+)
+
+
+class RoundTripDelay:
+    """Sleeps before every query, like the network round trip to a remote database host."""
+
+    def __init__(self, delay_ms):
+        self.delay = delay_ms / 1000
+        self.active = False
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.active:
+            time.sleep(self.delay)
+        return execute(sql, params, many, context)
+
+    def install(self, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def __enter__(self):
+        # Kết nối của luồng hiện tại, và mọi kết nối mới mở trong các worker thread
+        for connection in connections.all():
+            self.install(connection)
+        connection_created.connect(self.install)
+        self.active = True
+        return self
+
+    def __exit__(self, *exc_info):
+        self.active = False
+        connection_created.disconnect(self.install)
+        for connection in connections.all():
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare p50/p95 latency of the sync and async (ASGI) employee and manager dashboards, "
+        "with a simulated round-trip delay before every database query."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help="Manager (level 0/1) to render the dashboards for.")
+        parser.add_argument('--requests', type=int, default=20, help="Requests per view and mode.")
+        parser.add_argument('--delay-ms', type=float, default=5.0, help="Simulated DB round trip per query.")
+        parser.add_argument('--year', default='2025')
+        parser.add_argument('--semester', default='2nd SEM')
+        parser.add_argument('--month', default='1st')
+
+    def handle(self, *args, **options):
+        employee = self.get_employee(options['username'])
+        user = employee.user_id
+        params = {'year': options['year'], 'semester': options['semester'], 'month': options['month']}
+        count = max(options['requests'], 1)
+        self.stdout.write(
+            f"{employee.name} ({user.username}), {count} requests per view, "
+            f"{options['delay_ms']:g} ms per query"
+        )
+
+        with RoundTripDelay(options['delay_ms']):
+            for name, sync_view, async_view, url_name in VIEWS:
+                path = reverse(url_name)
+                sync_ms = self.time_sync(sync_view, path, params, user, count)
+                async_ms = async_to_sync(self.time_async)(async_view, path, params, user, count)
+                self.stdout.write(
+                    f"{name}: sync p50 {percentile(sync_ms, 50):.1f} ms / p95 {percentile(sync_ms, 95):.1f} ms, "
+                    f"async p50 {percentile(async_ms, 50):.1f} ms / p95 {percentile(async_ms, 95):.1f} ms "
+                    f"({statistics.median(sync_ms) / statistics.median(async_ms):.2f}x)"
+                )
+
+    def get_employee(self, username):
+        employees = alk_employee.objects.select_related('user_id').filter(level__lte=1, user_id__isnull=False)
+        if username:
+            employees = employees.filter(user_id__username=username)
+        employee = employees.order_by('level', 'id').first()
+        if employee is None:
+            raise CommandError(f"No level 0/1 employee {username or ''}".rstrip() + ".")
+        return employee
+
+    def time_sync(self, view, path, params, user, count):
+        factory = RequestFactory()
+        timings = []
+        for _ in range(count + 1):
+            request = factory.get(path, params)
+            request.user = user
+            start = time.perf_counter()
+            response = view(request)
+            timings.append((time.perf_counter() - start) * 1000)
+            self.check_response(path, response)
+        # Request đầu tiên chỉ để làm nóng cache (employee context, danh mục kỳ)
+        return timings[1:]
+
+    async def time_async(self, view, path, params, user, count):
+        factory = AsyncRequestFactory()
+
+        async def auser():
+            return user
+
+        timings = []
+        for _ in range(count + 1):
+            request = factory.get(path, params)
+            request.user = user
+            request.auser = auser
+            start = time.perf_counter()
+            response = await view(request)
+            timings.append((time.perf_counter() - start) * 1000)
+            self.check_response(path, response)
+        return timings[1:]
+
+    def check_response(self, path, response):
+        if response.status_code != 200:
+            raise CommandError(f"{path} returned {response.status_code}.")
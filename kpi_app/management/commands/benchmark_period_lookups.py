@@ -0,0 +1,115 @@
+import random
+import sqlite3
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from kpi_app.periods import period_code
+
+SEMESTERS = ('1st SEM', '2nd SEM')
+MONTHS = ('1st', '2nd', '3rd', '4th', '5th', 'final')
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark __icontains period filters (LIKE '%..%') against period_code lookups "
+        "on a scratch in-memory SQLite table shaped like alk_kpi_result."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--years', type=int, default=10, help="Number of historical years.")
+        parser.add_argument('--employees', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        db = sqlite3.connect(':memory:')
+        self.stdout.write(f"Generating {options['rows']:,} rows...")
+        self.create_table(db, options)
+
+        year = 2025
+        semester, month = '2nd SEM', '1st'
+        code = period_code(year, semester, month)
+        employee_id = options['employees'] // 2
+        years = range(year - options['years'] + 1, year + 1)
+        sem_like, month_like = f'%{semester}%', f'%{month}%'
+
+        cases = [
+            ("ranking (approved, one period)",
+             "SELECT employee_id, SUM(final_result) FROM kpi_result WHERE year = ? AND semester LIKE ? "
+             "AND month LIKE ? AND is_locked = 1 GROUP BY employee_id", (year, sem_like, month_like),
+             "SELECT employee_id, SUM(final_result) FROM kpi_result WHERE period_code = ? "
+             "AND is_locked = 1 GROUP BY employee_id", (code,)),
+            ("employee rows (one period)",
+             "SELECT * FROM kpi_result WHERE employee_id = ? AND year = ? AND semester LIKE ? AND month LIKE ?",
+             (employee_id, year, sem_like, month_like),
+             "SELECT * FROM kpi_result WHERE employee_id = ? AND period_code = ?", (employee_id, code)),
+            ("one semester (all months), all employees",
+             "SELECT COUNT(*) FROM kpi_result WHERE year = ? AND semester LIKE ?",
+             (year, sem_like),
+             "SELECT COUNT(*) FROM kpi_result WHERE period_code BETWEEN ? AND ?",
+             (code - code % 10, code - code % 10 + 9)),
+            ("one semester month, every year",
+             "SELECT COUNT(*) FROM kpi_result WHERE semester LIKE ? AND month LIKE ?",
+             (sem_like, month_like),
+             f"SELECT COUNT(*) FROM kpi_result WHERE period_code IN ({', '.join('?' * len(years))})",
+             tuple(period_code(y, semester, month) for y in years)),
+        ]
+
+        for name, like_sql, like_params, code_sql, code_params in cases:
+            # Hai vế phải chọn cùng các dòng thì so sánh thời gian mới có nghĩa
+            like_rows = self.count_rows(db, like_sql, like_params)
+            code_rows = self.count_rows(db, code_sql, code_params)
+            if like_rows != code_rows:
+                raise CommandError(f"{name}: __icontains returns {like_rows} rows, period_code {code_rows}")
+            like_ms = self.time_query(db, like_sql, like_params, options['repeat'])
+            code_ms = self.time_query(db, code_sql, code_params, options['repeat'])
+            speedup = like_ms / code_ms if code_ms else float('inf')
+            self.stdout.write(
+                f"{name}: __icontains {like_ms:.2f} ms, period_code {code_ms:.2f} ms ({speedup:.1f}x)"
+            )
+
+    def create_table(self, db, options):
+        db.execute(
+            "CREATE TABLE kpi_result (id INTEGER PRIMARY KEY, employee_id INTEGER, kpi_id INTEGER, "
+            "year INTEGER, semester TEXT, month TEXT, period_code INTEGER, is_locked INTEGER, "
+            "final_result REAL)"
+        )
+        rng = random.Random(0)
+        first_year = 2025 - options['years'] + 1
+
+        def rows():
+            for i in range(options['rows']):
+                year = first_year + i % options['years']
+                semester = SEMESTERS[(i // options['years']) % 2]
+                month = MONTHS[(i // (options['years'] * 2)) % 6]
+                yield (
+                    rng.randrange(options['employees']), rng.randrange(200), year, semester, month,
+                    period_code(year, semester, month), rng.random() < 0.7, rng.random(),
+                )
+
+        db.executemany(
+            "INSERT INTO kpi_result (employee_id, kpi_id, year, semester, month, period_code, "
+            "is_locked, final_result) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows()
+        )
+        # Same columns as the alk_kpi_result indexes (the natural key serves the text period columns;
+        # not UNIQUE because the random rows may repeat a key)
+        db.execute("CREATE INDEX natural_key ON kpi_result (employee_id, year, semester, month, kpi_id)")
+        db.execute("CREATE INDEX emp_code_lock ON kpi_result (employee_id, period_code, is_locked)")
+        db.execute("CREATE INDEX code_lock ON kpi_result (period_code, is_locked)")
+        db.execute("ANALYZE")
+
+    def count_rows(self, db, sql, params):
+        """Rows `sql` selects (the count itself for a COUNT(*) query)."""
+        if sql.startswith('SELECT COUNT(*) '):
+            return db.execute(sql, params).fetchone()[0]
+        return db.execute(f"SELECT COUNT(*) FROM ({sql})", params).fetchone()[0]
+
+    def time_query(self, db, sql, params, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            db.execute(sql, params).fetchall()
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,202 @@
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import Resolver404, resolve, reverse
+from django.utils import timezone
+
+from kpi_app import synthetic_data
+from kpi_app.jobs import run_job
+from kpi_app.models import alk_job, alk_kpi_result
+from kpi_app.query_shapes import track_query_shapes
+from kpi_app.request_timing import percentile
+
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+
+
+def view_cases(admin, manager, staff, year, semester):
+    """(name, user, url) of every timed portal, admin and export view (background exports include the job)."""
+    period = f'year={year}&semester={semester}&month=1st'
+    return [
+        ('portal_dashboard', staff, f"{reverse('portal_dashboard')}?year={year}&semester={semester}"),
+        ('portal_input', staff, f"{reverse('portal_input')}?{period}"),
+        ('manager_dashboard', manager, f"{reverse('manager_dashboard')}?{period}"),
+        ('manager_review_employee', manager, f"{reverse('manager_review_employee', args=[staff.id])}?{period}"),
+        ('manager_reports', manager, f"{reverse('manager_reports')}?{period}"),
+        ('admin_result_changelist', admin, reverse('admin:kpi_app_alk_kpi_result_changelist')),
+        ('admin_result_changelist_filtered', admin,
+         f"{reverse('admin:kpi_app_alk_kpi_result_changelist')}?year={year}&semester={semester}"),
+        ('admin_result_search', admin, f"{reverse('admin:kpi_app_alk_kpi_result_changelist')}?q={staff.name}"),
+        ('admin_employee_changelist', admin, reverse('admin:kpi_app_alk_employee_changelist')),
+        ('admin_kpi_changelist', admin, reverse('admin:kpi_app_alk_kpi_changelist')),
+        ('export_report_xlsx', admin, f"{reverse('export_alk_kpi_result')}?{period}"),
+        ('export_stream_csv', admin, f"{reverse('export_alk_kpi_result_stream')}?{period}&format=csv"),
+        ('export_stream_xlsx', admin, f"{reverse('export_alk_kpi_result_stream')}?{period}&format=xlsx"),
+        ('export_manager_reports', manager, f"{reverse('export_manager_reports')}?{period}"),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Time every portal, admin and export view on synthetic data (see generate_kpi_data), "
+        "optionally at several result-table sizes, and write the results as JSON for comparison."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='*',
+                            help="Regenerate the synthetic data at each of these result counts "
+                                 f"(no value: {', '.join(f'{s:,}' for s in DEFAULT_SIZES)}). "
+                                 "Without --sizes the existing synthetic data is used.")
+        parser.add_argument('--repeat', type=int, default=5, help="Timed requests per view (after one warm-up).")
+        parser.add_argument('--views', nargs='*', help="Only views whose name contains one of these strings.")
+        parser.add_argument('--output', help="Write the results to this JSON file.")
+        parser.add_argument('--compare', help="JSON file of an earlier run to compare with.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        sizes = options['sizes']
+        if sizes is not None and not sizes:
+            sizes = DEFAULT_SIZES
+        baseline = self.load(options['compare']) if options['compare'] else None
+
+        runs = []
+        if sizes is None:
+            if not synthetic_data.exists():
+                raise CommandError("No synthetic data: run generate_kpi_data first, or pass --sizes.")
+            runs.append(self.run(options))
+        for size in sizes or ():
+            self.stdout.write(f"Generating {size:,} results...")
+            synthetic_data.clear()
+            synthetic_data.generate(employees=synthetic_data.employees_for(size), seed=options['seed'])
+            runs.append(self.run(options))
+
+        report = {
+            'created': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'commit': self.git_commit(),
+            'runs': runs,
+        }
+        if baseline:
+            self.compare(baseline, report)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def run(self, options):
+        admin, manager, staff = synthetic_data.benchmark_users()
+        if not (admin and manager and staff):
+            raise CommandError("Synthetic data has no level 0 / level 1 / staff employee.")
+        year, semester = synthetic_data.latest_period()
+        results = alk_kpi_result.objects.count()
+        self.stdout.write(f"{results:,} results (latest period {year} {semester})")
+
+        clients = {}
+        views = {}
+        repeat = max(options['repeat'], 1)
+        for name, employee, url in view_cases(admin, manager, staff, year, semester):
+            if options['views'] and not any(part in name for part in options['views']):
+                continue
+            client = clients.get(employee.id)
+            if client is None:
+                client = clients[employee.id] = Client(HTTP_HOST=self.request_host())
+                client.force_login(employee.user_id)
+            timings = []
+            for i in range(repeat + 1):
+                with track_query_shapes() as shapes:
+                    start = time.perf_counter()
+                    response = client.get(url)
+                    if response.status_code == 302 and self.is_job_page(response.url):
+                        # Export chạy nền: tính cả thời gian worker tạo file
+                        size = self.run_job(response.url)
+                        response.status_code = 200
+                    elif response.streaming:
+                        size = sum(len(chunk) for chunk in response.streaming_content)
+                    else:
+                        size = len(response.content)
+                    elapsed = (time.perf_counter() - start) * 1000
+                if response.status_code != 200:
+                    raise CommandError(f"{name}: {url} returned {response.status_code}")
+                # Lần đầu để làm nóng cache (employee context, danh mục kỳ, fragment)
+                if i:
+                    timings.append(elapsed)
+            views[name] = {
+                'url': url,
+                'p50_ms': round(percentile(timings, 50), 2),
+                'p95_ms': round(percentile(timings, 95), 2),
+                'mean_ms': round(statistics.mean(timings), 2),
+                'queries': shapes.total,
+                'bytes': size,
+            }
+            self.stdout.write(
+                f"  {name:34} p50 {views[name]['p50_ms']:9.1f} ms  p95 {views[name]['p95_ms']:9.1f} ms  "
+                f"{shapes.total:3} queries  {size / 1024:9.1f} KB"
+            )
+        return {'results': results, 'views': views}
+
+    def is_job_page(self, url):
+        try:
+            return resolve(urlsplit(url).path).url_name == 'job_detail'
+        except Resolver404:
+            return False
+
+    def run_job(self, job_url):
+        """Run the job queued by an export view; returns the size of its file and deletes it."""
+        job = alk_job.objects.get(pk=resolve(job_url).kwargs['job_id'])
+        run_job(job)
+        if job.status != alk_job.STATUS_DONE:
+            raise CommandError(f"Job {job.job_type} failed: {job.message}")
+        size = job.result_file.size
+        job.result_file.delete(save=False)
+        job.delete()
+        return size
+
+    def compare(self, baseline, report):
+        """p50 of this run against the baseline run with the nearest result count."""
+        for run in report['runs']:
+            before = min(baseline['runs'], key=lambda r: abs(r['results'] - run['results']), default=None)
+            if before is None:
+                continue
+            self.stdout.write(
+                f"Compared with {baseline.get('commit') or 'baseline'} at {before['results']:,} results:"
+            )
+            for name, view in run['views'].items():
+                old = before['views'].get(name)
+                if not old:
+                    continue
+                ratio = view['p50_ms'] / old['p50_ms'] if old['p50_ms'] else float('inf')
+                style = self.style.ERROR if ratio > 1.2 else self.style.SUCCESS if ratio < 0.8 else str
+                self.stdout.write(style(
+                    f"  {name:34} p50 {old['p50_ms']:9.1f} -> {view['p50_ms']:9.1f} ms ({ratio:.2f}x), "
+                    f"queries {old['queries']} -> {view['queries']}"
+                ))
+
+    def load(self, path):
+        if not os.path.exists(path):
+            raise CommandError(f"{path} does not exist.")
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def git_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                cwd=settings.BASE_DIR, timeout=5,
+            ).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            return None
+
+    def request_host(self):
+        hosts = settings.ALLOWED_HOSTS
+        if not hosts or hosts[0] == '*':
+            return 'localhost'
+        return hosts[0].lstrip('.')
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from kpi_app.bulk_import import BulkImportError, import_kpi_results, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk import KPI results from the semester template (.xlsx or .csv, same columns as the "
+        "admin import), upserting on (employee, year, semester, month, kpi)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be positive.")
+        try:
+            counts = import_kpi_results(read_rows(options['path']), batch_size=options['batch_size'])
+        except FileNotFoundError:
+            raise CommandError(f"File not found: {options['path']}")
+        except BulkImportError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported KPI results: {counts['created']} created, {counts['updated']} updated."
+        ))
@@ -0,0 +1,151 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.template import engines
+from django.template.backends.django import DjangoTemplates
+from django.template.loaders.cached import Loader as CachedLoader
+from django.test import Client
+
+from kpi_app.shared_cache import cache_is_shared
+
+CACHED_SESSION_ENGINES = (
+    'django.contrib.sessions.backends.cache',
+    'django.contrib.sessions.backends.cached_db',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Report whether the production runtime optimizations (persistent connections, cache, "
+        "cached sessions, cached template loader) are active, and time connection setup and a warm request."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--url', default='/admin/login/', help="Page requested for the warm request timing.")
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--strict', action='store_true', help="Fail if an optimization is not active.")
+
+    def handle(self, *args, **options):
+        checks = [
+            self.check_debug(),
+            *self.check_database(options['database']),
+            self.check_cache(),
+            self.check_sessions(),
+            self.check_templates(),
+        ]
+        failed = 0
+        for status, name, detail in checks:
+            failed += status == 'FAIL'
+            style = {'OK': self.style.SUCCESS, 'WARN': self.style.WARNING, 'FAIL': self.style.ERROR}[status]
+            self.stdout.write(f"{style(f'[{status}]')} {name}: {detail}")
+
+        repeat = max(options['repeat'], 1)
+        connect_ms, query_ms = self.time_connection(options['database'], repeat)
+        self.stdout.write(
+            f"connection setup: {connect_ms:.2f} ms (new connection), "
+            f"{query_ms:.2f} ms (query on a reused connection)"
+        )
+        cold_ms, warm_ms, status_code = self.time_request(options['url'], repeat)
+        self.stdout.write(
+            f"request {options['url']} ({status_code}): first {cold_ms:.2f} ms, warm {warm_ms:.2f} ms"
+        )
+
+        if failed and options['strict']:
+            raise CommandError(f"{failed} runtime optimization(s) not active.")
+
+    def check_debug(self):
+        if settings.DEBUG:
+            return 'FAIL', "DEBUG", "on (query log kept in memory, debug error pages)"
+        return 'OK', "DEBUG", "off"
+
+    def check_database(self, alias):
+        db = connections[alias].settings_dict
+        max_age = db.get('CONN_MAX_AGE', 0)
+        if max_age is None:
+            yield 'OK', "persistent connections", "CONN_MAX_AGE=None (unlimited)"
+        elif max_age > 0:
+            yield 'OK', "persistent connections", f"CONN_MAX_AGE={max_age}s"
+        else:
+            yield 'FAIL', "persistent connections", "CONN_MAX_AGE=0 (new connection per request)"
+        if max_age != 0:
+            health = db.get('CONN_HEALTH_CHECKS', False)
+            yield ('OK' if health else 'WARN'), "connection health checks", f"CONN_HEALTH_CHECKS={health}"
+
+    def check_cache(self):
+        cache = caches[DEFAULT_CACHE_ALIAS]
+        backend = f"{type(cache).__module__}.{type(cache).__name__}"
+        if isinstance(cache, DummyCache):
+            return 'FAIL', "cache", f"{backend} (nothing is cached)"
+        key = 'kpi_app:check_runtime_profile'
+        cache.set(key, 1, 30)
+        round_trip = cache.get(key) == 1
+        cache.delete(key)
+        if not round_trip:
+            return 'FAIL', "cache", f"{backend} (set/get round trip failed)"
+        if isinstance(cache, LocMemCache):
+            if cache_is_shared():
+                return 'FAIL', "cache", (
+                    f"{backend} with KPI_SHARED_CACHE=True (invalidations do not reach the other workers: "
+                    f"stale manager scopes)"
+                )
+            return 'WARN', "cache", (
+                f"{backend} (per process: employee context, filter choices and periods are cached per request only)"
+            )
+        return 'OK', "cache", backend
+
+    def check_sessions(self):
+        if settings.SESSION_ENGINE in CACHED_SESSION_ENGINES:
+            return 'OK', "sessions", settings.SESSION_ENGINE
+        return 'FAIL', "sessions", f"{settings.SESSION_ENGINE} (one DB query per request)"
+
+    def check_templates(self):
+        uncached = [
+            engine.name for engine in engines.all()
+            if isinstance(engine, DjangoTemplates)
+            and not all(isinstance(loader, CachedLoader) for loader in engine.engine.template_loaders)
+        ]
+        if uncached:
+            return 'FAIL', "template loaders", f"not cached for {', '.join(uncached)}"
+        return 'OK', "template loaders", "cached"
+
+    def time_connection(self, alias, repeat):
+        """Median ms to open a new connection, and to run a query on an open one."""
+        connect, query = [], []
+        for _ in range(repeat):
+            # Kết nối riêng, không đụng tới kết nối đang dùng của lệnh
+            wrapper = connections.create_connection(alias)
+            try:
+                start = time.perf_counter()
+                wrapper.ensure_connection()
+                connect.append((time.perf_counter() - start) * 1000)
+                with wrapper.cursor() as cursor:
+                    start = time.perf_counter()
+                    cursor.execute('SELECT 1')
+                    cursor.fetchone()
+                    query.append((time.perf_counter() - start) * 1000)
+            finally:
+                wrapper.close()
+        return statistics.median(connect), statistics.median(query)
+
+    def time_request(self, url, repeat):
+        """(first ms, median warm ms, status code) of GET `url` through the full middleware stack."""
+        client = Client(HTTP_HOST=self.request_host())
+        timings = []
+        for _ in range(repeat + 1):
+            start = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings[0], statistics.median(timings[1:]), response.status_code
+
+    def request_host(self):
+        hosts = settings.ALLOWED_HOSTS
+        if not hosts or hosts[0] == '*':
+            return 'localhost'
+        return hosts[0].lstrip('.')
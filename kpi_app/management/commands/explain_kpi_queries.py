@@ -0,0 +1,125 @@
+import json
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, Q, Sum
+
+from kpi_app.models import alk_employee, alk_kpi_result, alk_kpi_summary
+from kpi_app.periods import period_lookup
+
+# SQLite: "SCAN <table>" without an index is a full table scan.
+SQLITE_FULL_SCAN = re.compile(r'\bSCAN (\w+)(?! USING (COVERING )?INDEX)')
+
+
+class Command(BaseCommand):
+    help = (
+        "Run EXPLAIN (MySQL or SQLite) on the canonical queries of each portal view "
+        "and flag full table scans."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help="Employee whose scope is used (default: first level 0/1 employee).")
+        parser.add_argument('--year', type=int)
+        parser.add_argument('--semester')
+        parser.add_argument('--month')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('mysql', 'sqlite'):
+            raise CommandError(f"Unsupported database vendor: {connection.vendor}")
+
+        employee = self.get_employee(options['username'])
+        period = self.get_period(employee, options)
+        queries = self.canonical_queries(employee, *period)
+
+        full_scans = 0
+        for view_name, description, queryset in queries:
+            tables = self.full_scan_tables(queryset)
+            full_scans += len(tables)
+            status = self.style.ERROR(f"FULL SCAN: {', '.join(tables)}") if tables else self.style.SUCCESS("ok")
+            self.stdout.write(f"[{view_name}] {description}: {status}")
+            if options['verbosity'] > 1:
+                self.stdout.write(self.explain(queryset))
+
+        if full_scans:
+            self.stdout.write(self.style.WARNING(f"{full_scans} full table scan(s) found."))
+        else:
+            self.stdout.write(self.style.SUCCESS("No full table scans."))
+
+    def get_employee(self, username):
+        employees = alk_employee.objects.select_related('dept')
+        if username:
+            employee = employees.filter(user_id__username=username).first()
+        else:
+            employee = employees.filter(level__lte=1).first() or employees.first()
+        if employee is None:
+            raise CommandError("No employee found to build the canonical queries.")
+        return employee
+
+    def get_period(self, employee, options):
+        latest = alk_kpi_result.objects.filter(employee=employee).order_by(
+            '-year', 'semester', 'month'
+        ).values('year', 'semester', 'month').first() or {}
+        return (
+            options['year'] or latest.get('year') or 2025,
+            options['semester'] or latest.get('semester') or '2nd SEM',
+            options['month'] or latest.get('month') or '1st',
+        )
+
+    def canonical_queries(self, employee, year, semester, month):
+        """(view name, description, queryset) mirroring the hot queries of each view."""
+        results = alk_kpi_result.objects.all()
+        if employee.level == 0:
+            team_scope = alk_employee.objects.filter(dept__group=employee.dept.group)
+        else:
+            team_scope = alk_employee.objects.filter(dept=employee.dept)
+        period = {'year': year, 'semester': semester, 'month': month}
+        kpi_id = results.filter(employee=employee).values_list('kpi_id', flat=True).first() or 0
+
+        return [
+            ('portal_dashboard', "year options", results.filter(employee=employee)
+                .values_list('year', flat=True).distinct().order_by('-year')),
+            ('portal_dashboard', "monthly totals (summary)", alk_kpi_summary.objects
+                .filter(employee=employee, **period_lookup(year, semester))
+                .values('month').annotate(total_score=Sum('total_score')).order_by('month')),
+            ('portal_input', "period rows", results.filter(employee=employee, **period)
+                .order_by('kpi__kpi_name')),
+            ('portal_save_kpi', "period total", results.filter(employee=employee, **period)
+                .values('employee').annotate(total=Sum('final_result')).order_by()),
+            ('manager_dashboard', "team status counts", results
+                .filter(employee__in=team_scope, **period_lookup(year, semester, month))
+                .values('employee').annotate(
+                    locked_count=Count('id', filter=Q(is_locked=True)), total_kpis=Count('id'))
+                .order_by()),
+            ('manager_review_employee', "employee period rows", results
+                .filter(employee=employee, **period_lookup(year, semester, month))
+                .order_by('kpi__kpi_name')),
+            ('manager_reports', "approved ranking (summary)", alk_kpi_summary.objects
+                .filter(locked_count__gt=0, employee__dept=employee.dept,
+                        **period_lookup(year, semester, month))
+                .values('employee__id').annotate(total_score=Sum('approved_score'))
+                .order_by('-total_score')),
+            ('import', "natural key lookup", results
+                .filter(year=year, semester=semester, employee=employee, month=month, kpi_id=kpi_id)),
+        ]
+
+    def explain(self, queryset):
+        if connection.vendor == 'mysql':
+            return queryset.explain(format='json')
+        return queryset.explain()
+
+    def full_scan_tables(self, queryset):
+        plan = self.explain(queryset)
+        if connection.vendor == 'mysql':
+            return sorted(set(self._mysql_full_scans(json.loads(plan))))
+        return sorted(set(m.group(1) for m in SQLITE_FULL_SCAN.finditer(plan)))
+
+    def _mysql_full_scans(self, node):
+        if isinstance(node, dict):
+            if node.get('access_type') == 'ALL' and 'table_name' in node:
+                yield node['table_name']
+            for value in node.values():
+                yield from self._mysql_full_scans(value)
+        elif isinstance(node, list):
+            for value in node:
+                yield from self._mysql_full_scans(value)
@@ -0,0 +1,68 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from kpi_app import synthetic_data
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic organisation (dept groups, depts, job titles, KPIs, employees at "
+        "levels 0-4) and monthly alk_kpi_result rows with bulk inserts. Generated rows are marked "
+        "(syn_ users, 'SYN ' names) and removed with --clear / --clear-only."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--results', type=int,
+                            help="Approximate number of result rows; sets the number of employees.")
+        parser.add_argument('--employees', type=int, default=200)
+        parser.add_argument('--groups', type=int, default=4, help="Dept groups.")
+        parser.add_argument('--depts-per-group', type=int, default=5)
+        parser.add_argument('--job-titles', type=int, default=20)
+        parser.add_argument('--objectives', type=int, default=10)
+        parser.add_argument('--kpis', type=int, default=60)
+        parser.add_argument('--kpis-per-employee', type=int, default=8)
+        parser.add_argument('--semesters', type=int, default=2, help="Semesters of monthly results per employee.")
+        parser.add_argument('--end-year', type=int, default=2025, help="Year of the newest semester (2nd SEM).")
+        parser.add_argument('--password', help="Password of every generated user (default: unusable).")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=synthetic_data.BATCH_SIZE)
+        parser.add_argument('--clear', action='store_true', help="Delete previously generated data first.")
+        parser.add_argument('--clear-only', action='store_true', help="Only delete previously generated data.")
+
+    def handle(self, *args, **options):
+        if options['clear'] or options['clear_only']:
+            started = time.perf_counter()
+            deleted = synthetic_data.clear()
+            self.stdout.write(f"Deleted synthetic data ({deleted:,} results) in {time.perf_counter() - started:.1f}s.")
+            if options['clear_only']:
+                return
+        if synthetic_data.exists():
+            raise CommandError("Synthetic data already exists; use --clear to replace it.")
+
+        employees = options['employees']
+        if options['results'] is not None:
+            employees = synthetic_data.employees_for(
+                options['results'], options['kpis_per_employee'], options['semesters']
+            )
+        if employees < options['groups'] * options['depts_per_group']:
+            raise CommandError("Need at least one employee per department (--employees / --results).")
+
+        def progress(done, total):
+            self.stdout.write(f"  {done:,} / {total:,} results", ending='\r')
+            self.stdout.flush()
+
+        started = time.perf_counter()
+        counts = synthetic_data.generate(
+            employees=employees, groups=options['groups'], depts_per_group=options['depts_per_group'],
+            job_titles=options['job_titles'], objectives=options['objectives'], kpis=options['kpis'],
+            kpis_per_employee=options['kpis_per_employee'], semesters=options['semesters'],
+            end_year=options['end_year'], password=options['password'], seed=options['seed'],
+            batch_size=options['batch_size'], progress=progress,
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {counts['groups']} groups, {counts['depts']} depts, {counts['kpis']} KPIs, "
+            f"{counts['employees']:,} employees and {counts['results']:,} results in {elapsed:.1f}s "
+            f"({counts['results'] / elapsed:,.0f} rows/s)."
+        ))
@@ -0,0 +1,131 @@
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Thư viện nặng nên được nạp khi cần (trong view / job), không phải lúc worker khởi động
+HEAVY_MODULES = ('pandas', 'numpy', 'openpyxl', 'reportlab', 'matplotlib')
+
+# Chạy trong một tiến trình Python mới, như một worker FastCGI vừa được tái khởi động
+COLD_START = r"""
+import json, sys, time
+start = time.perf_counter()
+import django
+django.setup()
+setup_done = time.perf_counter()
+from django.conf import settings
+from django.core.wsgi import get_wsgi_application
+from wsgiref.util import setup_testing_defaults
+application = get_wsgi_application()
+app_done = time.perf_counter()
+hosts = settings.ALLOWED_HOSTS
+host = 'localhost' if not hosts or hosts[0] == '*' else hosts[0].lstrip('.')
+
+def request(path):
+    environ = {'PATH_INFO': path, 'HTTP_HOST': host, 'SERVER_NAME': host}
+    setup_testing_defaults(environ)
+    status = []
+    response = application(environ, lambda s, headers, exc_info=None: status.append(s))
+    try:
+        b''.join(response)
+    finally:
+        if hasattr(response, 'close'):
+            response.close()
+    return status[0]
+
+status = request(sys.argv[1])
+first_done = time.perf_counter()
+request(sys.argv[1])
+second_done = time.perf_counter()
+print(json.dumps({
+    'setup_ms': (setup_done - start) * 1000,
+    'wsgi_ms': (app_done - setup_done) * 1000,
+    'first_response_ms': (first_done - app_done) * 1000,
+    'second_response_ms': (second_done - first_done) * 1000,
+    'status': status,
+    'modules': sorted(sys.modules),
+}))
+"""
+
+IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+class Command(BaseCommand):
+    help = (
+        "Start a fresh Python process like a recycled FastCGI worker and report the cumulative "
+        "import cost per top-level package (python -X importtime) and the time to the first response."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='/admin/login/', help="Page requested as the first response.")
+        parser.add_argument('--top', type=int, default=15, help="Number of packages listed.")
+
+    def handle(self, *args, **options):
+        env = os.environ.copy()
+        env['DJANGO_SETTINGS_MODULE'] = settings.SETTINGS_MODULE
+        env['PYTHONPATH'] = os.pathsep.join(path or os.getcwd() for path in sys.path)
+        started = time.perf_counter()
+        process = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', COLD_START, options['url']],
+            capture_output=True, text=True, env=env,
+        )
+        wall_ms = (time.perf_counter() - started) * 1000
+        if process.returncode != 0:
+            errors = [line for line in process.stderr.splitlines() if not line.startswith('import time:')]
+            raise CommandError("Cold start failed:\n" + "\n".join(errors[-20:]))
+        timings = json.loads(process.stdout.strip().splitlines()[-1])
+
+        packages, heavy = self.import_costs(process.stderr)
+        total_us = sum(packages.values())
+        self.stdout.write(f"Import time by top-level package (cumulative, total {total_us / 1000:.1f} ms):")
+        for name, cumulative_us in sorted(packages.items(), key=lambda item: -item[1])[:options['top']]:
+            self.stdout.write(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+        loaded = set(timings['modules'])
+        for name in HEAVY_MODULES:
+            if name in heavy:
+                cost_us, root = heavy[name]
+                self.stdout.write(self.style.WARNING(
+                    f"{name}: loaded at startup ({cost_us / 1000:.1f} ms, imported via {root})"
+                ))
+            elif name in loaded:
+                self.stdout.write(self.style.WARNING(f"{name}: loaded at startup"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"{name}: not loaded"))
+
+        self.stdout.write(
+            f"django.setup() {timings['setup_ms']:.1f} ms, WSGI handler {timings['wsgi_ms']:.1f} ms, "
+            f"first response {timings['first_response_ms']:.1f} ms ({timings['status']}), "
+            f"second response {timings['second_response_ms']:.1f} ms"
+        )
+        cold_ms = timings['setup_ms'] + timings['wsgi_ms'] + timings['first_response_ms']
+        self.stdout.write(
+            f"cold start to first response: {cold_ms:.1f} ms "
+            f"(process wall time incl. interpreter start and importtime overhead: {wall_ms:.1f} ms)"
+        )
+
+    def import_costs(self, stderr):
+        """
+        ({top-level package: cumulative µs}, {heavy module: (cumulative µs, root package)})
+        from the -X importtime report.
+        """
+        packages, heavy, pending = {}, {}, {}
+        for line in stderr.splitlines():
+            match = IMPORT_TIME_LINE.match(line)
+            if not match:
+                continue
+            cumulative, depth, module = int(match.group(2)), len(match.group(3)), match.group(4)
+            if module in HEAVY_MODULES:
+                pending[module] = cumulative
+            # Module con được in trước module cha; dòng thụt lề 1 ký tự là import gốc (đã gồm module con)
+            if depth == 1:
+                root = module.split('.')[0]
+                packages[root] = packages.get(root, 0) + cumulative
+                heavy.update((name, (cost, root)) for name, cost in pending.items())
+                pending = {}
+        return packages, heavy
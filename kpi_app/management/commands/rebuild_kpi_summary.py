@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from kpi_app.models import alk_kpi_result, alk_kpi_summary
+
+
+class Command(BaseCommand):
+    help = "Rebuild the alk_kpi_summary table (per employee / period totals) from alk_kpi_result."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, help="Only rebuild periods of this year.")
+
+    def handle(self, *args, **options):
+        if options['year']:
+            alk_kpi_summary.rebuild(alk_kpi_result.objects.filter(year=options['year']))
+        else:
+            alk_kpi_summary.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"KPI summary rebuilt: {alk_kpi_summary.objects.count()} period row(s)."
+        ))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from kpi_app.models import alk_kpi_result
+from kpi_app.scoring import rescore_queryset
+
+
+class Command(BaseCommand):
+    help = "Re-score KPI results (final_result) in bulk, e.g. after a target or min/max correction."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, required=True)
+        parser.add_argument('--semester', help="e.g. '1st SEM' or '2nd SEM'")
+        parser.add_argument('--month', help="e.g. '1st' ... '5th' or 'final'")
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be positive.")
+
+        results = alk_kpi_result.objects.filter(year=options['year'])
+        if options['semester']:
+            results = results.filter(semester=options['semester'])
+        if options['month']:
+            results = results.filter(month=options['month'])
+
+        updated = rescore_queryset(results, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Re-scored {updated} KPI result(s)."))
@@ -0,0 +1,63 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections
+
+from kpi_app.jobs import claim_next_job, fail_stale_jobs, release_job, run_job
+
+logger = logging.getLogger('kpi_app.jobs')
+
+
+class Command(BaseCommand):
+    help = (
+        "Process queued background jobs (imports, exports, re-scoring). Run it as a service or a "
+        "scheduled task next to IIS; use --once to drain the queue and exit."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Exit when no job can be claimed.")
+        parser.add_argument('--sleep', type=float, default=5, help="Seconds to wait when the queue is empty.")
+        parser.add_argument('--max-jobs', type=int, default=0, help="Exit after this many jobs (0 = no limit).")
+
+    def handle(self, *args, **options):
+        processed = 0
+        while True:
+            job = None
+            try:
+                stale = fail_stale_jobs()
+                if stale:
+                    self.stdout.write(self.style.WARNING(f"Marked {stale} stale job(s) as failed."))
+
+                job = claim_next_job()
+                if job is None:
+                    if options['once']:
+                        break
+                    time.sleep(options['sleep'])
+                    continue
+
+                self.stdout.write(f"Running {job}...")
+                job = run_job(job)
+            except DatabaseError as e:
+                # Lỗi DB tạm thời (MySQL "gone away", deadlock...) không được làm dừng worker
+                logger.exception("Job worker database error")
+                self.stderr.write(f"Database error: {e}")
+                close_old_connections()
+                if job is not None:
+                    self.release(job, e)
+                time.sleep(options['sleep'])
+                continue
+            style = self.style.SUCCESS if job.status == job.STATUS_DONE else self.style.ERROR
+            self.stdout.write(style(f"{job}: {job.message.splitlines()[0] if job.message else ''}"))
+
+            processed += 1
+            if options['max_jobs'] and processed >= options['max_jobs']:
+                break
+
+    def release(self, job, error):
+        """Fail the job this worker had claimed, instead of leaving it running until it goes stale."""
+        try:
+            release_job(job, f"Worker database error: {error}")
+        except DatabaseError:
+            logger.exception("Could not mark %s as failed", job)
+            close_old_connections()
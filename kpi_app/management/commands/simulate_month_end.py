@@ -0,0 +1,100 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from kpi_app import load_simulation, synthetic_data
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulate month-end close: employees save KPI cells through portal_save_kpi while their "
+        "managers approve with manager_toggle_approval, concurrently from a thread or process pool. "
+        "Reports throughput, latency percentiles, lock errors and lost updates, then restores the rows. "
+        "Run it against a local database (e.g. synthetic data from generate_kpi_data --password)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=50, help="Employee sessions (one per employee).")
+        parser.add_argument('--cells', type=int, default=5, help="Cells saved per employee session.")
+        parser.add_argument('--workers', type=int, default=20, help="Concurrent sessions.")
+        parser.add_argument('--processes', action='store_true',
+                            help="Use a process pool (fork) instead of threads; needs a file or server database.")
+        parser.add_argument('--password', help="Log in through the login form with this password "
+                                               "(default: force_login, no password hashing).")
+        parser.add_argument('--users', default=synthetic_data.USER_PREFIX,
+                            help="Only employees whose username starts with this ('' for everyone).")
+        parser.add_argument('--year', type=int)
+        parser.add_argument('--semester')
+        parser.add_argument('--month', default='1st')
+        parser.add_argument('--think-ms', type=float, default=0, help="Pause before every save / approval.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keep', action='store_true', help="Keep the saved values and approvals.")
+        parser.add_argument('--output', help="Write the report to this JSON file.")
+
+    def handle(self, *args, **options):
+        year, semester = options['year'], options['semester']
+        if not (year and semester):
+            latest = synthetic_data.latest_period()
+            if latest is None:
+                raise CommandError("No synthetic data: pass --year and --semester, or run generate_kpi_data.")
+            year, semester = year or latest[0], semester or latest[1]
+        period = {'year': year, 'semester': semester, 'month': options['month']}
+
+        sessions = load_simulation.plan_sessions(
+            year, semester, options['month'], employees=options['employees'], cells=options['cells'],
+            username_prefix=options['users'], seed=options['seed'],
+        )
+        employees = sum(session['kind'] == 'employee' for session in sessions)
+        if not employees:
+            raise CommandError(f"No unlocked KPI results to save in {year} {semester} {options['month']}.")
+        self.stdout.write(
+            f"{employees} employee and {len(sessions) - employees} manager sessions on "
+            f"{options['workers']} {'processes' if options['processes'] else 'threads'} "
+            f"({year} {semester} {options['month']})"
+        )
+
+        original = load_simulation.snapshot(sessions)
+        try:
+            results, elapsed = load_simulation.simulate(
+                sessions, period, workers=options['workers'], processes=options['processes'],
+                password=options['password'], host=self.request_host(), think_ms=options['think_ms'],
+            )
+            report = load_simulation.report(results, elapsed)
+        finally:
+            if not options['keep']:
+                load_simulation.restore(original)
+
+        self.print_report(report)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+
+    def print_report(self, report):
+        self.stdout.write(
+            f"{report['requests']:,} requests in {report['elapsed_s']:.1f}s "
+            f"({report['throughput_rps']:.1f} req/s), statuses {report['statuses']}"
+        )
+        for action, row in report['actions'].items():
+            self.stdout.write(
+                f"  {action:12} {row['count']:6}  p50 {row['p50_ms']:8.1f} ms  p95 {row['p95_ms']:8.1f} ms  "
+                f"p99 {row['p99_ms']:8.1f} ms  max {row['max_ms']:8.1f} ms  errors {row['errors']}"
+            )
+        self.stdout.write(f"Saves refused after approval: {report['locked_rejections']}")
+        problems = [
+            ('Lock errors', report['lock_errors']),
+            ('Other errors', report['other_errors']),
+            ('Lost saves', len(report['lost_saves'])),
+            ('Lost approvals', len(report['lost_approvals'])),
+        ]
+        for label, count in problems:
+            self.stdout.write((self.style.ERROR if count else self.style.SUCCESS)(f"{label}: {count}"))
+        for error in report['error_samples']:
+            self.stdout.write(f"  {error}")
+
+    def request_host(self):
+        hosts = settings.ALLOWED_HOSTS
+        if not hosts or hosts[0] == '*':
+            return 'localhost'
+        return hosts[0].lstrip('.')
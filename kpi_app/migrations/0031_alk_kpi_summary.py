@@ -0,0 +1,52 @@
+# Generated by Django 5.2.1 on 2026-10-18 00:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Avg, Count, Q, Sum
+from django.db.models.functions import Coalesce
+
+
+def populate_summary(apps, schema_editor):
+    alk_kpi_result = apps.get_model('kpi_app', 'alk_kpi_result')
+    alk_kpi_summary = apps.get_model('kpi_app', 'alk_kpi_summary')
+    rows = alk_kpi_result.objects.values('employee_id', 'year', 'semester', 'month').annotate(
+        total_score=Coalesce(Sum('final_result'), 0, output_field=models.DecimalField()),
+        approved_score=Coalesce(Sum('final_result', filter=Q(is_locked=True)), 0, output_field=models.DecimalField()),
+        kpi_count=Count('id'),
+        locked_count=Count('id', filter=Q(is_locked=True)),
+        avg_score=Coalesce(Avg('final_result'), 0, output_field=models.DecimalField()),
+    ).order_by()
+    alk_kpi_summary.objects.bulk_create(
+        (alk_kpi_summary(**row) for row in rows.iterator(chunk_size=2000)), batch_size=2000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kpi_app', '0030_rename_achivement_alk_kpi_result_achievement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='alk_kpi_summary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField()),
+                ('semester', models.CharField(choices=[('1st SEM', '1st SEM'), ('2nd SEM', '2nd SEM')], max_length=7)),
+                ('month', models.CharField(choices=[('1st', '1st'), ('2nd', '2nd'), ('3rd', '3rd'), ('4th', '4th'), ('5th', '5th'), ('final', 'Final')], max_length=6)),
+                ('total_score', models.DecimalField(decimal_places=3, default=0, max_digits=20)),
+                ('approved_score', models.DecimalField(decimal_places=3, default=0, max_digits=20)),
+                ('kpi_count', models.IntegerField(default=0)),
+                ('locked_count', models.IntegerField(default=0)),
+                ('avg_score', models.DecimalField(decimal_places=6, default=0, max_digits=20)),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='kpi_app.alk_employee')),
+            ],
+            options={
+                'verbose_name_plural': 'KPI Summary',
+                'ordering': ['year', 'semester', 'employee', 'month'],
+                'constraints': [models.UniqueConstraint(fields=('employee', 'year', 'semester', 'month'), name='kpi_summary_unique_period')],
+            },
+        ),
+        migrations.RunPython(populate_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.1 on 2026-10-18 00:25
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicate_natural_keys(apps, schema_editor):
+    """Fail with a readable message instead of a raw IntegrityError."""
+    alk_kpi_result = apps.get_model('kpi_app', 'alk_kpi_result')
+    duplicates = list(
+        alk_kpi_result.objects.values('employee_id', 'year', 'semester', 'month', 'kpi_id')
+        .annotate(rows=Count('id')).filter(rows__gt=1).order_by()[:20]
+    )
+    if duplicates:
+        lines = '\n'.join(
+            f"  employee={d['employee_id']} kpi={d['kpi_id']} {d['year']} {d['semester']} {d['month']}: {d['rows']} rows"
+            for d in duplicates
+        )
+        raise RuntimeError(
+            "Duplicate alk_kpi_result rows for (employee, year, semester, month, kpi) "
+            "must be merged before the unique constraint can be added:\n" + lines
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kpi_app', '0031_alk_kpi_summary'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_natural_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='alk_kpi_result',
+            index=models.Index(fields=['employee', 'year', 'semester', 'month', 'is_locked'], name='kpi_result_emp_period_lock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alk_kpi_result',
+            index=models.Index(fields=['year', 'semester', 'month', 'is_locked'], name='kpi_result_period_lock_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='alk_kpi_result',
+            constraint=models.UniqueConstraint(fields=('employee', 'year', 'semester', 'month', 'kpi'), name='kpi_result_unique_natural_key'),
+        ),
+    ]
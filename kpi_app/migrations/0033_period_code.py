@@ -0,0 +1,76 @@
+# Generated by Django 5.2.1 on 2026-10-18 00:26
+
+from django.db import migrations, models
+
+# Frozen copy of kpi_app.periods at the time of this migration
+SEMESTER_CODES = {'1st sem': 1, '2nd sem': 2}
+MONTH_CODES = {'1st': 1, '2nd': 2, '3rd': 3, '4th': 4, '5th': 5, 'final': 6}
+
+
+def _code(value, codes):
+    value = str(value).strip().lower()
+    if value in codes:
+        return codes[value]
+    partial = [code for key, code in codes.items() if value and value in key]
+    return partial[0] if len(partial) == 1 else None
+
+
+def populate_period_code(apps, schema_editor):
+    for model_name in ('alk_kpi_result', 'alk_kpi_summary'):
+        model = apps.get_model('kpi_app', model_name)
+        periods = model.objects.values_list('year', 'semester', 'month').distinct().order_by()
+        for year, semester, month in list(periods):
+            sem_code = _code(semester, SEMESTER_CODES)
+            month_code = _code(month, MONTH_CODES)
+            if year is None or sem_code is None or month_code is None:
+                continue
+            model.objects.filter(year=year, semester=semester, month=month).update(
+                period_code=year * 100 + sem_code * 10 + month_code
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kpi_app', '0032_alk_kpi_result_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alk_kpi_result',
+            name='period_code',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='alk_kpi_summary',
+            name='period_code',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(populate_period_code, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='alk_kpi_result',
+            index=models.Index(fields=['employee', 'period_code', 'is_locked'], name='kpi_result_emp_code_lock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alk_kpi_result',
+            index=models.Index(fields=['period_code', 'is_locked'], name='kpi_result_code_lock_idx'),
+        ),
+        # Mọi bộ lọc kỳ đã chuyển sang period_code; (employee, year, semester, month)
+        # còn được phục vụ bởi kpi_result_unique_natural_key
+        migrations.RemoveIndex(
+            model_name='alk_kpi_result',
+            name='kpi_result_emp_period_lock_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='alk_kpi_result',
+            name='kpi_result_period_lock_idx',
+        ),
+        migrations.AddIndex(
+            model_name='alk_kpi_summary',
+            index=models.Index(fields=['employee', 'period_code'], name='kpi_summary_emp_code_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alk_kpi_summary',
+            index=models.Index(fields=['period_code', 'employee'], name='kpi_summary_code_emp_idx'),
+        ),
+    ]
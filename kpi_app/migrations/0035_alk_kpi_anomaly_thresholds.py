@@ -0,0 +1,24 @@
+# Generated by Django 5.2.1 on 2026-10-18 00:42
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kpi_app', '0034_alk_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alk_kpi',
+            name='anomaly_high',
+            field=models.DecimalField(decimal_places=3, default=Decimal('1.2'), max_digits=6),
+        ),
+        migrations.AddField(
+            model_name='alk_kpi',
+            name='anomaly_low',
+            field=models.DecimalField(decimal_places=3, default=Decimal('0.4'), max_digits=6),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kpi_app', '0035_alk_kpi_anomaly_thresholds'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alk_kpi_result',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.1 on 2026-10-18 01:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kpi_app', '0036_alk_kpi_result_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='alk_request_timing',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url_name', models.CharField(max_length=200)),
+                ('total_ms', models.FloatField()),
+                ('view_ms', models.FloatField()),
+                ('db_ms', models.FloatField()),
+                ('tpl_ms', models.FloatField()),
+                ('queries', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Request Timing',
+                'indexes': [models.Index(fields=['url_name', 'id'], name='request_timing_url_idx')],
+            },
+        ),
+    ]
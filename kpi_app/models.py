@@ -1,6 +1,12 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import Avg, Count, Q, Sum
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 
+from .periods import period_code
+
 # Create your models here.
 
 class alk_dept(models.Model):
@@ -88,7 +94,10 @@ class alk_kpi(models.Model):
     percentage_cal= models.BooleanField(default=False)
     get_1_is_zero= models.BooleanField(default=False)
     percent_display = models.BooleanField(default=False,null=True, blank=True)
-
+    # Ngưỡng cảnh báo trên Manager Dashboard: final_result > anomaly_high (nghi nhập sai)
+    # hoặc < anomaly_low (hiệu suất thấp)
+    anomaly_high = models.DecimalField(max_digits=6, decimal_places=3, default=Decimal('1.2'))
+    anomaly_low = models.DecimalField(max_digits=6, decimal_places=3, default=Decimal('0.4'))
 
     class Meta:
         ordering = ['kpi_name']
@@ -121,6 +130,8 @@ class alk_kpi_result(models.Model):
     target_input = models.DecimalField(max_digits=20, decimal_places=4,null=True, blank=True)
     achievement = models.DecimalField(max_digits=20, decimal_places=4,null=True, blank=True)
     month = models.CharField(max_length=6, choices=MONTH_CHOICES)
+    # Mã kỳ dạng số (year*100 + semester*10 + month), xem kpi_app/periods.py
+    period_code = models.IntegerField(null=True, blank=True, editable=False)
     final_result = models.DecimalField(max_digits=20, decimal_places=3, blank=True, null=True,editable=False)
     active = models.BooleanField(default=True)
     is_locked = models.BooleanField(
@@ -128,6 +139,9 @@ class alk_kpi_result(models.Model):
         verbose_name="Approved",
         help_text="If checked, status is Approved (ReadOnly). If unchecked, status is Pending."
     )
+    # Phiên bản của dòng: khoá cache fragment trên portal. Các lệnh queryset.update() /
+    # bulk_update() không qua save() nên phải tự gán updated_at=timezone.now()
+    updated_at = models.DateTimeField(auto_now=True)
 
     def calculate_final_result(self):
         # Nếu target_input hoặc achivement là None thì final_result = 0
@@ -177,14 +191,226 @@ class alk_kpi_result(models.Model):
         return temp_result * weigth
     
         
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Ghi nhớ kỳ ban đầu để cập nhật bảng tổng hợp nếu kỳ bị đổi
+        instance._loaded_period_key = instance.period_key()
+        instance._loaded_kpi_id = instance.kpi_id
+        return instance
+
+    def period_key(self):
+        return (self.employee_id, self.year, self.semester, self.month)
+
+    def lookup_keys_changed(self):
+        """Bản ghi mới, hoặc kỳ / nhân viên / KPI khác với lúc đọc từ DB (dùng để huỷ cache danh mục)."""
+        return (
+            getattr(self, '_loaded_period_key', None) != self.period_key()
+            or getattr(self, '_loaded_kpi_id', None) != self.kpi_id
+        )
+
     def save(self, *args, **kwargs):
         # Nếu kpi.percentage_cal = False thì target_input = target_set
         if self.kpi and hasattr(self.kpi, 'percentage_cal') and self.kpi.percentage_cal is False:
             self.target_input = self.target_set
         self.final_result = self.calculate_final_result()
+        self.period_code = period_code(self.year, self.semester, self.month)
         super().save(*args, **kwargs)
+        keys = {self.period_key(), getattr(self, '_loaded_period_key', self.period_key())}
+        alk_kpi_summary.refresh_keys(keys)
+        self._loaded_period_key = self.period_key()
+        self._loaded_kpi_id = self.kpi_id
+
+    def delete(self, *args, **kwargs):
+        key = self.period_key()
+        result = super().delete(*args, **kwargs)
+        alk_kpi_summary.refresh_keys([key])
+        return result
     class Meta:
         ordering = ['year', 'semester', 'employee', 'kpi','month',]
         verbose_name_plural = "KPI Result"
+        constraints = [
+            # Khoá tự nhiên dùng khi import (import_id_fields); employee đứng đầu
+            # để index này phục vụ luôn các truy vấn theo (employee, year, semester, month)
+            models.UniqueConstraint(
+                fields=['employee', 'year', 'semester', 'month', 'kpi'],
+                name='kpi_result_unique_natural_key',
+            ),
+        ]
+        indexes = [
+            # Lọc theo mã kỳ (khoảng hoặc chính xác) thay cho __icontains:
+            # thống kê duyệt theo nhân viên / kỳ (manager dashboard, review)
+            # và xếp hạng theo kỳ chỉ với kết quả đã duyệt (manager reports)
+            models.Index(
+                fields=['employee', 'period_code', 'is_locked'],
+                name='kpi_result_emp_code_lock_idx',
+            ),
+            models.Index(
+                fields=['period_code', 'is_locked'],
+                name='kpi_result_code_lock_idx',
+            ),
+        ]
+    def __str__(self):
+        return f"{self.employee} - {self.kpi} ({self.year} {self.semester})"
+
+
+class alk_kpi_summary(models.Model):
+    """
+    Bảng tổng hợp điểm KPI theo nhân viên / kỳ (year, semester, month).
+    Được cập nhật từ alk_kpi_result.save()/delete() và refresh_queryset() sau các
+    lệnh queryset.update(); dùng lệnh rebuild_kpi_summary để dựng lại toàn bộ.
+    """
+    employee = models.ForeignKey('alk_employee', on_delete=models.CASCADE)
+    year = models.IntegerField()
+    semester = models.CharField(max_length=7, choices=alk_kpi_result.SEMESTER_CHOICES)
+    month = models.CharField(max_length=6, choices=alk_kpi_result.MONTH_CHOICES)
+    period_code = models.IntegerField(null=True, blank=True)
+    total_score = models.DecimalField(max_digits=20, decimal_places=3, default=0)
+    approved_score = models.DecimalField(max_digits=20, decimal_places=3, default=0)
+    kpi_count = models.IntegerField(default=0)
+    locked_count = models.IntegerField(default=0)
+    avg_score = models.DecimalField(max_digits=20, decimal_places=6, default=0)
+
+    # Số kỳ tối đa trong một câu lệnh OR khi refresh
+    REFRESH_CHUNK_SIZE = 200
+
+    class Meta:
+        ordering = ['year', 'semester', 'employee', 'month']
+        verbose_name_plural = "KPI Summary"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['employee', 'year', 'semester', 'month'],
+                name='kpi_summary_unique_period',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['employee', 'period_code'], name='kpi_summary_emp_code_idx'),
+            models.Index(fields=['period_code', 'employee'], name='kpi_summary_code_emp_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.employee} ({self.year} {self.semester} {self.month})"
+
+    @staticmethod
+    def aggregate(results):
+        """Nhóm alk_kpi_result theo nhân viên / kỳ và tính các chỉ số tổng hợp."""
+        return results.values('employee_id', 'year', 'semester', 'month', 'period_code').annotate(
+            total_score=Coalesce(Sum('final_result'), 0, output_field=models.DecimalField()),
+            approved_score=Coalesce(
+                Sum('final_result', filter=Q(is_locked=True)), 0, output_field=models.DecimalField()
+            ),
+            kpi_count=Count('id'),
+            locked_count=Count('id', filter=Q(is_locked=True)),
+            avg_score=Coalesce(Avg('final_result'), 0, output_field=models.DecimalField()),
+        ).order_by()
+
+    @classmethod
+    def refresh_keys(cls, keys):
+        """Tính lại các dòng tổng hợp cho các kỳ (employee_id, year, semester, month)."""
+        keys = [k for k in set(keys) if None not in k]
+        for start in range(0, len(keys), cls.REFRESH_CHUNK_SIZE):
+            chunk = keys[start:start + cls.REFRESH_CHUNK_SIZE]
+            period_q = Q()
+            for employee_id, year, semester, month in chunk:
+                period_q |= Q(employee_id=employee_id, year=year, semester=semester, month=month)
+            with transaction.atomic():
+                cls.objects.filter(period_q).delete()
+                cls.objects.bulk_create(
+                    cls(**row) for row in cls.aggregate(alk_kpi_result.objects.filter(period_q))
+                )
+
+    @classmethod
+    def refresh_queryset(cls, results):
+        """Tính lại tổng hợp cho mọi kỳ có trong queryset alk_kpi_result."""
+        cls.refresh_keys(
+            results.order_by().values_list('employee_id', 'year', 'semester', 'month').distinct()
+        )
+
+    @classmethod
+    def rebuild(cls, results=None):
+        """Dựng lại bảng tổng hợp (toàn bộ, hoặc chỉ các kỳ thuộc `results`)."""
+        if results is None:
+            results = alk_kpi_result.objects.all()
+            with transaction.atomic():
+                cls.objects.all().delete()
+                rows = cls.aggregate(results).iterator(chunk_size=2000)
+                cls.objects.bulk_create((cls(**row) for row in rows), batch_size=2000)
+        else:
+            cls.refresh_queryset(results)
+
+class alk_job(models.Model):
+    """
+    Tác vụ nền (import / export / re-score) chạy ngoài request IIS.
+    Xếp hàng bằng kpi_app.jobs.enqueue(), xử lý bởi lệnh run_jobs.
+    """
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    job_type = models.CharField(max_length=50)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    params = models.JSONField(default=dict, blank=True)
+    created_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
+    input_file = models.FileField(upload_to='kpi_jobs/input/%Y/%m/', null=True, blank=True)
+    result_file = models.FileField(upload_to='kpi_jobs/result/%Y/%m/', null=True, blank=True)
+    processed = models.IntegerField(default=0)
+    total = models.IntegerField(null=True, blank=True)
+    message = models.TextField(blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name_plural = "Background Job"
+        indexes = [
+            # Worker lấy job theo (status, job_type) theo thứ tự tạo
+            models.Index(fields=['status', 'job_type', 'created_at'], name='job_status_type_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.job_type} #{self.pk} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
+
+    @property
+    def percent(self):
+        if self.status == self.STATUS_DONE:
+            return 100
+        if not self.total:
+            return 0
+        return min(100, int(self.processed * 100 / self.total))
+
+class alk_request_timing(models.Model):
+    """
+    Mẫu thời gian của một request (RequestTimingMiddleware), tổng hợp p50 / p95
+    ở portal/timings/. Mỗi request một INSERT, nên các worker wfastcgi không ghi đè mẫu của nhau.
+    """
+    url_name = models.CharField(max_length=200)
+    total_ms = models.FloatField()
+    view_ms = models.FloatField()
+    db_ms = models.FloatField()
+    tpl_ms = models.FloatField()
+    queries = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = "Request Timing"
+        indexes = [
+            # Các mẫu mới nhất của mỗi URL
+            models.Index(fields=['url_name', 'id'], name='request_timing_url_idx'),
+        ]
+
     def __str__(self):
-        return f"{self.employee} - {self.kpi} ({self.year} {self.semester})"
\ No newline at end of file
+        return f"{self.url_name} {self.total_ms:.0f}ms"
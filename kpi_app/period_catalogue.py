@@ -0,0 +1,101 @@
+"""
+Catalogue of the known (year, semester, month) periods for the filter dropdowns.
+
+The portal views used to run two or three DISTINCT scans of alk_kpi_result on
+every request just to list the years / semesters / months. The periods of a
+scope (everyone, a team, one employee) are now read once and kept in the
+cache framework. Creating, deleting or moving a result to another period, a
+bulk import, or a change to an employee / department bumps a cache version,
+which drops every catalogue at once. Unless that cache is shared by every
+server process (shared_cache), the catalogue is read on every call.
+"""
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import alk_dept, alk_employee, alk_kpi_result
+from .shared_cache import cache_is_shared
+
+CACHE_TIMEOUT = 3600
+VERSION_KEY = 'kpi_app:period_catalogue:version'
+
+
+class PeriodCatalogue:
+    """Sorted (year, semester, month) periods of one scope."""
+
+    def __init__(self, periods):
+        self.periods = sorted(set(periods))
+
+    def __bool__(self):
+        return bool(self.periods)
+
+    @property
+    def years(self):
+        """Newest first."""
+        return sorted({year for year, _, _ in self.periods}, reverse=True)
+
+    @property
+    def semesters(self):
+        return sorted({semester for _, semester, _ in self.periods})
+
+    @property
+    def months(self):
+        return sorted({month for _, _, month in self.periods})
+
+
+def get_catalogue(scope_key, employee_ids=None):
+    """
+    PeriodCatalogue of the employees in `employee_ids` (None = everyone).
+    `scope_key` names that set of employees in the cache key.
+    """
+    if not cache_is_shared():
+        return PeriodCatalogue(_read_periods(employee_ids))
+    key = f'kpi_app:period_catalogue:{cache.get_or_set(VERSION_KEY, 1, None)}:{scope_key}'
+    periods = cache.get(key)
+    if periods is None:
+        periods = _read_periods(employee_ids)
+        cache.set(key, periods, CACHE_TIMEOUT)
+    return PeriodCatalogue(periods)
+
+
+def _read_periods(employee_ids):
+    results = alk_kpi_result.objects.exclude(semester='').exclude(month='')
+    if employee_ids is not None:
+        results = results.filter(employee_id__in=list(employee_ids))
+    return list(results.order_by().values_list('year', 'semester', 'month').distinct())
+
+
+def all_periods():
+    return get_catalogue('all')
+
+
+def employee_periods(employee):
+    return get_catalogue(f'employee:{employee.id}', [employee.id])
+
+
+def team_periods(context):
+    """Periods of the manager's team, the manager excluded (as in manager_dashboard)."""
+    return get_catalogue(
+        f'team:{context.scope_key}:{context.employee.id}', context.team_scope_ids - {context.employee.id}
+    )
+
+
+def invalidate_period_catalogue():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 2, None)
+
+
+@receiver([post_save, post_delete], sender=alk_employee)
+@receiver([post_save, post_delete], sender=alk_dept)
+def invalidate_on_scope_change(**kwargs):
+    invalidate_period_catalogue()
+
+
+@receiver(post_delete, sender=alk_kpi_result)
+@receiver(post_save, sender=alk_kpi_result)
+def invalidate_on_result_change(instance, **kwargs):
+    # Chỉ nhập số liệu (không đổi kỳ / nhân viên) thì danh mục kỳ không đổi
+    if kwargs['signal'] is post_delete or instance.lookup_keys_changed():
+        invalidate_period_catalogue()
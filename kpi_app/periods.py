@@ -0,0 +1,88 @@
+"""
+Normalized KPI period codes.
+
+alk_kpi_result stores the period as free-ish text (year, '2nd SEM', 'final'),
+which the views used to match with __icontains. period_code packs the
+period into one indexed integer: year * 100 + semester * 10 + month, e.g.
+2025 / '2nd SEM' / 'final' -> 202526. A whole semester or year is then a
+contiguous range of codes.
+"""
+
+SEMESTER_CODES = {'1st SEM': 1, '2nd SEM': 2}
+MONTH_CODES = {'1st': 1, '2nd': 2, '3rd': 3, '4th': 4, '5th': 5, 'final': 6}
+
+# Values that mean "no filter" in the portal dropdowns
+ALL_VALUES = ('', 'All', None)
+
+
+def _lookup(value, codes):
+    """Case/whitespace-insensitive match; a unique partial match ('2nd' -> '2nd SEM') also counts."""
+    value = str(value).strip().lower()
+    for key, code in codes.items():
+        if key.lower() == value:
+            return key, code
+    partial = [(key, code) for key, code in codes.items() if value and value in key.lower()]
+    if len(partial) == 1:
+        return partial[0]
+    return None, None
+
+
+def normalize_semester(value):
+    return _lookup(value, SEMESTER_CODES)[0]
+
+
+def normalize_month(value):
+    return _lookup(value, MONTH_CODES)[0]
+
+
+def period_code(year, semester, month):
+    """Integer code for one (year, semester, month), or None if any part is unknown."""
+    sem_code = _lookup(semester, SEMESTER_CODES)[1]
+    month_code = _lookup(month, MONTH_CODES)[1]
+    try:
+        year = int(year)
+    except (TypeError, ValueError):
+        return None
+    if sem_code is None or month_code is None:
+        return None
+    return year * 100 + sem_code * 10 + month_code
+
+
+def period_lookup(year=None, semester=None, month=None):
+    """
+    Filter kwargs selecting a period with exact / range lookups.
+
+    Empty or 'All' parts widen the selection (whole semester, whole year).
+    Without a year, falls back to exact matches on the canonical semester /
+    month values. Unknown values select nothing.
+    """
+    no_match = {'pk__in': []}
+    sem_code = month_code = None
+    if semester not in ALL_VALUES:
+        sem_code = _lookup(semester, SEMESTER_CODES)[1]
+        if sem_code is None:
+            return no_match
+    if month not in ALL_VALUES:
+        month_code = _lookup(month, MONTH_CODES)[1]
+        if month_code is None:
+            return no_match
+
+    if year in ALL_VALUES or str(year) == 'All':
+        lookup = {}
+        if sem_code is not None:
+            lookup['semester'] = normalize_semester(semester)
+        if month_code is not None:
+            lookup['month'] = normalize_month(month)
+        return lookup
+
+    try:
+        base = int(year) * 100
+    except (TypeError, ValueError):
+        return no_match
+    if sem_code is None:
+        if month_code is None:
+            return {'period_code__range': (base + 10, base + 99)}
+        return {'period_code__in': [base + sem * 10 + month_code for sem in SEMESTER_CODES.values()]}
+    if month_code is None:
+        return {'period_code__range': (base + sem_code * 10, base + sem_code * 10 + 9)}
+    return {'period_code': base + sem_code * 10 + month_code}
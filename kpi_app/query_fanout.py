@@ -0,0 +1,65 @@
+"""
+Run the independent queries of a view one after another (sync views) or
+concurrently (async views).
+
+A view describes its independent queries as {name: callable}. run_queries
+calls them in turn; gather_queries awaits them together.
+
+Django's async ORM (acount(), aaggregate(), ...) sends every query through
+sync_to_async(thread_sensitive=True), i.e. through the one shared sync
+thread, so gathering several of them still runs them in sequence.
+gather_queries instead runs each callable in a worker thread
+(thread_sensitive=False). Every worker thread has its own database
+connection, so the round trips to the database host overlap. After each
+call the worker closes its connection once it is obsolete (CONN_MAX_AGE),
+as request_finished does for the request thread.
+
+Connection cost: the workers come from one pool per process of
+KPI_QUERY_FANOUT_WORKERS threads (default 5, the queries of the manager
+dashboard), not from the default executor (up to min(32, cpu + 4) threads).
+With persistent connections each worker keeps its own connection open, so a
+process holds up to KPI_QUERY_FANOUT_WORKERS + 1 connections to the database.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+
+DEFAULT_WORKERS = 5
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def run_queries(queries):
+    return {name: query() for name, query in queries.items()}
+
+
+def _run_in_worker(query):
+    try:
+        return query()
+    finally:
+        for connection in connections.all(initialized_only=True):
+            connection.close_if_unusable_or_obsolete()
+
+
+def _executor():
+    """The worker pool of this process (one per KPI_QUERY_FANOUT_WORKERS value)."""
+    workers = getattr(settings, 'KPI_QUERY_FANOUT_WORKERS', DEFAULT_WORKERS)
+    with _executors_lock:
+        if workers not in _executors:
+            _executors[workers] = ThreadPoolExecutor(workers, thread_name_prefix='kpi-query-fanout')
+        return _executors[workers]
+
+
+async def gather_queries(queries):
+    names = list(queries)
+    executor = _executor()
+    values = await asyncio.gather(*(
+        sync_to_async(_run_in_worker, thread_sensitive=False, executor=executor)(queries[name])
+        for name in names
+    ))
+    return dict(zip(names, values))
@@ -0,0 +1,90 @@
+"""
+SQL query shapes, for spotting N+1 patterns.
+
+A shape is the SQL with its literals and parameters replaced by '?' and IN
+lists collapsed, so the per-row queries of a loop (`WHERE id = 1`,
+`WHERE id = 2`, ...) share one shape. A shape repeated many times in one
+request is almost always a missing select_related / prefetch_related or a
+query inside a loop.
+
+track_query_shapes() counts the shapes run inside a block, including the
+queries that async views run in worker threads. The tests use it to give every
+URL of kpi_app/urls.py a query budget, and RequestTimingMiddleware uses
+fingerprint() to log repeated shapes in production.
+"""
+import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+# Một shape lặp lại nhiều hơn chừng này lần trong một request -> nghi N+1
+DEFAULT_MAX_REPEATS = 3
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN \(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_SPACE = re.compile(r"\s+")
+
+_current = ContextVar('kpi_query_shapes', default=None)
+
+
+def fingerprint(sql):
+    """The shape of `sql`: literals and placeholders -> '?', IN (...) lists collapsed."""
+    sql = _STRING.sub('?', sql.replace('%s', '?'))
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+class QueryShapes:
+    """Query count per shape (a worker thread may add to it, hence the lock)."""
+
+    def __init__(self):
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+    def add(self, sql):
+        shape = fingerprint(sql)
+        with self.lock:
+            self.counts[shape] += 1
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    def repeated(self, max_repeats=DEFAULT_MAX_REPEATS):
+        """[(shape, count)] of the shapes run more than `max_repeats` times, most repeated first."""
+        return [(shape, count) for shape, count in self.counts.most_common() if count > max_repeats]
+
+    def report(self, max_repeats=DEFAULT_MAX_REPEATS):
+        return "\n".join(f"{count}x {shape}" for shape, count in self.repeated(max_repeats))
+
+
+def _record_shape(execute, sql, params, many, context):
+    shapes = _current.get()
+    if shapes is not None:
+        shapes.add(sql)
+    return execute(sql, params, many, context)
+
+
+def _install(connection, **kwargs):
+    if _record_shape not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_shape)
+
+
+@contextmanager
+def track_query_shapes():
+    """Count the query shapes run in the block: `with track_query_shapes() as shapes: ...`."""
+    connection_created.connect(_install, dispatch_uid='kpi_app.query_shapes')
+    for connection in connections.all():
+        _install(connection)
+    shapes = QueryShapes()
+    token = _current.set(shapes)
+    try:
+        yield shapes
+    finally:
+        _current.reset(token)
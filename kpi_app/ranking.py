@@ -0,0 +1,69 @@
+"""
+Employee ranking for the manager reports (screen and Excel export).
+
+Approved scores come from the per-period summary table, grouped per employee,
+and are ranked in the database with window functions: RANK (ties share a
+rank, the next rank is skipped), DENSE_RANK and PERCENT_RANK. The ranking is
+a plain queryset, so the screen paginates it with LIMIT/OFFSET and the export
+streams it; both read the same rows.
+"""
+from decimal import Decimal
+
+from django.db.models import F, Sum, Window
+from django.db.models.functions import Coalesce, DenseRank, PercentRank, Rank, Round
+
+from .models import alk_kpi_summary
+from .periods import period_lookup
+
+SCOPE_DEPT = 'dept'
+SCOPE_GROUP = 'group'
+SCOPE_COMPANY = 'company'
+SCOPE_LABELS = {
+    SCOPE_DEPT: 'Department',
+    SCOPE_GROUP: 'Department Group',
+    SCOPE_COMPANY: 'Company',
+}
+
+
+def allowed_scopes(user, employee):
+    """Level 1: own dept; level 0: own dept or dept group; superuser: also the whole company."""
+    if user.is_superuser:
+        return [SCOPE_DEPT, SCOPE_GROUP, SCOPE_COMPANY]
+    if employee.level == 0:
+        return [SCOPE_DEPT, SCOPE_GROUP]
+    return [SCOPE_DEPT]
+
+
+def employee_ranking(employee, scope, year, semester, month):
+    """
+    Ranking of the employees in `employee`'s scope for one period.
+
+    Rows are dicts with emp_id, name, job_title, total_score, score (percent,
+    2 decimals), rank, dense_rank and percent_rank, best first.
+    """
+    summaries = alk_kpi_summary.objects.filter(locked_count__gt=0, **period_lookup(year, semester, month))
+    if scope == SCOPE_DEPT:
+        summaries = summaries.filter(employee__dept_id=employee.dept_id)
+    elif scope == SCOPE_GROUP:
+        group = employee.dept.group if employee.dept else None
+        summaries = summaries.filter(employee__dept__group=group) if group else summaries.none()
+    elif scope != SCOPE_COMPANY:
+        raise ValueError(f"Unknown ranking scope: {scope}")
+
+    total_score = Coalesce(Sum('approved_score'), Decimal('0.0'))
+    order_by = Sum('approved_score').desc()
+    return (
+        summaries.values(
+            emp_id=F('employee__id'),
+            name=F('employee__name'),
+            job_title=F('employee__job_title__job_title'),
+        )
+        .annotate(
+            total_score=total_score,
+            score=Round(total_score * 100, 2),
+            rank=Window(Rank(), order_by=order_by),
+            dense_rank=Window(DenseRank(), order_by=order_by),
+            percent_rank=Window(PercentRank(), order_by=order_by),
+        )
+        .order_by('rank', 'name', 'emp_id')
+    )
@@ -0,0 +1,216 @@
+"""
+Per-request performance numbers: SQL query count, DB time, template render
+time, view time and total time.
+
+RequestTimingMiddleware (enabled with KPI_REQUEST_TIMING = True):
+
+- sends them to the browser as a Server-Timing header (DevTools, Network >
+  Timing);
+- logs requests slower than KPI_SLOW_REQUEST_MS, and requests that run one
+  SQL shape more than KPI_MAX_QUERY_REPEATS times (N+1, see query_shapes),
+  to the 'kpi_app.slow_requests' logger (a rotating file in
+  settings_production);
+- stores one alk_request_timing row per request (about the last
+  KPI_REQUEST_TIMING_SAMPLES per URL name are kept), summarized as p50 / p95
+  on the staff page portal/timings/. A row per sample, rather than a list
+  in the cache, so that concurrent workers never overwrite each other's
+  samples.
+
+With KPI_REQUEST_TIMING off the middleware removes itself from the chain
+(MiddlewareNotUsed) and nothing is instrumented. Template time includes the
+queries run lazily while rendering.
+"""
+import logging
+import math
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, connections
+from django.db.backends.signals import connection_created
+from django.template.backends.django import Template
+
+from .models import alk_request_timing
+from .query_shapes import DEFAULT_MAX_REPEATS, fingerprint
+
+logger = logging.getLogger('kpi_app.slow_requests')
+
+DEFAULT_SLOW_REQUEST_MS = 1000
+DEFAULT_SAMPLES = 500
+# Thứ tự các giá trị trong một sample
+METRICS = ('total', 'view', 'db', 'tpl', 'queries')
+SAMPLE_FIELDS = ('total_ms', 'view_ms', 'db_ms', 'tpl_ms', 'queries')
+
+_current = ContextVar('kpi_request_timing', default=None)
+_render = Template.render
+
+
+class RequestTiming:
+    """Counters of the current request (shared with its worker threads, hence the lock)."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.tpl = 0.0
+        self.shapes = Counter()
+        self.view_start = None
+        self.lock = threading.Lock()
+
+    def add_query(self, sql, seconds):
+        shape = fingerprint(sql)
+        with self.lock:
+            self.queries += 1
+            self.db += seconds
+            self.shapes[shape] += 1
+
+    def add_template(self, seconds):
+        with self.lock:
+            self.tpl += seconds
+
+
+def _record_query(execute, sql, params, many, context):
+    timing = _current.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timing.add_query(sql, time.perf_counter() - start)
+
+
+def _timed_render(self, context=None, request=None):
+    timing = _current.get()
+    if timing is None:
+        return _render(self, context, request)
+    start = time.perf_counter()
+    try:
+        return _render(self, context, request)
+    finally:
+        timing.add_template(time.perf_counter() - start)
+
+
+def _install_query_timer(connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def instrument():
+    """Hook the query and template timers in (idempotent)."""
+    Template.render = _timed_render
+    # Kết nối đã có của luồng hiện tại, và mọi kết nối mở sau này (kể cả worker thread)
+    connection_created.connect(_install_query_timer, dispatch_uid='kpi_app.request_timing')
+    for connection in connections.all():
+        _install_query_timer(connection)
+
+
+def is_enabled():
+    return getattr(settings, 'KPI_REQUEST_TIMING', False)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(pct / 100 * len(ordered)) - 1, 0)]
+
+
+def record_sample(name, sample, limit):
+    """
+    Store a sample as one alk_request_timing row (one INSERT, nothing read back).
+    Every `limit` rows the older samples beyond the last `limit` per URL are deleted.
+    """
+    row = alk_request_timing.objects.create(url_name=name, **dict(zip(SAMPLE_FIELDS, sample)))
+    if row.pk % limit == 0:
+        trim_samples(limit)
+
+
+def trim_samples(limit):
+    samples = alk_request_timing.objects.order_by()
+    for name in samples.values_list('url_name', flat=True).distinct():
+        cutoff = samples.filter(url_name=name).order_by('-id').values_list('id', flat=True)[limit:limit + 1]
+        if cutoff:
+            samples.filter(url_name=name, id__lte=cutoff[0]).delete()
+
+
+def timing_summary(limit=None):
+    """One row per URL name: sample count and p50 / p95 of every metric, slowest p95 first."""
+    limit = limit or getattr(settings, 'KPI_REQUEST_TIMING_SAMPLES', DEFAULT_SAMPLES)
+    by_name = {}
+    # Một query; số dòng được giới hạn nhờ trim_samples
+    for name, *sample in alk_request_timing.objects.order_by('url_name', '-id').values_list('url_name', *SAMPLE_FIELDS):
+        samples = by_name.setdefault(name, [])
+        if len(samples) < limit:
+            samples.append(sample)
+    rows = []
+    for name, samples in by_name.items():
+        row = {'url_name': name, 'count': len(samples)}
+        for metric, values in zip(METRICS, zip(*samples)):
+            row[metric] = {'p50': percentile(values, 50), 'p95': percentile(values, 95)}
+        rows.append(row)
+    rows.sort(key=lambda row: -row['total']['p95'])
+    return rows
+
+
+def reset_timings():
+    alk_request_timing.objects.all().delete()
+
+
+class RequestTimingMiddleware:
+    """Put it first in MIDDLEWARE so that the total covers the whole middleware stack."""
+
+    def __init__(self, get_response):
+        if not is_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_ms = getattr(settings, 'KPI_SLOW_REQUEST_MS', DEFAULT_SLOW_REQUEST_MS)
+        self.samples = getattr(settings, 'KPI_REQUEST_TIMING_SAMPLES', DEFAULT_SAMPLES)
+        self.max_repeats = getattr(settings, 'KPI_MAX_QUERY_REPEATS', DEFAULT_MAX_REPEATS)
+        instrument()
+
+    def __call__(self, request):
+        timing = RequestTiming()
+        token = _current.set(timing)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        end = time.perf_counter()
+
+        total_ms = (end - start) * 1000
+        # View: từ process_view đến khi response quay lại (gồm cả phần xử lý response của middleware bên trong)
+        view_ms = (end - timing.view_start) * 1000 if timing.view_start is not None else 0.0
+        db_ms, tpl_ms = timing.db * 1000, timing.tpl * 1000
+        response['Server-Timing'] = (
+            f'db;dur={db_ms:.1f};desc="{timing.queries} queries", tpl;dur={tpl_ms:.1f}, '
+            f'view;dur={view_ms:.1f}, total;dur={total_ms:.1f}'
+        )
+
+        match = request.resolver_match
+        if match is not None:
+            try:
+                record_sample(match.view_name, (total_ms, view_ms, db_ms, tpl_ms, timing.queries), self.samples)
+            except DatabaseError:
+                # Không để việc đo làm hỏng request (vd. bảng chưa migrate)
+                logger.exception("Could not store request timing sample")
+        if total_ms >= self.slow_ms:
+            logger.warning(
+                "%s %s %s %.0fms view=%.0fms db=%.0fms queries=%d tpl=%.0fms url_name=%s user=%s",
+                request.method, request.get_full_path(), response.status_code, total_ms, view_ms,
+                db_ms, timing.queries, tpl_ms, match.view_name if match else '-',
+                getattr(getattr(request, 'user', None), 'username', '') or '-',
+            )
+        for shape, count in timing.shapes.most_common(3):
+            if count <= self.max_repeats:
+                break
+            logger.warning(
+                "%s %s repeated query shape (N+1?) %dx url_name=%s: %s",
+                request.method, request.get_full_path(), count, match.view_name if match else '-', shape,
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        _current.get().view_start = time.perf_counter()
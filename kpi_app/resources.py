@@ -1,6 +1,7 @@
 from import_export import resources, fields
 from import_export.widgets import BooleanWidget, ForeignKeyWidget, Widget
 
+from .formatting import format_result
 from .models import alk_dept, alk_job_title, alk_kpi, alk_perspective, alk_dept_objective, alk_dept_group, alk_employee, alk_kpi_result
 from django.contrib.auth.models import User
 
@@ -106,12 +107,18 @@ class alk_kpiResource(resources.ModelResource):
     class Meta:
         model = alk_kpi
         import_id_fields = ('kpi_name',)
-        fields = ('kpi_name', 'perspective','dept_obj',  'kpi_type', 'percentage_cal', 'get_1_is_zero','from_sap', 'percent_display','active')
+        fields = ('kpi_name', 'perspective','dept_obj',  'kpi_type', 'percentage_cal', 'get_1_is_zero','from_sap', 'percent_display','active', 'anomaly_high', 'anomaly_low')
     # Chỉ import/export các trường này.
 
 class EmployeeUsernameWidget(Widget):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache = {}  # username -> alk_employee, nạp sẵn trong before_import
+
     def clean(self, value, row=None, *args, **kwargs):
         from .models import alk_employee
+        if value in self.cache:
+            return self.cache[value]
         try:
             return alk_employee.objects.get(user_id__username=value)
         except alk_employee.DoesNotExist:
@@ -119,6 +126,18 @@ class EmployeeUsernameWidget(Widget):
     def render(self, value, obj=None):
         return value.user_id.username if value and value.user_id else ''
 
+class CachedForeignKeyWidget(ForeignKeyWidget):
+    """ForeignKeyWidget đọc từ cache nạp sẵn (giá trị -> object), fallback về query."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache = {}
+
+    def clean(self, value, row=None, **kwargs):
+        if value in self.cache:
+            return self.cache[value]
+        return super().clean(value, row, **kwargs)
+
 class AlkKpiResultImportResource(resources.ModelResource):
     year = fields.Field(attribute='year', column_name='year')
     semester = fields.Field(attribute='semester', column_name='semester')
@@ -130,7 +149,7 @@ class AlkKpiResultImportResource(resources.ModelResource):
     kpi = fields.Field(
         attribute='kpi',
         column_name='kpi',
-        widget=ForeignKeyWidget(alk_kpi, 'kpi_name')
+        widget=CachedForeignKeyWidget(alk_kpi, 'kpi_name')
     )
     weigth = fields.Field(attribute='weigth', column_name='weigth')
     min = fields.Field(attribute='min', column_name='min')
@@ -147,6 +166,23 @@ class AlkKpiResultImportResource(resources.ModelResource):
             'year', 'semester', 'employee', 'kpi', 'weigth', 'min', 'target_set', 'max', 'target_input', 'achivement', 'month'
         )
         export_order = fields
+
+    def before_import(self, dataset, **kwargs):
+        # Nạp sẵn employee / kpi một lần cho cả file thay vì một query mỗi dòng
+        # (file lớn nên dùng lệnh bulk_import_kpi_results)
+        if 'employee' in dataset.headers:
+            self.fields['employee'].widget.cache = {
+                e.user_id.username: e for e in alk_employee.objects.select_related('user_id')
+                .filter(user_id__username__in=set(dataset['employee']))
+            }
+        if 'kpi' in dataset.headers:
+            kpis = {}
+            for kpi in alk_kpi.objects.filter(kpi_name__in=set(dataset['kpi'])):
+                kpis.setdefault(kpi.kpi_name, []).append(kpi)
+            # Tên KPI trùng: để widget tự query và báo lỗi như cũ
+            self.fields['kpi'].widget.cache = {name: items[0] for name, items in kpis.items() if len(items) == 1}
+        return super().before_import(dataset, **kwargs)
+
 class AlkKpiResultExportResource(resources.ModelResource):
     get_dept = fields.Field(column_name='get_dept')
     get_employee_userid = fields.Field(column_name='get_employee_userid')
@@ -183,20 +219,21 @@ class AlkKpiResultExportResource(resources.ModelResource):
         return obj.kpi.dept_obj.objective_name if obj.kpi and obj.kpi.dept_obj else ''
     def dehydrate_get_kpi_name(self, obj):
         return obj.kpi.kpi_name if obj.kpi else ''
+    # Cùng định dạng với các cột *_1f trong admin (kpi_app.formatting)
     def dehydrate_weigth_percent_1f(self, obj):
-        return f"{round(obj.weigth * 100, 1)}%" if obj.weigth is not None else ''
+        return format_result(obj)['weigth']
     def dehydrate_min_1f(self, obj):
-        return f"{round(obj.min, 1)}" if obj.min is not None else ''
+        return format_result(obj)['min']
     def dehydrate_target_set_1f(self, obj):
-        return f"{round(obj.target_set, 1)}" if obj.target_set is not None else ''
+        return format_result(obj)['target_set']
     def dehydrate_max_1f(self, obj):
-        return f"{round(obj.max, 1)}" if obj.max is not None else ''
+        return format_result(obj)['max']
     def dehydrate_target_input_1f(self, obj):
-        return f"{round(obj.target_input, 1)}" if obj.target_input is not None else ''
+        return format_result(obj)['target_input']
     def dehydrate_achivement_1f(self, obj):
-        return f"{round(obj.achievement, 1)}" if obj.achievement is not None else ''
+        return format_result(obj)['achievement']
     def dehydrate_final_result_percent_1f(self, obj):
-        return f"{round(obj.final_result * 100, 1)}%" if obj.final_result is not None else ''
+        return format_result(obj)['final_result']
     def dehydrate_get_kpi_type(self, obj):
         kpi_type_map = {
             1: "1 - Bigger better result = achieve/target",
@@ -213,6 +250,7 @@ class AlkKpiResultExportResource(resources.ModelResource):
 
     class Meta:
         model = alk_kpi_result
+        exclude = ('updated_at',)
         export_order = (
             'year',
             'semester',
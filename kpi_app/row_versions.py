@@ -0,0 +1,25 @@
+"""
+Row versions of alk_kpi_result for the portal fragment cache.
+
+Every KPI row of the data entry and review tables is cached as a template
+fragment keyed by (result id, updated_at, viewer role), so re-rendering a
+table only renders the rows that changed. updated_at is set by save() and,
+explicitly, by the queryset.update() / bulk_update() paths. A row also shows
+its KPI's name and flags, so changing a KPI touches all of its results.
+"""
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import alk_kpi, alk_kpi_result
+
+
+def touch_results(queryset):
+    """Give every result of `queryset` a new version. Returns the row count."""
+    return queryset.update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=alk_kpi)
+def touch_kpi_results(instance, created, **kwargs):
+    if not created:
+        touch_results(alk_kpi_result.objects.filter(kpi=instance))
@@ -0,0 +1,148 @@
+"""
+Batch scoring engine for alk_kpi_result.
+
+Scores whole querysets column-wise instead of calling
+alk_kpi_result.calculate_final_result() (and touching self.kpi) once per row.
+Branch selection is done with NumPy masks; the arithmetic stays on Decimal
+object arrays so every value matches the per-row method exactly.
+"""
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+from django.db import transaction
+from django.utils import timezone
+
+from .models import alk_kpi_result, alk_kpi_summary
+
+ZERO = Decimal(0)
+ONE = Decimal(1)
+
+# Columns needed to score a row: the result's own inputs plus the KPI flags.
+SCORING_FIELDS = (
+    'id', 'weigth', 'min', 'target_set', 'max', 'target_input', 'achievement',
+    'kpi__kpi_type', 'kpi__percentage_cal', 'kpi__get_1_is_zero',
+)
+
+
+def _column(values):
+    """Object array with None replaced by 0 (same as `value or 0` per row)."""
+    values = np.asarray(values, dtype=object)
+    return np.where(pd.isna(values), ZERO, values)
+
+
+def _divide(numerator, denominator):
+    """Element-wise numerator / denominator, 0 where the denominator is 0."""
+    nonzero = denominator != ZERO
+    return np.where(nonzero, numerator / np.where(nonzero, denominator, ONE), ZERO)
+
+
+def score_frame(frame):
+    """
+    Compute final_result for a DataFrame with SCORING_FIELDS columns.
+
+    Mirrors alk_kpi_result.save(): KPIs without percentage_cal copy target_set
+    into target_input before scoring. Returns a copy with updated
+    target_input and final_result columns.
+    """
+    frame = frame.copy()
+    if frame.empty:
+        frame['final_result'] = pd.Series(dtype=object)
+        return frame
+
+    kpi_type = frame['kpi__kpi_type'].to_numpy()
+    percentage_cal = frame['kpi__percentage_cal'].fillna(False).astype(bool).to_numpy()
+    get_1_is_zero = frame['kpi__get_1_is_zero'].fillna(False).astype(bool).to_numpy()
+
+    raw_target_input = np.where(
+        percentage_cal,
+        frame['target_input'].to_numpy(dtype=object),
+        frame['target_set'].to_numpy(dtype=object),
+    )
+    raw_target_input = np.where(pd.isna(raw_target_input), None, raw_target_input)
+    frame['target_input'] = raw_target_input
+    missing = pd.isna(raw_target_input) | frame['achievement'].isna().to_numpy()
+
+    achievement = _column(frame['achievement'])
+    target_set = _column(frame['target_set'])
+    target_input = _column(raw_target_input)
+    weigth = _column(frame['weigth'])
+    min_val = _column(frame['min'])
+    max_val = _column(frame['max'])
+
+    # Type 3 (mistake): max when there are no mistakes, else target / achievement
+    mistake_result = np.where(achievement == ZERO, max_val, _divide(target_set, achievement))
+
+    # Percentage KPIs compare achievement/target_input against target_set
+    temp_achive = _divide(achievement, target_input)
+    percentage_result = np.where(
+        kpi_type == 1, _divide(temp_achive, target_set),
+        np.where(kpi_type == 2, _divide(target_set, temp_achive), ZERO),
+    )
+    plain_result = np.where(
+        kpi_type == 1, _divide(achievement, target_input),
+        np.where(kpi_type == 2, _divide(target_input, achievement), ZERO),
+    )
+    temp_result = np.where(
+        kpi_type == 3, mistake_result,
+        np.where(percentage_cal, percentage_result, plain_result),
+    )
+
+    # Min/max clamp, then weight
+    weighted = np.where(
+        temp_result < min_val, ZERO,
+        np.where(temp_result > max_val, max_val * weigth, temp_result * weigth),
+    )
+    get_1_result = np.where(achievement > ZERO, ZERO, weigth * max_val)
+
+    frame['final_result'] = np.where(
+        missing, ZERO, np.where(get_1_is_zero, get_1_result, weighted)
+    )
+    return frame
+
+
+def results_frame(queryset):
+    """Load the scoring columns of a queryset into a DataFrame."""
+    return pd.DataFrame.from_records(
+        list(queryset.values(*SCORING_FIELDS)), columns=SCORING_FIELDS
+    )
+
+
+def rescore_queryset(queryset, batch_size=2000, progress=None):
+    """
+    Re-score every row of `queryset` and write target_input / final_result
+    back with bulk_update, one transaction per batch, then refresh the
+    affected alk_kpi_summary rows. `progress(done, total)` is called after
+    each batch. Returns the row count.
+    """
+    total = queryset.count() if progress else None
+    rows = queryset.order_by('pk').values(*SCORING_FIELDS).iterator(chunk_size=batch_size)
+    updated = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            updated += _write_batch(batch)
+            batch = []
+            if progress:
+                progress(updated, total)
+    if batch:
+        updated += _write_batch(batch)
+    if progress:
+        progress(updated, total)
+    alk_kpi_summary.refresh_queryset(queryset)
+    return updated
+
+
+def _write_batch(rows):
+    scored = score_frame(pd.DataFrame.from_records(rows, columns=SCORING_FIELDS))
+    now = timezone.now()
+    objs = [
+        alk_kpi_result(id=int(pk), target_input=target_input, final_result=final_result, updated_at=now)
+        for pk, target_input, final_result in zip(
+            scored['id'], scored['target_input'], scored['final_result']
+        )
+    ]
+    with transaction.atomic():
+        alk_kpi_result.objects.bulk_update(objs, ['target_input', 'final_result', 'updated_at'])
+    return len(objs)
@@ -0,0 +1,27 @@
+"""
+Whether the default cache is shared by every server process.
+
+The employee context, filter choices and period catalogue are invalidated by
+bumping a version key in the default cache, which only reaches the processes
+that read that same cache. With a per-process backend (LocMemCache, which
+Django uses when settings has no CACHES) a change saved in one wfastcgi
+worker would leave the other workers on stale data, and for the employee
+context that is a stale manager scope. Those caches are then kept for the
+current request only.
+
+KPI_SHARED_CACHE = True / False overrides the detection, e.g. True for a
+single-process runserver with LocMemCache.
+"""
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+PER_PROCESS_BACKENDS = (LocMemCache, DummyCache)
+
+
+def cache_is_shared():
+    shared = getattr(settings, 'KPI_SHARED_CACHE', None)
+    if shared is not None:
+        return bool(shared)
+    return not isinstance(caches[DEFAULT_CACHE_ALIAS], PER_PROCESS_BACKENDS)
@@ -0,0 +1,283 @@
+"""
+Synthetic organisation and KPI results, to reproduce production-sized data
+locally (generate_kpi_data, benchmark_views, load tests).
+
+Everything generated is marked: usernames start with 'syn_' and the names of
+departments, groups, job titles, perspectives, objectives and KPIs start with
+'SYN ', so clear() removes exactly what generate() created. Rows are written
+with bulk_create (SQLite or MySQL) and scored with the batch scoring engine;
+the summary table is filled from the new rows and the cached catalogues are
+invalidated, as bulk_import does.
+"""
+import math
+import random
+from decimal import Decimal
+
+import pandas as pd
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .employee_context import invalidate_employee_contexts
+from .filter_choices import invalidate_filter_choices
+from .models import (
+    alk_dept, alk_dept_group, alk_dept_objective, alk_employee, alk_job_title,
+    alk_kpi, alk_kpi_result, alk_kpi_summary, alk_perspective,
+)
+from .period_catalogue import invalidate_period_catalogue
+from .periods import period_code
+from .scoring import SCORING_FIELDS, score_frame
+
+PREFIX = 'SYN '
+USER_PREFIX = 'syn_'
+MONTHS = [value for value, _ in alk_kpi_result.MONTH_CHOICES]
+PERSPECTIVES = ('Financial', 'Customer', 'Internal Process', 'Learning & Growth')
+# Tỉ lệ loại KPI / cờ gần với dữ liệu thật
+KPI_TYPE_WEIGHTS = {1: 70, 2: 20, 3: 10}
+FLAG_RATES = {'from_sap': 0.15, 'percentage_cal': 0.2, 'get_1_is_zero': 0.05, 'percent_display': 0.3}
+LEVEL_WEIGHTS = {2: 20, 3: 40, 4: 40}
+BATCH_SIZE = 5000
+
+MIN_RATIO = Decimal('0.4')
+MAX_RATIO = Decimal('1.4')
+
+
+def periods(end_year, semesters):
+    """The `semesters` most recent (year, semester) up to end_year 2nd SEM, newest first."""
+    result = []
+    year, semester = end_year, '2nd SEM'
+    for _ in range(semesters):
+        result.append((year, semester))
+        year, semester = (year, '1st SEM') if semester == '2nd SEM' else (year - 1, '2nd SEM')
+    return result
+
+
+def employees_for(results, kpis_per_employee=8, semesters=2):
+    """Number of employees needed for about `results` result rows."""
+    return max(math.ceil(results / (kpis_per_employee * semesters * len(MONTHS))), 1)
+
+
+def exists():
+    return User.objects.filter(username__startswith=USER_PREFIX).exists()
+
+
+def generate(employees=200, groups=4, depts_per_group=5, job_titles=20, objectives=10, kpis=60,
+             kpis_per_employee=8, semesters=2, end_year=2025, password=None, seed=0,
+             batch_size=BATCH_SIZE, progress=None):
+    """Create the org and every monthly result; returns the row counts."""
+    rng = random.Random(seed)
+    org = _create_org(rng, groups, depts_per_group, job_titles, objectives, kpis)
+    staff = _create_employees(rng, org, employees, password)
+    kpi_list = org['kpis']
+    weight = (Decimal(1) / kpis_per_employee).quantize(Decimal('0.001'))
+    latest = periods(end_year, semesters)[0]
+
+    def rows():
+        for employee in staff:
+            for kpi in rng.sample(kpi_list, min(kpis_per_employee, len(kpi_list))):
+                base = _targets(rng, kpi)
+                for year, semester in periods(end_year, semesters):
+                    for month in MONTHS:
+                        # Kỳ cũ đã duyệt hết, kỳ mới nhất còn khoảng một nửa đang chờ
+                        locked = (year, semester) != latest or rng.random() < 0.5
+                        yield employee, kpi, year, semester, month, base, locked
+
+    total = len(staff) * min(kpis_per_employee, len(kpi_list)) * semesters * len(MONTHS)
+    created = 0
+    batch = []
+    for row in rows():
+        batch.append(row)
+        if len(batch) >= batch_size:
+            created += _write_results(rng, batch, weight)
+            batch = []
+            if progress:
+                progress(created, total)
+    if batch:
+        created += _write_results(rng, batch, weight)
+        if progress:
+            progress(created, total)
+
+    # Nhân viên mới hoàn toàn: tổng hợp thẳng từ kết quả, không cần xoá trước
+    results = alk_kpi_result.objects.filter(employee__user_id__username__startswith=USER_PREFIX)
+    alk_kpi_summary.objects.bulk_create(
+        (alk_kpi_summary(**row) for row in alk_kpi_summary.aggregate(results).iterator(chunk_size=2000)),
+        batch_size=2000,
+    )
+    _invalidate_caches()
+    return {
+        'groups': groups, 'depts': len(org['depts']), 'kpis': len(kpi_list),
+        'employees': len(staff), 'results': created,
+    }
+
+
+def clear(batch_size=200):
+    """Delete everything generate() created. Returns the number of deleted results."""
+    employee_ids = list(
+        alk_employee.objects.filter(user_id__username__startswith=USER_PREFIX).values_list('id', flat=True)
+    )
+    deleted = 0
+    for start in range(0, len(employee_ids), batch_size):
+        chunk = employee_ids[start:start + batch_size]
+        with transaction.atomic():
+            alk_kpi_summary.objects.filter(employee__in=chunk).delete()
+            deleted += alk_kpi_result.objects.filter(employee__in=chunk).delete()[1].get(
+                alk_kpi_result._meta.label, 0
+            )
+    with transaction.atomic():
+        User.objects.filter(username__startswith=USER_PREFIX).delete()
+        alk_kpi.objects.filter(kpi_name__startswith=PREFIX).delete()
+        for model, field in ((alk_dept, 'dept_name'), (alk_dept_group, 'group_name'),
+                             (alk_job_title, 'job_title'), (alk_dept_objective, 'objective_name'),
+                             (alk_perspective, 'perspective_name')):
+            model.objects.filter(**{f'{field}__startswith': PREFIX}).delete()
+    _invalidate_caches()
+    return deleted
+
+
+def benchmark_users():
+    """(level 0 admin, a dept manager, one of the manager's staff) of the generated org."""
+    employees = alk_employee.objects.select_related('user_id').filter(user_id__username__startswith=USER_PREFIX)
+    admin = employees.filter(level=0).order_by('id').first()
+    # Quản lý trực tiếp của phòng: level 1, hoặc level 0 ở phòng không có level 1
+    managers = {e.dept_id: e for e in employees.filter(level__lte=1).order_by('level', '-id')}
+    staff = employees.filter(level__gte=2, dept__in=list(managers)).order_by('id').first()
+    return admin, managers.get(staff.dept_id) if staff else None, staff
+
+
+def latest_period():
+    """(year, semester) of the newest generated results."""
+    row = alk_kpi_result.objects.filter(
+        employee__user_id__username__startswith=USER_PREFIX
+    ).order_by('-period_code').values('year', 'semester').first()
+    return (row['year'], row['semester']) if row else None
+
+
+def _create_org(rng, groups, depts_per_group, job_titles, objectives, kpis):
+    perspectives = _bulk_create(alk_perspective, 'perspective_name', [
+        alk_perspective(perspective_name=f'{PREFIX}{name}') for name in PERSPECTIVES
+    ])
+    objective_objs = _bulk_create(alk_dept_objective, 'objective_name', [
+        alk_dept_objective(objective_name=f'{PREFIX}Objective {o + 1}') for o in range(objectives)
+    ])
+    kpi_types = list(KPI_TYPE_WEIGHTS)
+    return {
+        'groups': {g.group_name: g for g in _bulk_create(alk_dept_group, 'group_name', [
+            alk_dept_group(group_name=f'{PREFIX}Group {g + 1}') for g in range(groups)
+        ])},
+        'depts': _bulk_create(alk_dept, 'dept_name', [
+            alk_dept(dept_name=f'{PREFIX}Dept {g + 1}.{d + 1:02d}', group=f'{PREFIX}Group {g + 1}')
+            for g in range(groups) for d in range(depts_per_group)
+        ]),
+        'titles': _bulk_create(alk_job_title, 'job_title', [
+            alk_job_title(job_title=f'{PREFIX}Title {t + 1:03d}') for t in range(job_titles)
+        ]),
+        'kpis': _bulk_create(alk_kpi, 'kpi_name', [
+            alk_kpi(
+                kpi_name=f'{PREFIX}KPI {k + 1:03d}',
+                dept_obj=rng.choice(objective_objs),
+                perspective=rng.choice(perspectives),
+                kpi_type=rng.choices(kpi_types, weights=KPI_TYPE_WEIGHTS.values())[0],
+                **{flag: rng.random() < rate for flag, rate in FLAG_RATES.items()},
+            )
+            for k in range(kpis)
+        ]),
+    }
+
+
+def _bulk_create(model, field, objs):
+    """bulk_create, then read the rows back by name when the backend does not return pks (MySQL)."""
+    objs = model.objects.bulk_create(objs)
+    if all(obj.pk is not None for obj in objs):
+        return objs
+    return list(model.objects.filter(**{f'{field}__startswith': PREFIX}).order_by(field))
+
+
+def _create_employees(rng, org, count, password):
+    """One level 0 per group (also staff / superuser for the admin), one level 1 per dept, the rest 2-4."""
+    depts = org['depts']
+    levels = list(LEVEL_WEIGHTS)
+    plan = []
+    seen_groups = set()
+    for i in range(count):
+        dept = depts[i % len(depts)]
+        if i < len(depts):
+            level = 0 if dept.group not in seen_groups else 1
+            seen_groups.add(dept.group)
+        else:
+            level = rng.choices(levels, weights=LEVEL_WEIGHTS.values())[0]
+        plan.append((f'{USER_PREFIX}{i + 1:06d}', dept, level))
+
+    hashed = make_password(password) if password else make_password(None)
+    first_admin = plan[0][0]
+    User.objects.bulk_create(
+        (User(username=username, password=hashed, first_name='Synthetic', last_name=username,
+              is_staff=username == first_admin, is_superuser=username == first_admin)
+         for username, _, _ in plan),
+        batch_size=BATCH_SIZE,
+    )
+    users = dict(User.objects.filter(username__startswith=USER_PREFIX).values_list('username', 'id'))
+    alk_employee.objects.bulk_create(
+        (alk_employee(
+            user_id_id=users[username], name=f'Synthetic {username[len(USER_PREFIX):]}',
+            job_title=rng.choice(org['titles']), dept=dept, dept_gr=org['groups'][dept.group], level=level,
+        ) for username, dept, level in plan),
+        batch_size=BATCH_SIZE,
+    )
+    return list(alk_employee.objects.filter(user_id__username__startswith=USER_PREFIX).order_by('id'))
+
+
+def _targets(rng, kpi):
+    """(target_set, target_input) of one employee / KPI, kept across months."""
+    if kpi.kpi_type == 3:
+        return Decimal(rng.randint(1, 3)), None
+    if kpi.percentage_cal:
+        return Decimal(rng.choice(('0.8', '0.9', '0.95', '1'))), Decimal(rng.randrange(50, 500, 10))
+    return Decimal(rng.randrange(20, 1000, 5)), None
+
+
+def _achievement(rng, kpi, target_set, target_input):
+    ratio = Decimal(rng.randint(30, 135)) / 100
+    if kpi.get_1_is_zero or kpi.kpi_type == 3:
+        return Decimal(rng.choice((0, 0, 0, 1, 2, 4)))
+    if kpi.percentage_cal:
+        value = target_input * target_set * (ratio if kpi.kpi_type == 1 else 1 / ratio)
+    else:
+        value = target_set * (ratio if kpi.kpi_type == 1 else 1 / ratio)
+    return value.quantize(Decimal('0.0001'))
+
+
+def _write_results(rng, batch, weight):
+    frame_rows = []
+    values = []
+    for employee, kpi, year, semester, month, (target_set, target_input), locked in batch:
+        achievement = _achievement(rng, kpi, target_set, target_input)
+        values.append((employee, kpi, year, semester, month, target_set, achievement, locked))
+        frame_rows.append({
+            'id': None, 'weigth': weight, 'min': MIN_RATIO, 'target_set': target_set, 'max': MAX_RATIO,
+            'target_input': target_input, 'achievement': achievement,
+            'kpi__kpi_type': kpi.kpi_type, 'kpi__percentage_cal': kpi.percentage_cal,
+            'kpi__get_1_is_zero': kpi.get_1_is_zero,
+        })
+    scored = score_frame(pd.DataFrame.from_records(frame_rows, columns=SCORING_FIELDS))
+    now = timezone.now()
+    objs = [
+        alk_kpi_result(
+            employee=employee, kpi=kpi, year=year, semester=semester, month=month,
+            weigth=weight, min=MIN_RATIO, max=MAX_RATIO, target_set=target_set, target_input=target_input,
+            achievement=achievement, final_result=final_result, is_locked=locked,
+            period_code=period_code(year, semester, month), updated_at=now,
+        )
+        for (employee, kpi, year, semester, month, target_set, achievement, locked), target_input, final_result
+        in zip(values, scored['target_input'], scored['final_result'])
+    ]
+    with transaction.atomic():
+        alk_kpi_result.objects.bulk_create(objs)
+    return len(objs)
+
+
+def _invalidate_caches():
+    # bulk_create / delete theo lô không gửi đủ post_save
+    invalidate_employee_contexts()
+    invalidate_filter_choices()
+    invalidate_period_catalogue()
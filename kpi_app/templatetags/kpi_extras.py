@@ -1,4 +1,5 @@
 from django import template
+from django.utils.html import format_html_join
 
 register = template.Library()
 
@@ -16,3 +17,16 @@ def param_replace(context, **kwargs):
     for k in [k for k, v in d.items() if not v]:
         del d[k]
     return d.urlencode()
+
+
+@register.simple_tag
+def admin_row_attrs(cl, index):
+    """
+    Attributes of the index-th changelist row, from the ModelAdmin's
+    get_row_attrs(obj) hook if it has one.
+    """
+    get_row_attrs = getattr(cl.model_admin, 'get_row_attrs', None)
+    if get_row_attrs is None:
+        return ''
+    attrs = get_row_attrs(cl.result_list[index])
+    return format_html_join('', ' {}="{}"', attrs.items())
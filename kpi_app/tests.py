@@ -1,3 +1,1676 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+import openpyxl
+import pandas as pd
+import tablib
+from asgiref.sync import async_to_sync
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.db.models import Count
+from django.template.loader import render_to_string
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, modify_settings, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    alk_dept, alk_dept_group, alk_dept_objective, alk_employee, alk_job_title,
+    alk_job, alk_kpi, alk_kpi_result, alk_kpi_summary, alk_perspective, alk_request_timing,
+)
+from .admin import KpiUserFilter
+from .bulk_import import BulkImportError, import_kpi_results
+from .employee_context import get_employee_context
+from .exports import EXPORT_HEADERS, iter_export_rows
+from .formatting import VALUE_FIELDS, attach_formats, format_frame, format_values
+from .filter_choices import VERSION_KEY as FILTER_CHOICES_VERSION_KEY, dept_choices, kpi_choices, year_choices
+from .jobs import claim_next_job, enqueue, fail_stale_jobs
+from .paginators import EstimatedCountPaginator
+from .period_catalogue import all_periods, employee_periods, team_periods
+from .periods import period_code, period_lookup
+from .query_shapes import DEFAULT_MAX_REPEATS, fingerprint, track_query_shapes
+from .ranking import SCOPE_COMPANY, SCOPE_DEPT, SCOPE_GROUP, employee_ranking
+from .request_timing import record_sample, reset_timings, timing_summary
+from .resources import AlkKpiResultExportResource, AlkKpiResultImportResource
+from .row_versions import touch_results
+from .scoring import SCORING_FIELDS, rescore_queryset, score_frame
+from .shared_cache import cache_is_shared
+from . import jobs, load_simulation, query_fanout, synthetic_data
+from . import urls as kpi_urls
+
+
+class KpiTestDataMixin:
+    """Builds a small org (dept, group, job title, KPI) shared by the test cases."""
+
+    def setUp(self):
+        cache.clear()
+        self.dept = alk_dept.objects.create(dept_name='Finance', group='Back Office')
+        self.dept_gr = alk_dept_group.objects.create(group_name='Back Office')
+        self.job_title = alk_job_title.objects.create(job_title='Accountant')
+        self.kpi = alk_kpi.objects.create(
+            kpi_name='Closing accuracy',
+            dept_obj=alk_dept_objective.objects.create(objective_name='Accurate books'),
+            perspective=alk_perspective.objects.create(perspective_name='Internal'),
+        )
+
+    def make_employee(self, username, level=2, dept=None):
+        user = User.objects.create(username=username)
+        return alk_employee.objects.create(
+            user_id=user, name=username, job_title=self.job_title,
+            dept=dept or self.dept, dept_gr=self.dept_gr, level=level,
+        )
+
+    def make_result(self, employee, kpi=None, year=2025, semester='2nd SEM', month='1st', **kwargs):
+        values = {
+            'weigth': Decimal('0.2'), 'target_set': Decimal('100'),
+            'achievement': Decimal('90'), 'is_locked': False,
+        }
+        values.update(kwargs)
+        return alk_kpi_result.objects.create(
+            year=year, semester=semester, month=month,
+            employee=employee, kpi=kpi or self.kpi, **values
+        )
+
+
+class QueryBudgetMixin:
+    """assertQueryBudget: at most `max_queries` queries, no SQL shape repeated more than `max_repeats` times."""
+
+    @contextmanager
+    def assertQueryBudget(self, max_queries=None, max_repeats=DEFAULT_MAX_REPEATS, label=''):
+        with track_query_shapes() as shapes:
+            yield shapes
+        self.assertFalse(shapes.repeated(max_repeats), f"{label} repeated query shapes (N+1?):\n{shapes.report(max_repeats)}")
+        if max_queries is not None:
+            self.assertLessEqual(shapes.total, max_queries, f"{label} ran {shapes.total} queries")
+
+
+class ManagerDashboardQueryCountTests(KpiTestDataMixin, TestCase):
+    """The manager dashboard must not issue one query per team member."""
+
+    def setUp(self):
+        super().setUp()
+        self.manager = self.make_employee('manager', level=1)
+        self.client.force_login(self.manager.user_id)
+
+    def add_team_members(self, count):
+        for i in range(count):
+            emp = self.make_employee(f'staff{alk_employee.objects.count()}_{i}')
+            if i % 3:
+                self.make_result(emp, is_locked=bool(i % 2))
+
+    def dashboard_query_count(self):
+        url = reverse('manager_dashboard') + '?year=2025&semester=2nd SEM&month=1st'
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_query_count_does_not_grow_with_team_size(self):
+        self.add_team_members(3)
+        small_team_queries, _ = self.dashboard_query_count()
+        self.add_team_members(30)
+        large_team_queries, _ = self.dashboard_query_count()
+        self.assertEqual(small_team_queries, large_team_queries)
+
+    def test_team_status_counts(self):
+        approved = self.make_employee('approved')
+        self.make_result(approved, is_locked=True)
+        pending = self.make_employee('pending')
+        self.make_result(pending, is_locked=True)
+        self.make_result(pending, month='1st', is_locked=False,
+                         kpi=alk_kpi.objects.create(kpi_name='Second', dept_obj=self.kpi.dept_obj,
+                                                    perspective=self.kpi.perspective))
+        self.make_employee('nodata')
+
+        _, response = self.dashboard_query_count()
+        statuses = {m['employee'].name: m['status'] for m in response.context['team_data']}
+        self.assertEqual(statuses['approved'], 'Approved')
+        self.assertEqual(statuses['pending'], 'Pending')
+        self.assertEqual(statuses['nodata'], 'No Data')
+        self.assertEqual(response.context['stats']['done'], 1)
+        self.assertEqual(
+            sorted(m['employee'].name for m in response.context['missing_kpi_employees']),
+            ['manager', 'nodata'],
+        )
+
+
+class ManagerDashboardAnomalyTests(KpiTestDataMixin, TestCase):
+    """Anomalies are selected, ordered and paginated in the database, with per-KPI thresholds."""
+
+    def setUp(self):
+        super().setUp()
+        manager = self.make_employee('manager', level=1)
+        self.client.force_login(manager.user_id)
+        self.strict_kpi = alk_kpi.objects.create(
+            kpi_name='Strict', dept_obj=self.kpi.dept_obj, perspective=self.kpi.perspective,
+            anomaly_high=Decimal('2.0'), anomaly_low=Decimal('0.1'),
+        )
+
+    def add_result(self, final_result, kpi=None):
+        result = self.make_result(self.make_employee(f'staff{alk_employee.objects.count()}'), kpi=kpi)
+        alk_kpi_result.objects.filter(pk=result.pk).update(final_result=Decimal(final_result))
+        return result
+
+    def anomalies(self, page=1):
+        url = reverse('manager_dashboard') + f'?year=2025&semester=2nd SEM&month=1st&anomaly_page={page}'
+        return self.client.get(url).context['anomalies']
+
+    def test_per_kpi_thresholds(self):
+        typo = self.add_result('1.5')
+        low = self.add_result('0.3')
+        self.add_result('0.8')
+        self.add_result('1.5', kpi=self.strict_kpi)
+        self.add_result('0.3', kpi=self.strict_kpi)
+        strict_low = self.add_result('0.05', kpi=self.strict_kpi)
+
+        page = self.anomalies()
+        self.assertEqual(page.paginator.count, 3)
+        self.assertEqual([a.id for a in page], [strict_low.id, low.id, typo.id])
+        self.assertEqual([a.alert_reason for a in page], ['LOW', 'LOW', 'TYPO'])
+
+    def test_anomalies_paginated_in_database(self):
+        for i in range(12):
+            self.add_result(f'0.{i % 4}')
+        with CaptureQueriesContext(connection) as ctx:
+            page = self.anomalies(page=3)
+        self.assertEqual(page.paginator.count, 12)
+        self.assertEqual(len(page), 2)
+        self.assertTrue(any('LIMIT 2 OFFSET 10' in q['sql'] for q in ctx.captured_queries))
+
+
+class BatchScoringEquivalenceTests(SimpleTestCase):
+    """score_frame() must agree exactly with alk_kpi_result.calculate_final_result()."""
+
+    def random_decimal(self, rng, places, allow_none=True):
+        choice = rng.random()
+        if allow_none and choice < 0.1:
+            return None
+        if choice < 0.25:
+            return Decimal(0)
+        if choice < 0.35:
+            return Decimal(rng.choice(['0.0005', '0.125', '1', '0.4', '1.4', '-2.5']))
+        return Decimal(rng.randint(-2000, 500000)).scaleb(-places)
+
+    def random_result(self, rng):
+        kpi = alk_kpi(
+            kpi_type=rng.choice([1, 2, 3]),
+            percentage_cal=rng.random() < 0.5,
+            get_1_is_zero=rng.random() < 0.15,
+        )
+        return alk_kpi_result(
+            kpi=kpi,
+            weigth=self.random_decimal(rng, 3),
+            min=self.random_decimal(rng, 3, allow_none=False),
+            target_set=self.random_decimal(rng, 4),
+            max=self.random_decimal(rng, 3, allow_none=False),
+            target_input=self.random_decimal(rng, 4),
+            achievement=self.random_decimal(rng, 4),
+        )
+
+    def per_row_score(self, result):
+        # Same preprocessing as alk_kpi_result.save()
+        if result.kpi.percentage_cal is False:
+            result.target_input = result.target_set
+        return result.calculate_final_result()
+
+    def test_matches_per_row_method(self):
+        for seed in range(20):
+            rng = random.Random(seed)
+            results = [self.random_result(rng) for _ in range(250)]
+            frame = pd.DataFrame.from_records([{
+                'id': i, 'weigth': r.weigth, 'min': r.min, 'target_set': r.target_set,
+                'max': r.max, 'target_input': r.target_input, 'achievement': r.achievement,
+                'kpi__kpi_type': r.kpi.kpi_type, 'kpi__percentage_cal': r.kpi.percentage_cal,
+                'kpi__get_1_is_zero': r.kpi.get_1_is_zero,
+            } for i, r in enumerate(results)], columns=SCORING_FIELDS)
+
+            scored = score_frame(frame)
+            for result, final_result, target_input in zip(
+                results, scored['final_result'], scored['target_input']
+            ):
+                expected = self.per_row_score(result)
+                self.assertEqual(final_result, expected, msg=f"seed={seed} {vars(result)}")
+                self.assertEqual(target_input, result.target_input)
+
+    def test_empty_frame(self):
+        scored = score_frame(pd.DataFrame(columns=SCORING_FIELDS))
+        self.assertEqual(len(scored), 0)
+        self.assertIn('final_result', scored.columns)
+
+
+class RescoreQuerysetTests(KpiTestDataMixin, TestCase):
+
+    def test_rescore_writes_same_result_as_save(self):
+        emp = self.make_employee('staff')
+        pct_kpi = alk_kpi.objects.create(
+            kpi_name='Margin', dept_obj=self.kpi.dept_obj, perspective=self.kpi.perspective,
+            kpi_type=2, percentage_cal=True,
+        )
+        rows = [
+            self.make_result(emp, month='1st'),
+            self.make_result(emp, month='2nd', achievement=Decimal('130')),
+            self.make_result(emp, kpi=pct_kpi, month='1st', target_set=Decimal('0.35'),
+                             target_input=Decimal('200'), achievement=Decimal('80')),
+            self.make_result(emp, month='3rd', achievement=None),
+        ]
+        expected = {r.pk: alk_kpi_result.objects.get(pk=r.pk).final_result for r in rows}
+
+        alk_kpi_result.objects.update(final_result=None)
+        self.assertEqual(rescore_queryset(alk_kpi_result.objects.all(), batch_size=3), 4)
+
+        for r in alk_kpi_result.objects.all():
+            self.assertEqual(r.final_result, expected[r.pk])
+
+    def test_command_filters_by_period(self):
+        emp = self.make_employee('staff')
+        first = self.make_result(emp, month='1st')
+        second = self.make_result(emp, month='2nd')
+        alk_kpi_result.objects.update(final_result=None)
+
+        call_command('rescore_kpi_results', year=2025, semester='2nd SEM', month='1st', stdout=StringIO())
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.final_result, Decimal('0.180'))
+        self.assertIsNone(second.final_result)
+
+
+class KpiSummarySyncTests(KpiTestDataMixin, TestCase):
+    """alk_kpi_summary must follow every write path of alk_kpi_result."""
+
+    def setUp(self):
+        super().setUp()
+        self.emp = self.make_employee('staff')
+        self.kpi2 = alk_kpi.objects.create(
+            kpi_name='Second', dept_obj=self.kpi.dept_obj, perspective=self.kpi.perspective,
+        )
+
+    def summary(self, month='1st'):
+        return alk_kpi_summary.objects.get(employee=self.emp, year=2025, semester='2nd SEM', month=month)
+
+    def test_save_and_delete_keep_summary_in_sync(self):
+        first = self.make_result(self.emp)
+        self.make_result(self.emp, kpi=self.kpi2, achievement=Decimal('50'), is_locked=True)
+        summary = self.summary()
+        self.assertEqual(summary.kpi_count, 2)
+        self.assertEqual(summary.locked_count, 1)
+        self.assertEqual(summary.total_score, Decimal('0.280'))
+        self.assertEqual(summary.approved_score, Decimal('0.100'))
+
+        first.achievement = Decimal('100')
+        first.save()
+        self.assertEqual(self.summary().total_score, Decimal('0.300'))
+
+        first.delete()
+        self.assertEqual(self.summary().kpi_count, 1)
+
+    def test_manager_toggle_approval_updates_summary(self):
+        manager = self.make_employee('manager', level=1)
+        result = self.make_result(self.emp)
+        self.client.force_login(manager.user_id)
+        self.client.post(reverse('manager_toggle_approval', args=[self.emp.id]), {
+            'selected_kpi': [result.id], 'action': 'approve',
+        })
+        summary = self.summary()
+        self.assertEqual(summary.locked_count, 1)
+        self.assertEqual(summary.approved_score, Decimal('0.180'))
+
+    def test_rebuild_command(self):
+        self.make_result(self.emp, month='1st')
+        self.make_result(self.emp, month='2nd')
+        alk_kpi_summary.objects.all().delete()
+        call_command('rebuild_kpi_summary', stdout=StringIO())
+        self.assertEqual(alk_kpi_summary.objects.count(), 2)
+        self.assertEqual(self.summary('2nd').kpi_count, 1)
+
+    def test_reports_rank_from_summary(self):
+        manager = self.make_employee('manager', level=1)
+        other = self.make_employee('other')
+        self.make_result(self.emp, is_locked=True)
+        self.make_result(other, achievement=Decimal('120'), is_locked=True)
+        self.make_result(other, kpi=self.kpi2, is_locked=False)
+        self.client.force_login(manager.user_id)
+        response = self.client.get(reverse('manager_reports'), {
+            'year': 2025, 'semester': '2nd SEM', 'month': '1st',
+        })
+        ranking = [(row['name'], row['score']) for row in response.context['page_obj']]
+        self.assertEqual(ranking, [('other', 24.0), ('staff', 18.0)])
+
+
+class ExplainKpiQueriesCommandTests(KpiTestDataMixin, TestCase):
+
+    def test_canonical_queries_use_indexes(self):
+        manager = self.make_employee('manager', level=1)
+        self.make_result(manager)
+        out = StringIO()
+        call_command('explain_kpi_queries', username='manager', stdout=out)
+        self.assertIn('[manager_dashboard]', out.getvalue())
+        self.assertNotIn('FULL SCAN: kpi_app_alk_kpi_result', out.getvalue())
+
+
+class PeriodCodeTests(SimpleTestCase):
+
+    def test_period_code(self):
+        self.assertEqual(period_code(2025, '2nd SEM', 'final'), 202526)
+        self.assertEqual(period_code('2025', ' 1st sem ', 'Final'), 202516)
+        self.assertEqual(period_code(2025, '2nd', '1st'), 202521)
+        self.assertIsNone(period_code(2025, 'SEM', '1st'))
+        self.assertIsNone(period_code(None, '1st SEM', '1st'))
+
+    def test_period_lookup(self):
+        self.assertEqual(period_lookup(2025, '2nd SEM', '1st'), {'period_code': 202521})
+        self.assertEqual(period_lookup(2025, '2nd SEM', 'All'), {'period_code__range': (202520, 202529)})
+        self.assertEqual(period_lookup(2025, '2nd SEM'), {'period_code__range': (202520, 202529)})
+        self.assertEqual(period_lookup('2025', 'All', 'final'), {'period_code__in': [202516, 202526]})
+        self.assertEqual(period_lookup('All', '2nd sem', 'Final'), {'semester': '2nd SEM', 'month': 'final'})
+        self.assertEqual(period_lookup(2025, 'bogus', '1st'), {'pk__in': []})
+
+    def test_benchmark_compares_the_same_rows(self):
+        # Lệnh dừng với CommandError nếu hai vế của một trường hợp trả về số dòng khác nhau
+        out = StringIO()
+        call_command('benchmark_period_lookups', rows=3000, years=3, employees=50, repeat=1, stdout=out)
+        self.assertEqual(out.getvalue().count('period_code'), 4)
+
+
+class PeriodFilterViewTests(KpiTestDataMixin, TestCase):
+
+    def test_review_matches_month_case_insensitively(self):
+        manager = self.make_employee('manager', level=1)
+        emp = self.make_employee('staff')
+        final = self.make_result(emp, month='final')
+        self.make_result(emp, month='1st')
+        self.assertEqual(final.period_code, 202526)
+
+        self.client.force_login(manager.user_id)
+        response = self.client.get(reverse('manager_review_employee', args=[emp.id]), {
+            'year': 2025, 'semester': '2nd SEM', 'month': 'Final',
+        })
+        self.assertEqual([r.id for r in response.context['page_obj']], [final.id])
+
+
+class SaveKpiBatchTests(KpiTestDataMixin, TestCase):
+    """One POST saves every changed cell of a period."""
+
+    def setUp(self):
+        super().setUp()
+        self.emp = self.make_employee('staff')
+        self.client.force_login(self.emp.user_id)
+
+    def make_kpis(self, count):
+        return [
+            alk_kpi.objects.create(
+                kpi_name=f'KPI {alk_kpi.objects.count()}', dept_obj=self.kpi.dept_obj,
+                perspective=self.kpi.perspective,
+            )
+            for _ in range(count)
+        ]
+
+    def post_batch(self, cells, **extra):
+        data = {'year': 2025, 'semester': '2nd SEM', 'month': '1st'}
+        data.update({f'achievement-{result.id}': value for result, value in cells.items()})
+        data.update(extra)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('portal_save_kpi_batch'), data)
+        return response, len(ctx.captured_queries)
+
+    def test_saves_and_scores_all_rows(self):
+        first = self.make_result(self.emp)
+        second = self.make_result(self.emp, kpi=self.make_kpis(1)[0])
+        response, _ = self.post_batch({first: '100', second: '1,000'})
+        self.assertEqual(response.status_code, 200)
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.achievement, Decimal('100'))
+        self.assertEqual(first.final_result, Decimal('0.200'))
+        self.assertEqual(second.achievement, Decimal('1000'))
+        self.assertEqual(second.final_result, Decimal('0.280'))  # capped at max
+        summary = alk_kpi_summary.objects.get(employee=self.emp, period_code=202521)
+        self.assertEqual(summary.total_score, Decimal('0.480'))
+        self.assertContains(response, f'id="row-{first.id}"')
+        self.assertContains(response, '48.00%')
+
+    def test_manager_may_edit_own_locked_row_like_single_save(self):
+        manager = self.make_employee('manager', level=1)
+        own = self.make_result(manager, is_locked=True)
+        staff_row = self.make_result(self.emp, is_locked=True)
+        response, _ = self.post_batch({staff_row: '50'})
+        self.assertContains(response, 'record is locked', status_code=400)
+
+        self.client.force_login(manager.user_id)
+        response, _ = self.post_batch({own: '100'})
+        self.assertEqual(response.status_code, 200)
+        own.refresh_from_db()
+        self.assertEqual(own.achievement, Decimal('100'))
+        single = self.client.post(reverse('portal_save_kpi', args=[own.id]), {'achievement': '90'})
+        self.assertEqual(single.status_code, 200)
+
+    def test_input_form_posts_to_batch_endpoint(self):
+        result = self.make_result(self.emp)
+        response = self.client.get(reverse('portal_input'), {
+            'year': 2025, 'semester': '2nd SEM', 'month': '1st',
+        })
+        self.assertContains(response, reverse('portal_save_kpi_batch'))
+        self.assertContains(response, f'name="achievement-{result.id}"')
+
+    def test_query_count_does_not_grow_with_row_count(self):
+        self.post_batch({})  # warm the employee context cache
+        small = {self.make_result(self.emp, kpi=kpi): '95' for kpi in self.make_kpis(3)}
+        _, small_queries = self.post_batch(small)
+        large = {self.make_result(self.emp, kpi=kpi, month='2nd'): '95' for kpi in self.make_kpis(20)}
+        _, large_queries = self.post_batch(large, month='2nd')
+        self.assertEqual(small_queries, large_queries)
+
+    def test_invalid_value_writes_nothing(self):
+        first = self.make_result(self.emp)
+        second = self.make_result(self.emp, kpi=self.make_kpis(1)[0])
+        response, _ = self.post_batch({first: '100', second: 'abc'})
+        self.assertEqual(response.status_code, 400)
+        first.refresh_from_db()
+        self.assertEqual(first.achievement, Decimal('90'))
+
+    def test_locked_rows_need_a_manager(self):
+        result = self.make_result(self.emp, is_locked=True)
+        response, _ = self.post_batch({result: '100'})
+        self.assertEqual(response.status_code, 400)
+
+        manager = self.make_employee('manager', level=1)
+        self.client.force_login(manager.user_id)
+        response, _ = self.post_batch({result: '100'}, employee_id=self.emp.id)
+        self.assertEqual(response.status_code, 200)
+        result.refresh_from_db()
+        self.assertEqual(result.achievement, Decimal('100'))
+
+    def test_other_department_is_rejected(self):
+        other_dept = alk_dept.objects.create(dept_name='Sales', group='Front Office')
+        outsider = self.make_employee('outsider', level=1, dept=other_dept)
+        result = self.make_result(self.emp)
+        self.client.force_login(outsider.user_id)
+        response, _ = self.post_batch({result: '100'}, employee_id=self.emp.id)
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(KPI_SHARED_CACHE=True)
+class EmployeeContextTests(KpiTestDataMixin, TestCase):
+    """The requester's employee / scope is resolved once and cached until alk_employee changes."""
+
+    def setUp(self):
+        super().setUp()
+        self.manager = self.make_employee('manager', level=1)
+        self.staff = self.make_employee('staff')
+
+    def request_for(self, employee):
+        request = RequestFactory().get('/')
+        request.user = employee.user_id
+        return request
+
+    def test_resolved_once_per_request_and_cached(self):
+        request = self.request_for(self.manager)
+        with CaptureQueriesContext(connection) as ctx:
+            context = get_employee_context(request)
+            self.assertIs(get_employee_context(request), context)
+        self.assertEqual(len(ctx.captured_queries), 2)  # employee + team ids
+        self.assertTrue(context.is_manager)
+        self.assertTrue(context.in_scope(self.staff.id))
+
+        with self.assertNumQueries(0):
+            get_employee_context(self.request_for(self.manager))
+
+    @override_settings(KPI_SHARED_CACHE=False)
+    def test_per_process_cache_keeps_context_per_request(self):
+        # LocMemCache của mỗi worker không nhận được invalidation từ worker khác -> không giữ qua request
+        request = self.request_for(self.manager)
+        with self.assertNumQueries(2):
+            self.assertIs(get_employee_context(request), get_employee_context(request))
+        with self.assertNumQueries(2):
+            get_employee_context(self.request_for(self.manager))
+
+    def test_shared_cache_detection(self):
+        with override_settings(KPI_SHARED_CACHE=None, CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        }):
+            self.assertFalse(cache_is_shared())
+        with override_settings(KPI_SHARED_CACHE=None, CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp/kpi'},
+        }):
+            self.assertTrue(cache_is_shared())
+
+    def test_employee_change_invalidates_cache(self):
+        get_employee_context(self.request_for(self.manager))
+        other_dept = alk_dept.objects.create(dept_name='Sales', group='Front Office')
+        self.staff.dept = other_dept
+        self.staff.save()
+        context = get_employee_context(self.request_for(self.manager))
+        self.assertFalse(context.in_scope(self.staff.id))
+
+    def test_scope_by_level(self):
+        other_dept = alk_dept.objects.create(dept_name='Treasury', group='Back Office')
+        colleague = self.make_employee('colleague', dept=other_dept)
+        group_manager = self.make_employee('group_manager', level=0, dept=other_dept)
+        self.assertTrue(get_employee_context(self.request_for(group_manager)).in_scope(self.staff.id))
+        self.assertFalse(get_employee_context(self.request_for(self.manager)).in_scope(colleague.id))
+        staff_context = get_employee_context(self.request_for(self.staff))
+        self.assertEqual(staff_context.team_scope_ids, {self.staff.id})
+
+
+class StreamingExportTests(KpiTestDataMixin, TestCase):
+    maxDiff = None
+
+    def setUp(self):
+        super().setUp()
+        self.emp = self.make_employee('staff')
+        self.make_result(self.emp, month='1st')
+        self.make_result(self.emp, month='2nd', achievement=None)
+
+    def test_rows_match_export_resource(self):
+        queryset = alk_kpi_result.objects.order_by('pk')
+        dataset = AlkKpiResultExportResource().export(queryset)
+        self.assertEqual(list(dataset.headers), EXPORT_HEADERS)
+        streamed = list(iter_export_rows(queryset))
+        self.assertEqual([[str(v) for v in row] for row in streamed],
+                         [[str(v) for v in row] for row in dataset])
+
+    def test_export_formats_match_admin_columns(self):
+        # target_set_1f của export từng bỏ qua percent_display
+        kpi = alk_kpi.objects.create(
+            kpi_name='Share', dept_obj=self.kpi.dept_obj, perspective=self.kpi.perspective, percent_display=True,
+        )
+        result = self.make_result(self.emp, kpi=kpi, target_set=Decimal('3'), achievement=Decimal('3'))
+        model_admin = admin.site._registry[alk_kpi_result]
+        dataset = AlkKpiResultExportResource().export(alk_kpi_result.objects.filter(pk=result.pk))
+        streamed = next(iter_export_rows(alk_kpi_result.objects.filter(pk=result.pk)))
+        self.assertEqual(dataset.dict[0]['target_set_1f'], model_admin.target_set_1f(result))
+        self.assertEqual(streamed[EXPORT_HEADERS.index('target_set_1f')], '300.000%')
+
+    def test_reads_in_fixed_size_chunks(self):
+        for month in ('3rd', '4th', '5th'):
+            self.make_result(self.emp, month=month)
+        with self.assertNumQueries(3):  # 2 + 2 + 1 rows
+            rows = list(iter_export_rows(alk_kpi_result.objects.all(), chunk_size=2))
+        self.assertEqual(len(rows), 5)
+
+    def test_stream_view_scopes_and_filters(self):
+        other_dept = alk_dept.objects.create(dept_name='Sales', group='Front Office')
+        self.make_result(self.make_employee('outsider', dept=other_dept))
+        self.client.force_login(self.make_employee('manager', level=1).user_id)
+        response = self.client.get(reverse('export_alk_kpi_result_stream'), {
+            'year': 2025, 'semester': '2nd SEM', 'month': '1st', 'format': 'csv',
+        })
+        lines = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['year', 'semester', 'get_dept'])
+        self.assertEqual(len(lines), 2)
+        self.assertIn('staff', lines[1])
+
+        response = self.client.get(reverse('export_alk_kpi_result_stream'))
+        workbook = openpyxl.load_workbook(BytesIO(b''.join(response.streaming_content)), read_only=True)
+        self.assertEqual(len(list(workbook.active.iter_rows())), 3)
+
+
+class BulkImportTests(KpiTestDataMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.emp = self.make_employee('staff')
+        self.pct_kpi = alk_kpi.objects.create(
+            kpi_name='Collection rate', dept_obj=self.kpi.dept_obj,
+            perspective=self.kpi.perspective, percentage_cal=True,
+        )
+
+    def template_row(self, **values):
+        row = {
+            'year': 2025, 'semester': '2nd SEM', 'employee': 'staff', 'kpi': 'Closing accuracy',
+            'weigth': 0.2, 'min': 0.4, 'target_set': 100, 'max': 1.4, 'target_input': None,
+            'achivement': 90, 'month': '1st',
+        }
+        row.update(values)
+        return row
+
+    def test_matches_per_row_save(self):
+        rows = [
+            self.template_row(),
+            self.template_row(month='2nd', achivement='1,250.5'),
+            self.template_row(kpi='Collection rate', target_set=0.95, target_input=200, achivement=180),
+        ]
+        self.assertEqual(import_kpi_results(rows), {'created': 3, 'updated': 0})
+        imported = {
+            (r.kpi_id, r.month): (r.target_input, r.final_result, r.period_code)
+            for r in alk_kpi_result.objects.all()
+        }
+        alk_kpi_result.objects.all().delete()
+
+        for row in rows:
+            kpi = alk_kpi.objects.get(kpi_name=row['kpi'])
+            achievement = Decimal(str(row['achivement']).replace(',', ''))
+            target_input = None if row['target_input'] is None else Decimal(str(row['target_input']))
+            result = alk_kpi_result.objects.create(
+                year=2025, semester='2nd SEM', month=row['month'], employee=self.emp, kpi=kpi,
+                weigth=Decimal('0.2'), min=Decimal('0.4'), max=Decimal('1.4'),
+                target_set=Decimal(str(row['target_set'])), target_input=target_input, achievement=achievement,
+            )
+            result.refresh_from_db()
+            self.assertEqual(imported[(kpi.id, row['month'])],
+                             (result.target_input, result.final_result, result.period_code))
+
+    def test_upsert_keeps_unlisted_columns(self):
+        existing = self.make_result(self.emp, is_locked=True, max=Decimal('1.2'))
+        rows = [{'year': '2025', 'semester': '2nd SEM', 'employee': 'staff',
+                 'kpi': 'Closing accuracy', 'month': '1st', 'achivement': '200'}]
+        self.assertEqual(import_kpi_results(rows), {'created': 0, 'updated': 1})
+        existing.refresh_from_db()
+        self.assertEqual(existing.achievement, Decimal('200'))
+        self.assertEqual(existing.final_result, Decimal('0.240'))  # capped at the stored max 1.2
+        self.assertTrue(existing.is_locked)
+        summary = alk_kpi_summary.objects.get(employee=self.emp, period_code=202521)
+        self.assertEqual(summary.total_score, Decimal('0.240'))
+
+    def test_errors_write_nothing(self):
+        rows = [self.template_row(), self.template_row(employee='ghost'), self.template_row(kpi='Nope', month='2nd')]
+        with self.assertRaises(BulkImportError) as ctx:
+            import_kpi_results(rows)
+        self.assertEqual(len(ctx.exception.errors), 2)
+        self.assertIn('Row 3', ctx.exception.errors[0])
+        self.assertFalse(alk_kpi_result.objects.exists())
+
+    def test_query_count_does_not_grow_with_row_count(self):
+        months = ('1st', '2nd', '3rd', '4th', '5th', 'final')
+        with CaptureQueriesContext(connection) as small:
+            import_kpi_results([self.template_row(month=m) for m in months[:2]])
+        with CaptureQueriesContext(connection) as large:
+            import_kpi_results([self.template_row(month=m, semester=s)
+                                for m in months for s in ('1st SEM', '2nd SEM')])
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+        self.assertEqual(alk_kpi_result.objects.count(), 12)
+
+    def test_each_batch_commits_before_progress(self):
+        depth = len(connection.atomic_blocks)
+        calls = []
+
+        def progress(done, total):
+            # Không còn trong transaction của lô; các dòng của lô đã ghi xong
+            calls.append((done, total, len(connection.atomic_blocks), alk_kpi_result.objects.count()))
+
+        months = ('1st', '2nd', '3rd', '4th', '5th')
+        import_kpi_results([self.template_row(month=m) for m in months], batch_size=2, progress=progress)
+        self.assertEqual(calls, [(2, 5, depth, 2), (4, 5, depth, 4), (5, 5, depth, 5)])
+
+    def test_command_reads_csv(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(self.template_row()))
+            writer.writeheader()
+            writer.writerow(self.template_row())
+        self.addCleanup(os.remove, f.name)
+        out = StringIO()
+        call_command('bulk_import_kpi_results', f.name, stdout=out)
+        self.assertIn('1 created', out.getvalue())
+        self.assertEqual(alk_kpi_result.objects.get().final_result, Decimal('0.180'))
+
+    def test_admin_resource_uses_preloaded_maps(self):
+        row = self.template_row()
+        dataset = tablib.Dataset(headers=list(row))
+        dataset.append(list(row.values()))
+        result = AlkKpiResultImportResource().import_data(dataset, raise_errors=True)
+        self.assertEqual(result.totals['new'], 1)
+        self.assertEqual(alk_kpi_result.objects.get().final_result, Decimal('0.180'))
+
+
+class BackgroundJobTests(KpiTestDataMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = self.settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.emp = self.make_employee('staff')
+        self.make_result(self.emp)
+        self.client.force_login(self.emp.user_id)
+
+    def run_worker(self):
+        call_command('run_jobs', once=True, stdout=StringIO())
+
+    def test_export_job_end_to_end(self):
+        response = self.client.get(reverse('export_alk_kpi_result_stream'), {
+            'background': 1, 'format': 'csv', 'year': 2025,
+        })
+        job = alk_job.objects.get()
+        self.assertRedirects(response, reverse('job_detail', args=[job.id]))
+        self.assertEqual(self.client.get(reverse('job_status', args=[job.id])).json()['status'], 'queued')
+
+        self.run_worker()
+        status = self.client.get(reverse('job_status', args=[job.id])).json()
+        self.assertEqual((status['status'], status['percent'], status['processed']), ('done', 100, 1))
+        response = self.client.get(status['download_url'])
+        lines = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(len(lines), 2)
+
+        other = self.make_employee('other')
+        self.client.force_login(other.user_id)
+        self.assertEqual(self.client.get(reverse('job_download', args=[job.id])).status_code, 403)
+
+    def test_import_job(self):
+        upload = SimpleUploadedFile('template.csv', (
+            "year,semester,employee,kpi,weigth,target_set,achivement,month\n"
+            "2025,2nd SEM,staff,Closing accuracy,0.2,100,100,2nd\n"
+        ).encode('utf-8'))
+        job = enqueue('import_kpi_results', user=self.emp.user_id, input_file=upload)
+        self.run_worker()
+        job.refresh_from_db()
+        self.assertEqual(job.status, alk_job.STATUS_DONE, job.message)
+        self.assertEqual(job.message, "1 created, 0 updated.")
+        self.assertEqual(alk_kpi_result.objects.get(month='2nd').final_result, Decimal('0.200'))
+
+    def test_concurrency_limit_per_type(self):
+        running = enqueue('rescore_kpi_results', params={'year': 2025})
+        alk_job.objects.filter(pk=running.pk).update(status=alk_job.STATUS_RUNNING)
+        enqueue('rescore_kpi_results', params={'year': 2025})
+        export = enqueue('export_kpi_results', user=self.emp.user_id)
+        self.assertEqual(claim_next_job(), export)
+        self.assertIsNone(claim_next_job())
+        with self.settings(KPI_JOB_CONCURRENCY={'rescore_kpi_results': 2}):
+            self.assertEqual(claim_next_job().job_type, 'rescore_kpi_results')
+
+    def racing_claims(self):
+        """claim_next_job('a') in which worker 'b' claims first, between 'a' reading a job and claiming it."""
+        real_claim = jobs._claim
+        claims = {}
+
+        def claim(job, worker):
+            if worker == 'a' and 'b' not in claims:
+                claims['b'] = None
+                claims['b'] = claim_next_job('b')
+            return real_claim(job, worker)
+
+        with mock.patch.object(jobs, '_claim', side_effect=claim):
+            return claim_next_job('a'), claims['b']
+
+    def test_racing_claims_respect_limit(self):
+        first = enqueue('rescore_kpi_results', params={'year': 2025})
+        enqueue('rescore_kpi_results', params={'year': 2025})
+        claimed_a, claimed_b = self.racing_claims()
+        # b nhận job đầu; a thua cuộc đua và giới hạn 1 job chạy không cho a nhận job thứ hai
+        self.assertEqual((claimed_b, claimed_b.worker), (first, 'b'))
+        self.assertIsNone(claimed_a)
+        self.assertEqual(alk_job.objects.filter(status=alk_job.STATUS_RUNNING).count(), 1)
+
+    def test_racing_claims_never_run_a_job_twice(self):
+        first = enqueue('export_kpi_results', user=self.emp.user_id)
+        second = enqueue('export_kpi_results', user=self.emp.user_id)
+        claimed_a, claimed_b = self.racing_claims()
+        self.assertEqual((claimed_b, claimed_a), (first, second))
+        self.assertEqual(
+            dict(alk_job.objects.values_list('pk', 'worker')), {first.pk: 'b', second.pk: 'a'}
+        )
+
+    def test_failed_and_stale_jobs(self):
+        job = enqueue('rescore_kpi_results', params={})  # year missing -> KeyError
+        self.run_worker()
+        job.refresh_from_db()
+        self.assertEqual(job.status, alk_job.STATUS_FAILED)
+        self.assertIn('KeyError', job.message)
+
+        stale = enqueue('rescore_kpi_results', params={'year': 2025})
+        alk_job.objects.filter(pk=stale.pk).update(
+            status=alk_job.STATUS_RUNNING, updated_at=timezone.now() - timedelta(hours=1),
+        )
+        self.assertEqual(fail_stale_jobs(), 1)
+
+    def test_worker_survives_database_errors(self):
+        job = enqueue('rescore_kpi_results', params={'year': 2025})
+        command = 'kpi_app.management.commands.run_jobs'
+        with mock.patch(f'{command}.close_old_connections') as close, mock.patch(f'{command}.time.sleep'), \
+                mock.patch(f'{command}.claim_next_job', side_effect=[OperationalError('gone away'), job, None]), \
+                mock.patch(f'{command}.run_job', side_effect=OperationalError('Deadlock found')), \
+                mock.patch(f'{command}.logger') as logger:
+            alk_job.objects.filter(pk=job.pk).update(status=alk_job.STATUS_RUNNING)
+            call_command('run_jobs', once=True, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual((close.call_count, logger.exception.call_count), (2, 2))
+        # Job đã nhận nhưng không chạy xong vì lỗi DB -> failed ngay, không đợi quá hạn
+        job.refresh_from_db()
+        self.assertEqual(job.status, alk_job.STATUS_FAILED)
+        self.assertIn('Deadlock found', job.message)
+
+    def test_admin_import_and_export_buttons_queue_jobs(self):
+        admin_user = User.objects.create(username='admin', is_staff=True, is_superuser=True)
+        self.make_result(self.emp, month='2nd')
+        self.client.force_login(admin_user)
+        self.assertRedirects(
+            self.client.get(reverse('admin:kpi_app_alk_kpi_result_import')),
+            reverse('admin:kpi_app_alk_kpi_result_bulk_import'),
+        )
+        # Nút Export mang theo bộ lọc của changelist
+        response = self.client.get(reverse('admin:kpi_app_alk_kpi_result_export'), {'month': '2nd', 'format': 'csv'})
+        job = alk_job.objects.get()
+        self.assertRedirects(response, reverse('job_detail', args=[job.id]), fetch_redirect_response=False)
+        self.run_worker()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.message), (alk_job.STATUS_DONE, "Exported 1 row(s)."))
+        self.assertTrue(job.result_file.name.endswith('.csv'))
+
+    def test_home_excel_report_is_a_job(self):
+        self.make_result(self.make_employee('other', dept=alk_dept.objects.create(dept_name='Plant', group='Factory')))
+        response = self.client.get(reverse('export_alk_kpi_result'), {'year': 2025})
+        job = alk_job.objects.get()
+        self.assertRedirects(response, reverse('job_detail', args=[job.id]))
+        self.run_worker()
+        job.refresh_from_db()
+        sheet = openpyxl.load_workbook(job.result_file.path).active
+        rows = list(sheet.iter_rows(values_only=True))
+        self.assertEqual(rows[0][:4], ('Year', 'Semester', 'Month', 'Employee User ID'))
+        # Chỉ phòng của người xuất, như trang home
+        self.assertEqual([row[3] for row in rows[1:]], ['staff'])
+
+    def test_admin_bulk_import_page_queues_job(self):
+        admin_user = User.objects.create(username='admin', is_staff=True, is_superuser=True)
+        self.client.force_login(admin_user)
+        bulk_url = reverse('admin:kpi_app_alk_kpi_result_bulk_import')
+        self.assertContains(self.client.get(reverse('admin:kpi_app_alk_kpi_result_changelist')), bulk_url)
+        response = self.client.post(bulk_url, {
+            'import_file': SimpleUploadedFile('template.csv', b'year,semester,employee,kpi,month\n'),
+        })
+        job = alk_job.objects.get()
+        self.assertEqual(job.job_type, 'import_kpi_results')
+        self.assertRedirects(response, reverse('job_detail', args=[job.id]))
+        self.assertContains(self.client.get(reverse('job_detail', args=[job.id])), 'Background Job')
+
+
+class AdminChangelistQueryCountTests(KpiTestDataMixin, TestCase):
+    """The alk_kpi_result changelist issues the same number of queries whatever the page holds."""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create(username='admin', is_staff=True, is_superuser=True))
+
+    def add_results(self, count):
+        for i in range(count):
+            self.make_result(self.make_employee(f'staff{alk_employee.objects.count()}'))
+
+    def changelist_query_count(self, query=''):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('admin:kpi_app_alk_kpi_result_changelist') + query)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_query_count_is_constant_per_page(self):
+        self.add_results(3)
+        small_page_queries, _ = self.changelist_query_count()
+        self.add_results(12)
+        full_page_queries, response = self.changelist_query_count()
+        self.assertEqual(len(response.context['cl'].result_list), 15)
+        self.assertEqual(small_page_queries, full_page_queries)
+        self.add_results(20)
+        self.assertEqual(self.changelist_query_count('?p=2')[0], full_page_queries)
+
+    def test_approved_rows_are_highlighted_by_the_server(self):
+        locked = self.make_result(self.make_employee('locked'), is_locked=True)
+        self.make_result(self.make_employee('pending'))
+        _, response = self.changelist_query_count()
+        self.assertContains(response, '<tr class="row-locked">', count=1)
+        locked_url = reverse('admin:kpi_app_alk_kpi_result_change', args=[locked.id])
+        self.assertRegex(response.content.decode(), rf'<tr class="row-locked">((?!</tr>).)*{locked_url}')
+        self.assertNotContains(response, 'admin_lock_highlight.js')
+
+    def test_estimated_count_only_for_large_unfiltered_querysets(self):
+        self.add_results(3)
+        with mock.patch('kpi_app.paginators.estimated_row_count', return_value=500000):
+            self.assertEqual(EstimatedCountPaginator(alk_kpi_result.objects.all(), 15).count, 500000)
+            filtered = alk_kpi_result.objects.filter(year=2025)
+            self.assertEqual(EstimatedCountPaginator(filtered, 15).count, 3)
+        with mock.patch('kpi_app.paginators.estimated_row_count', return_value=10):
+            self.assertEqual(EstimatedCountPaginator(alk_kpi_result.objects.all(), 15).count, 3)
+        # SQLite không có số ước lượng -> đếm chính xác
+        self.assertEqual(EstimatedCountPaginator(alk_kpi_result.objects.all(), 15).count, 3)
+
+
+@override_settings(KPI_SHARED_CACHE=True)
+class FilterChoicesTests(KpiTestDataMixin, TestCase):
+    """Admin filter choices are cached per scope and dropped when results / KPIs / employees change."""
+
+    def setUp(self):
+        super().setUp()
+        self.other_dept = alk_dept.objects.create(dept_name='Sales', group='Front Office')
+        self.manager = self.make_employee('manager', level=1)
+        self.make_result(self.make_employee('staff'), year=2024)
+        self.other_kpi = alk_kpi.objects.create(
+            kpi_name='Revenue', dept_obj=self.kpi.dept_obj, perspective=self.kpi.perspective,
+        )
+        self.make_result(self.make_employee('seller', dept=self.other_dept), kpi=self.other_kpi, year=2025)
+
+    def request_for(self, user):
+        request = RequestFactory().get('/admin/')
+        request.user = user
+        return request
+
+    def test_choices_follow_scope(self):
+        admin_request = self.request_for(User.objects.create(username='admin', is_superuser=True))
+        self.assertEqual(year_choices(admin_request), [(2024, '2024'), (2025, '2025')])
+        self.assertEqual(len(dept_choices(admin_request)), 2)
+        self.assertEqual(len(kpi_choices(admin_request)), 2)
+
+        manager_request = self.request_for(self.manager.user_id)
+        self.assertEqual(year_choices(manager_request), [(2024, '2024')])
+        self.assertEqual(dept_choices(manager_request), [(self.dept.dept_id, 'Finance')])
+        self.assertEqual(
+            KpiUserFilter(manager_request, {}, alk_kpi_result, None).lookup_choices,
+            [(self.kpi.id, 'Closing accuracy')],
+        )
+
+    def test_choices_are_cached_until_results_change(self):
+        request = self.request_for(self.manager.user_id)
+        year_choices(request)
+        with self.assertNumQueries(0):
+            self.assertEqual(year_choices(self.request_for(self.manager.user_id)), [(2024, '2024')])
+
+        # Chỉ nhập số liệu: cache giữ nguyên
+        version = cache.get(FILTER_CHOICES_VERSION_KEY)
+        result = alk_kpi_result.objects.get(year=2024)
+        result.achievement = Decimal('95')
+        result.save()
+        self.assertEqual(cache.get(FILTER_CHOICES_VERSION_KEY), version)
+
+        self.make_result(alk_employee.objects.get(name='staff'), year=2026)
+        self.assertEqual(year_choices(self.request_for(self.manager.user_id)), [(2024, '2024'), (2026, '2026')])
+
+    def test_changelist_filters_do_not_scan_results_when_cached(self):
+        self.client.force_login(User.objects.create(username='admin', is_staff=True, is_superuser=True))
+        url = reverse('admin:kpi_app_alk_kpi_result_changelist')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url + '?year__exact=2025')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['cl'].result_list), 1)
+        self.assertFalse([q for q in ctx.captured_queries if 'DISTINCT' in q['sql']])
+
+
+@override_settings(KPI_SHARED_CACHE=True)
+class PeriodCatalogueTests(KpiTestDataMixin, TestCase):
+    """Dropdown periods are read once per scope and refreshed when the set of periods changes."""
+
+    def setUp(self):
+        super().setUp()
+        self.manager = self.make_employee('manager', level=1)
+        self.staff = self.make_employee('staff')
+        self.make_result(self.staff, year=2024, semester='1st SEM', month='2nd')
+        self.make_result(self.staff, year=2025, semester='2nd SEM', month='1st')
+        self.outsider = self.make_employee('seller', dept=alk_dept.objects.create(dept_name='Sales', group='Front'))
+        self.make_result(self.outsider, year=2023)
+
+    def test_catalogue_per_scope(self):
+        self.assertEqual(all_periods().years, [2025, 2024, 2023])
+        staff_periods = employee_periods(self.staff)
+        self.assertEqual(staff_periods.years, [2025, 2024])
+        self.assertEqual(staff_periods.semesters, ['1st SEM', '2nd SEM'])
+        self.assertEqual(staff_periods.months, ['1st', '2nd'])
+        request = RequestFactory().get('/')
+        request.user = self.manager.user_id
+        self.assertEqual(team_periods(get_employee_context(request)).years, [2025, 2024])
+        self.assertFalse(employee_periods(self.manager))
+
+    def test_catalogue_is_cached_and_invalidated(self):
+        all_periods()
+        with self.assertNumQueries(0):
+            all_periods()
+
+        # Chỉ nhập số liệu: danh mục giữ nguyên trong cache
+        result = alk_kpi_result.objects.get(employee=self.staff, year=2024)
+        result.achievement = Decimal('95')
+        result.save()
+        with self.assertNumQueries(0):
+            all_periods()
+
+        self.make_result(self.staff, year=2026)
+        self.assertEqual(all_periods().years, [2026, 2025, 2024, 2023])
+        result.delete()
+        self.assertEqual(employee_periods(self.staff).years, [2026, 2025])
+
+    @override_settings(KPI_SHARED_CACHE=False)
+    def test_per_process_cache_reads_catalogue_every_time(self):
+        all_periods()
+        with self.assertNumQueries(1):
+            self.assertEqual(all_periods().years, [2025, 2024, 2023])
+
+    def test_views_read_dropdowns_from_catalogue(self):
+        self.client.force_login(self.manager.user_id)
+        for url in ('portal_dashboard', 'portal_input', 'manager_dashboard', 'manager_reports'):
+            self.client.get(reverse(url))
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(reverse(url))
+            self.assertEqual(response.status_code, 200, url)
+            self.assertFalse([q for q in ctx.captured_queries if 'DISTINCT' in q['sql']], url)
+
+
+class EmployeeRankingTests(KpiTestDataMixin, TestCase):
+    """Window-function ranking shared by manager_reports and its Excel export."""
+
+    def setUp(self):
+        super().setUp()
+        self.sales = alk_dept.objects.create(dept_name='Sales', group='Back Office')
+        self.manager = self.make_employee('manager', level=0)
+        for name, achievement, dept in (
+            ('anna', '120', self.dept), ('binh', '120', self.dept), ('chi', '90', self.dept),
+            ('dung', '130', self.sales), ('em', '50', self.sales),
+        ):
+            self.make_result(self.make_employee(name, dept=dept), achievement=Decimal(achievement), is_locked=True)
+
+    def ranks(self, scope):
+        rows = employee_ranking(self.manager, scope, 2025, '2nd SEM', '1st')
+        return [(row['name'], row['rank'], row['dense_rank']) for row in rows]
+
+    def test_ties_share_a_rank(self):
+        self.assertEqual(self.ranks(SCOPE_DEPT), [('anna', 1, 1), ('binh', 1, 1), ('chi', 3, 2)])
+
+    def test_group_and_company_scopes(self):
+        self.assertEqual(
+            [name for name, _, _ in self.ranks(SCOPE_GROUP)], ['dung', 'anna', 'binh', 'chi', 'em'],
+        )
+        other = alk_dept.objects.create(dept_name='Plant', group='Factory')
+        self.make_result(self.make_employee('giang', dept=other), achievement=Decimal('135'), is_locked=True)
+        self.assertEqual(len(self.ranks(SCOPE_GROUP)), 5)
+        self.assertEqual(self.ranks(SCOPE_COMPANY)[0], ('giang', 1, 1))
+        rows = list(employee_ranking(self.manager, SCOPE_COMPANY, 2025, '2nd SEM', '1st'))
+        self.assertEqual(rows[0]['percent_rank'], 0)
+        self.assertEqual(rows[-1]['percent_rank'], 1)
+
+    def test_reports_paginate_in_database_and_export_matches(self):
+        self.client.force_login(self.manager.user_id)
+        params = {'year': 2025, 'semester': '2nd SEM', 'month': '1st', 'scope': SCOPE_GROUP}
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('manager_reports'), params)
+        self.assertEqual(response.context['current_scope'], SCOPE_GROUP)
+        self.assertTrue(any('RANK() OVER' in q['sql'] and 'LIMIT 5' in q['sql'] for q in ctx.captured_queries))
+        screen = [(row['rank'], row['name'], float(row['score'])) for row in response.context['page_obj']]
+
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        with self.settings(MEDIA_ROOT=media_root):
+            response = self.client.get(reverse('export_manager_reports'), params)
+            job = alk_job.objects.get(job_type='export_manager_ranking')
+            self.assertRedirects(response, reverse('job_detail', args=[job.id]))
+            call_command('run_jobs', once=True, stdout=StringIO())
+            response = self.client.get(reverse('job_download', args=[job.id]))
+            sheet = openpyxl.load_workbook(BytesIO(b''.join(response.streaming_content))).active
+        exported = [(row[0], row[1], row[3]) for row in sheet.iter_rows(min_row=2, values_only=True)]
+        self.assertEqual(exported, screen)
+
+    def test_dept_manager_cannot_widen_scope(self):
+        dept_manager = self.make_employee('lead', level=1)
+        self.client.force_login(dept_manager.user_id)
+        response = self.client.get(reverse('manager_reports'), {
+            'year': 2025, 'semester': '2nd SEM', 'month': '1st', 'scope': SCOPE_COMPANY,
+        })
+        self.assertEqual(response.context['current_scope'], SCOPE_DEPT)
+        self.assertEqual([row['name'] for row in response.context['page_obj']], ['anna', 'binh', 'chi'])
+
+
+class FormattingTests(SimpleTestCase):
+    """One formatter for the admin *_1f columns, the portal and the exports."""
+
+    def test_formats_follow_kpi_flags_and_target_set(self):
+        values = dict(weigth=Decimal('0.2'), min=Decimal('0.6'), max=Decimal('1.4'),
+                      target_input=Decimal('0.95'), achievement=Decimal('0.9'), final_result=Decimal('0.19'))
+        number_kpi = format_values(target_set=Decimal('1500'), percentage_cal=False, **values)
+        self.assertEqual(number_kpi['target_set'], '1,500.0000')
+        self.assertEqual(number_kpi['achievement'], '0.9000')
+        self.assertEqual(number_kpi['weigth'], '20.0%')
+        self.assertEqual(number_kpi['final_result'], '19.0%')
+        self.assertEqual(number_kpi['factor'], '95.0%')
+        self.assertEqual(number_kpi['min'], '0.6')
+
+        fraction = format_values(target_set=Decimal('0.95'), percentage_cal=False, **values)
+        self.assertEqual((fraction['target_set'], fraction['target_input']), ('95.000%', '95.000%'))
+        percentage_cal = format_values(target_set=Decimal('0.95'), percentage_cal=True, **values)
+        self.assertEqual((percentage_cal['target_set'], percentage_cal['target_input']), ('95.000%', '0.9500'))
+        display = format_values(target_set=Decimal('3'), percent_display=True, percentage_cal=True, **values)
+        self.assertEqual((display['target_set'], display['achievement']), ('300.000%', '90.000%'))
+        zero = format_values(target_set=Decimal('0'), percent_display=True, percentage_cal=True, **values)
+        self.assertEqual((zero['target_set'], zero['achievement']), ('0.0000', '0.9000'))
+        no_kpi = format_values(target_set=Decimal('0.5'), **values)
+        self.assertEqual(no_kpi['target_set'], '0.5000')
+
+        blank = format_values(None, None, None, None, None, None, None)
+        self.assertEqual(set(blank.values()), {''})
+
+    def test_frame_matches_row_formatter(self):
+        rng = random.Random(7)
+        choices = [None, Decimal('0'), Decimal('0.35'), Decimal('1'), Decimal('2500.5')]
+        rows = [
+            {
+                'weigth': rng.choice([None, Decimal('0'), Decimal('0.25')]),
+                'min': rng.choice([None, Decimal('0.5')]),
+                'target_set': rng.choice(choices),
+                'max': rng.choice([None, Decimal('1.4')]),
+                'target_input': rng.choice(choices),
+                'achievement': rng.choice(choices),
+                'final_result': rng.choice([None, Decimal('0.123')]),
+                'kpi__percent_display': rng.choice([None, False, True]),
+                'kpi__percentage_cal': rng.choice([None, False, True]),
+            }
+            for _ in range(300)
+        ]
+        frame = format_frame(pd.DataFrame.from_records(rows, columns=VALUE_FIELDS))
+        for i, row in enumerate(rows):
+            self.assertEqual(frame.iloc[i].to_dict(), format_values(*(row[name] for name in VALUE_FIELDS)), row)
+
+
+class RowFragmentCacheTests(KpiTestDataMixin, TestCase):
+    """KPI rows are cached per (id, updated_at, role); saves return only the changed rows."""
+
+    def setUp(self):
+        super().setUp()
+        self.emp = self.make_employee('staff')
+        self.manager = self.make_employee('manager', level=1)
+        self.kpi2 = alk_kpi.objects.create(
+            kpi_name='Second', dept_obj=self.kpi.dept_obj, perspective=self.kpi.perspective,
+        )
+        self.client.force_login(self.manager.user_id)
+
+    def review(self):
+        return self.client.get(reverse('manager_review_employee', args=[self.emp.id]), {
+            'year': 2025, 'semester': '2nd SEM', 'month': '1st',
+        })
+
+    def test_rows_come_from_cache_until_version_changes(self):
+        result = self.make_result(self.emp, achievement=Decimal('91'))
+        self.assertContains(self.review(), '91.0000')
+        # update() không đổi updated_at -> dòng vẫn lấy từ cache
+        alk_kpi_result.objects.filter(pk=result.pk).update(achievement=Decimal('77'))
+        self.assertContains(self.review(), '91.0000')
+        touch_results(alk_kpi_result.objects.filter(pk=result.pk))
+        self.assertContains(self.review(), '77.0000')
+
+    def test_review_row_cache_is_keyed_by_role(self):
+        result = self.make_result(self.emp)
+        self.assertContains(self.review(), f'name="achievement_{result.id}"')
+        result = attach_formats([alk_kpi_result.objects.select_related('kpi').get(pk=result.pk)])[0]
+        # Cùng dòng, cùng phiên bản: người xem không phải quản lý không được nhận bản có ô nhập
+        html = render_to_string('kpi_app/portal/partials/review_row.html', {'result': result, 'is_manager': False})
+        self.assertNotIn(f'name="achievement_{result.id}"', html)
+        self.assertNotIn('name="selected_kpi"', html)
+
+    def test_kpi_change_gives_its_results_a_new_version(self):
+        result = self.make_result(self.emp)
+        self.assertContains(self.review(), 'Closing accuracy')
+        self.kpi.kpi_name = 'Closing speed'
+        self.kpi.save()
+        self.assertGreater(alk_kpi_result.objects.get(pk=result.pk).updated_at, result.updated_at)
+        self.assertContains(self.review(), 'Closing speed')
+
+    def test_manager_save_returns_only_the_saved_row(self):
+        first = self.make_result(self.emp)
+        second = self.make_result(self.emp, kpi=self.kpi2)
+        response = self.client.post(reverse('manager_save_kpi', args=[first.id]), {
+            f'achievement_{first.id}': '100',
+        })
+        self.assertNotIn('HX-Trigger', response)
+        self.assertContains(response, f'<tr id="review-row-{first.id}" hx-swap-oob="true">')
+        self.assertNotContains(response, f'review-row-{second.id}')
+        self.assertContains(response, 'id="review-total-score"')
+        self.assertContains(response, '38.00%')
+        first_saved = alk_kpi_result.objects.get(pk=first.pk)
+        self.assertGreater(first_saved.updated_at, first.updated_at)
+        self.assertEqual(alk_kpi_result.objects.get(pk=second.pk).updated_at, second.updated_at)
+
+    def test_manager_save_keeps_old_value_on_invalid_number(self):
+        result = self.make_result(self.emp, achievement=Decimal('90'))
+        response = self.client.post(reverse('manager_save_kpi', args=[result.id]), {
+            f'achievement_{result.id}': 'abc',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(alk_kpi_result.objects.get(pk=result.pk).achievement, Decimal('90'))
+        self.client.post(reverse('manager_save_kpi', args=[result.id]), {f'achievement_{result.id}': '1,250.5'})
+        self.assertEqual(alk_kpi_result.objects.get(pk=result.pk).achievement, Decimal('1250.5'))
+
+    def test_approval_returns_only_rows_whose_status_changed(self):
+        pending = self.make_result(self.emp)
+        approved = self.make_result(self.emp, kpi=self.kpi2, is_locked=True)
+        response = self.client.post(reverse('manager_toggle_approval', args=[self.emp.id]), {
+            'selected_kpi': [pending.id, approved.id], 'action': 'approve',
+        })
+        self.assertNotIn('HX-Trigger', response)
+        self.assertContains(response, 'Approved 2 item(s)')
+        self.assertContains(response, f'<tr id="review-row-{pending.id}" hx-swap-oob="true">')
+        self.assertNotContains(response, f'review-row-{approved.id}')
+        self.assertEqual(alk_kpi_result.objects.get(pk=approved.pk).updated_at, approved.updated_at)
+        self.assertContains(self.review(), 'Currently Approved', count=2)
+
+    def test_batch_save_returns_only_submitted_rows(self):
+        first = self.make_result(self.emp)
+        second = self.make_result(self.emp, kpi=self.kpi2)
+        self.client.force_login(self.emp.user_id)
+        response = self.client.post(reverse('portal_save_kpi_batch'), {
+            'year': 2025, 'semester': '2nd SEM', 'month': '1st', f'achievement-{first.id}': '100',
+        })
+        self.assertContains(response, f'<tr id="row-{first.id}" class="fade-in-up" hx-swap-oob="true">')
+        self.assertNotContains(response, f'row-{second.id}')
+        self.assertNotContains(response, 'No KPIs found')
+        self.assertGreater(alk_kpi_result.objects.get(pk=first.pk).updated_at, first.updated_at)
+
+    def test_bulk_paths_set_a_new_version(self):
+        result = self.make_result(self.emp)
+        rescore_queryset(alk_kpi_result.objects.filter(pk=result.pk))
+        rescored = alk_kpi_result.objects.get(pk=result.pk)
+        self.assertGreater(rescored.updated_at, result.updated_at)
+        import_kpi_results([{
+            'employee': 'staff', 'kpi': 'Closing accuracy', 'year': 2025,
+            'semester': '2nd SEM', 'month': '1st', 'achivement': '95',
+        }])
+        self.assertGreater(alk_kpi_result.objects.get(pk=result.pk).updated_at, rescored.updated_at)
+
+
+class RuntimeProfileCommandTests(TestCase):
+    """check_runtime_profile reports each runtime optimization and times a request."""
+
+    def run_command(self, *args):
+        out = StringIO()
+        call_command('check_runtime_profile', '--repeat', '2', *args, stdout=out)
+        return out.getvalue()
+
+    def test_reports_inactive_optimizations(self):
+        output = self.run_command()
+        self.assertIn('[FAIL] persistent connections: CONN_MAX_AGE=0', output)
+        self.assertIn('[FAIL] sessions: django.contrib.sessions.backends.db', output)
+        self.assertIn('[WARN] cache: django.core.cache.backends.locmem.LocMemCache', output)
+        self.assertIn('connection setup:', output)
+        self.assertIn('request /admin/login/ (200)', output)
+        with self.assertRaises(CommandError):
+            self.run_command('--strict')
+        with self.settings(KPI_SHARED_CACHE=True):
+            self.assertIn('[FAIL] cache: django.core.cache.backends.locmem.LocMemCache with KPI_SHARED_CACHE=True',
+                          self.run_command())
+
+    @override_settings(
+        SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+        TEMPLATES=[{
+            'BACKEND': 'django.template.backends.django.DjangoTemplates',
+            'OPTIONS': {
+                'loaders': [('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.app_directories.Loader',
+                ])],
+                'context_processors': [
+                    'django.template.context_processors.request',
+                    'django.contrib.auth.context_processors.auth',
+                    'django.contrib.messages.context_processors.messages',
+                ],
+            },
+        }],
+    )
+    def test_reports_active_optimizations(self):
+        output = self.run_command()
+        self.assertIn('[OK] sessions: django.contrib.sessions.backends.cached_db', output)
+        self.assertIn('[OK] template loaders: cached', output)
+        self.assertIn('[OK] DEBUG: off', output)
+
+
+class StartupProfileCommandTests(SimpleTestCase):
+    """A cold worker must not import pandas just to serve its first request."""
+
+    def test_cold_start_report(self):
+        out = StringIO()
+        call_command('profile_startup', '--top', '3', stdout=out)
+        output = out.getvalue()
+        self.assertIn('Import time by top-level package', output)
+        self.assertIn('pandas: not loaded', output)
+        self.assertRegex(output, r'first response [\d.]+ ms \(200 OK\)')
+        self.assertIn('cold start to first response:', output)
+
+
+class AsyncDashboardTests(KpiTestDataMixin, TransactionTestCase):
+    """The async dashboards render the same page as the sync ones (their queries run in worker threads)."""
+
+    def setUp(self):
+        super().setUp()
+        self.manager = self.make_employee('manager', level=1)
+        approved = self.make_employee('approved')
+        self.make_result(approved, is_locked=True)
+        self.make_result(self.make_employee('pending'))
+        self.make_result(self.manager, is_locked=True)
+        low = self.make_result(self.make_employee('low'))
+        alk_kpi_result.objects.filter(pk=low.pk).update(final_result=Decimal('0.1'))
+        self.client.force_login(self.manager.user_id)
+
+    def test_manager_dashboard_matches_sync_view(self):
+        query = '?year=2025&semester=2nd SEM&month=1st'
+        sync = self.client.get(reverse('manager_dashboard') + query)
+        response = self.client.get(reverse('manager_dashboard_async') + query)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['stats'], sync.context['stats'])
+        self.assertEqual(
+            [m['status'] for m in response.context['team_data']],
+            [m['status'] for m in sync.context['team_data']],
+        )
+        self.assertEqual([a.id for a in response.context['anomalies']], [a.id for a in sync.context['anomalies']])
+
+    def test_employee_dashboard_matches_sync_view(self):
+        for query in ('', '?year=2025&semester=2nd SEM'):
+            sync = self.client.get(reverse('portal_dashboard') + query)
+            response = self.client.get(reverse('portal_dashboard_async') + query)
+            self.assertEqual(response.status_code, 200)
+            for key in ('current_year', 'current_sem', 'approved_count', 'pending_count', 'chart_data'):
+                self.assertEqual(response.context[key], sync.context[key])
+
+    def test_staff_redirected_from_async_manager_dashboard(self):
+        self.client.force_login(alk_employee.objects.get(name='pending').user_id)
+        response = self.client.get(reverse('manager_dashboard_async'))
+        self.assertRedirects(response, reverse('portal_dashboard'), fetch_redirect_response=False)
+
+    @override_settings(KPI_QUERY_FANOUT_WORKERS=2)
+    def test_gather_queries_uses_a_bounded_pool(self):
+        def query(i):
+            time.sleep(0.02)
+            return i, threading.current_thread().name
+
+        results = async_to_sync(query_fanout.gather_queries)({i: (lambda i=i: query(i)) for i in range(6)})
+        self.assertEqual([results[i][0] for i in range(6)], list(range(6)))
+        threads = {name for _, name in results.values()}
+        self.assertLessEqual(len(threads), 2)
+        self.assertTrue(all(name.startswith('kpi-query-fanout') for name in threads))
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_dashboards', '--requests', '2', '--delay-ms', '1', stdout=out)
+        output = out.getvalue()
+        self.assertRegex(output, r'manager_dashboard: sync p50 [\d.]+ ms / p95 [\d.]+ ms, async p50')
+        self.assertRegex(output, r'\ndashboard: sync p50')
+
+
+@modify_settings(MIDDLEWARE={'prepend': 'kpi_app.request_timing.RequestTimingMiddleware'})
+@override_settings(KPI_REQUEST_TIMING=True, KPI_SLOW_REQUEST_MS=100000)
+class RequestTimingTests(KpiTestDataMixin, TestCase):
+    """Server-Timing header, slow-request log and p50/p95 per URL name."""
+
+    def setUp(self):
+        super().setUp()
+        self.employee = self.make_employee('staff')
+        self.make_result(self.employee)
+        self.client.force_login(self.employee.user_id)
+
+    def test_server_timing_header(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('portal_dashboard'))
+        header = response['Server-Timing']
+        self.assertRegex(header, r'^db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+, view;dur=[\d.]+, total;dur=[\d.]+$')
+        # INSERT của mẫu chạy sau khi đã có header
+        queries = [q for q in ctx.captured_queries if 'alk_request_timing' not in q['sql']]
+        self.assertIn(f'desc="{len(queries)} queries"', header)
+
+    def test_samples_summarized_per_url_name(self):
+        for _ in range(3):
+            self.client.get(reverse('portal_dashboard'))
+        self.client.get(reverse('portal_input'))
+        rows = {row['url_name']: row for row in timing_summary()}
+        self.assertEqual(rows['portal_dashboard']['count'], 3)
+        self.assertEqual(rows['portal_input']['count'], 1)
+        self.assertGreater(rows['portal_dashboard']['queries']['p50'], 0)
+        self.assertLessEqual(rows['portal_dashboard']['total']['p50'], rows['portal_dashboard']['total']['p95'])
+
+    def test_slow_requests_logged(self):
+        with override_settings(KPI_SLOW_REQUEST_MS=0), self.assertLogs('kpi_app.slow_requests', 'WARNING') as logs:
+            self.client.get(reverse('portal_dashboard'))
+        self.assertIn('url_name=portal_dashboard user=staff', logs.output[0])
+
+    def test_timings_page_is_staff_only(self):
+        self.client.get(reverse('portal_dashboard'))
+        self.assertEqual(self.client.get(reverse('request_timings')).status_code, 403)
+        User.objects.filter(pk=self.employee.user_id.pk).update(is_staff=True)
+        response = self.client.get(reverse('request_timings'))
+        self.assertContains(response, 'portal_dashboard')
+        self.client.post(reverse('request_timings'))
+        # Chỉ còn chính request reset
+        self.assertEqual([row['url_name'] for row in timing_summary()], ['request_timings'])
+
+    def test_repeated_query_shapes_logged(self):
+        with override_settings(KPI_MAX_QUERY_REPEATS=0), self.assertLogs('kpi_app.slow_requests', 'WARNING') as logs:
+            self.client.get(reverse('portal_dashboard'))
+        self.assertIn('repeated query shape (N+1?) 1x url_name=portal_dashboard: SELECT', logs.output[0])
+
+    def test_samples_are_rows_trimmed_per_url(self):
+        for total in range(1, 9):
+            record_sample('view', (total, 0, 0, 0, 0), 3)
+        record_sample('other', (1, 0, 0, 0, 0), 3)
+        rows = {row['url_name']: row for row in timing_summary(limit=3)}
+        # 3 mẫu mới nhất (6, 7, 8) của mỗi URL; mẫu của URL khác không bị ghi đè
+        self.assertEqual((rows['view']['count'], rows['view']['total']['p50'], rows['view']['total']['p95']), (3, 7, 8))
+        self.assertEqual(rows['other']['count'], 1)
+        # Mỗi `limit` dòng xoá bớt mẫu cũ
+        self.assertLessEqual(alk_request_timing.objects.filter(url_name='view').count(), 2 * 3)
+        reset_timings()
+        self.assertEqual(timing_summary(), [])
+
+    def test_disabled_middleware_is_not_used(self):
+        with override_settings(KPI_REQUEST_TIMING=False):
+            self.client.handler.load_middleware()
+            response = self.client.get(reverse('portal_dashboard'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(timing_summary(), [])
+
+
+class QueryShapeTests(SimpleTestCase):
+    databases = {'default'}
+
+    def test_fingerprint_strips_literals(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id = 12 AND name = 'O''Neil' AND x IN (%s, %s, %s)"),
+            "SELECT * FROM t WHERE id = ? AND name = ? AND x IN (...)",
+        )
+        self.assertEqual(fingerprint('SELECT "T2"."id" FROM t LIMIT 21'), 'SELECT "T2"."id" FROM t LIMIT ?')
+
+    def test_repeated_shapes(self):
+        with track_query_shapes() as shapes:
+            for pk in range(5):
+                list(User.objects.filter(pk=pk))
+            User.objects.count()
+        self.assertEqual(shapes.total, 6)
+        [(shape, count)] = shapes.repeated(3)
+        self.assertEqual(count, 5)
+        self.assertIn('WHERE "auth_user"."id" = ?', shape)
+
+
+@override_settings(KPI_SHARED_CACHE=True)
+class UrlQueryBudgetTests(QueryBudgetMixin, KpiTestDataMixin, TransactionTestCase):
+    """
+    Every URL of kpi_app/urls.py (and the kpi_app admin changelists) against a
+    team of several employees with several KPIs: the query count must not grow
+    with the data, so no SQL shape may repeat more than DEFAULT_MAX_REPEATS times.
+    """
+    TEAM_SIZE = 6
+    KPI_COUNT = 5
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = self.settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.manager = self.make_employee('manager', level=1)
+        User.objects.filter(pk=self.manager.user_id.pk).update(is_staff=True, is_superuser=True)
+        kpis = [self.kpi] + [
+            alk_kpi.objects.create(kpi_name=f'KPI {i}', dept_obj=self.kpi.dept_obj, perspective=self.kpi.perspective)
+            for i in range(self.KPI_COUNT - 1)
+        ]
+        for i in range(self.TEAM_SIZE):
+            employee = self.make_employee(f'staff{i}')
+            for j, kpi in enumerate(kpis):
+                for month in ('1st', '2nd'):
+                    self.make_result(employee, kpi=kpi, month=month, is_locked=bool((i + j) % 2),
+                                     achievement=Decimal(40 + 20 * j))
+            if i == 0:
+                self.employee = employee
+        self.result = alk_kpi_result.objects.filter(employee=self.employee, month='1st', kpi=self.kpi).get()
+        # Tháng 1 được duyệt trong lúc duyệt qua các URL; manager sửa một dòng tháng 2 chưa khoá
+        self.review_result = alk_kpi_result.objects.filter(employee=self.employee, month='2nd', kpi=self.kpi).get()
+        self.job = alk_job.objects.create(job_type='export_kpi_results', created_by=self.manager.user_id,
+                                          status=alk_job.STATUS_DONE)
+        self.job.result_file.save('report.csv', ContentFile(b'a,b\n'))
+
+    def requests(self):
+        """(url name, query budget, method, url kwargs, data) for every kpi_app URL."""
+        period = {'year': 2025, 'semester': '2nd SEM', 'month': '1st'}
+        results = alk_kpi_result.objects.filter(employee=self.employee, month='1st')
+        batch = {**period, 'employee_id': self.employee.pk}
+        batch.update({f'achievement-{r.pk}': '55' for r in results})
+        return [
+            ('home', 8, 'get', {}, {}),
+            ('login', 3, 'get', {}, {}),
+            ('profile', 6, 'get', {}, {}),
+            ('export_alk_kpi_result', 4, 'get', {}, period),
+            ('export_alk_kpi_result_stream', 4, 'get', {}, {**period, 'format': 'csv'}),
+            ('manage_kpi_result', 4, 'get', {}, {}),
+            ('portal_dashboard', 5, 'get', {}, period),
+            ('portal_dashboard_async', 5, 'get', {}, period),
+            ('manager_dashboard', 10, 'get', {}, period),
+            ('manager_dashboard_async', 10, 'get', {}, period),
+            ('manager_reports', 6, 'get', {}, period),
+            ('export_manager_reports', 4, 'get', {}, period),
+            ('manager_review_employee', 8, 'get', {'emp_id': self.employee.pk}, period),
+            ('manager_toggle_approval', 12, 'post', {'emp_id': self.employee.pk},
+             {**period, 'action': 'approve', 'selected_kpi': list(results.values_list('pk', flat=True))}),
+            ('portal_input', 6, 'get', {}, period),
+            ('portal_input_params', 6, 'get', period, {}),
+            ('portal_save_kpi_batch', 12, 'post', {}, batch),
+            ('portal_save_kpi', 12, 'post', {'result_id': self.result.pk}, {'achievement': '70'}),
+            ('job_detail', 4, 'get', {'job_id': self.job.pk}, {}),
+            ('job_status', 4, 'get', {'job_id': self.job.pk}, {}),
+            ('job_download', 4, 'get', {'job_id': self.job.pk}, {}),
+            ('manager_save_kpi', 12, 'post', {'result_id': self.review_result.pk},
+             {f'achievement_{self.review_result.pk}': '65'}),
+            ('request_timings', 3, 'get', {}, {}),
+            ('logout', 5, 'get', {}, {}),
+            ('accounts_logout', 5, 'get', {}, {}),
+        ]
+
+    def test_every_url_is_covered(self):
+        names = {pattern.name for pattern in kpi_urls.urlpatterns if pattern.name}
+        self.assertEqual(names, {name for name, *_ in self.requests()})
+
+    def test_query_budgets(self):
+        for name, budget, method, kwargs, data in self.requests():
+            self.client.force_login(self.manager.user_id)
+            url = reverse(name, kwargs=kwargs or None)
+            with self.subTest(name), self.assertQueryBudget(budget, label=name):
+                response = getattr(self.client, method)(url, data)
+                if hasattr(response, 'streaming_content'):
+                    b''.join(response.streaming_content)
+                self.assertLess(response.status_code, 400)
+
+    def test_admin_changelists(self):
+        self.client.force_login(self.manager.user_id)
+        for model in admin.site._registry:
+            if model._meta.app_label != 'kpi_app':
+                continue
+            url = reverse(f'admin:kpi_app_{model._meta.model_name}_changelist')
+            with self.assertQueryBudget(label=url):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class SyntheticDataTests(TestCase):
+    """generate_kpi_data builds a consistent org and scored results; benchmark_views times it."""
+
+    def generate(self, *args):
+        out = StringIO()
+        call_command(
+            'generate_kpi_data', '--employees', '25', '--groups', '2', '--depts-per-group', '2',
+            '--kpis', '6', '--kpis-per-employee', '3', '--semesters', '2', *args, stdout=out,
+        )
+        return out.getvalue()
+
+    def test_generated_org_and_results(self):
+        self.assertIn('25 employees and 900 results', self.generate())
+        employees = alk_employee.objects.filter(user_id__username__startswith=synthetic_data.USER_PREFIX)
+        self.assertEqual(employees.filter(level=0).count(), 2)
+        self.assertEqual(employees.filter(level=1).count(), 2)
+        self.assertEqual(alk_kpi_summary.objects.count(), 25 * 12)
+        self.assertEqual(
+            sorted(alk_kpi_result.objects.order_by().values_list('year', 'semester').distinct()),
+            [(2025, '1st SEM'), (2025, '2nd SEM')],
+        )
+        # Điểm tính theo lô phải khớp với alk_kpi_result.save()
+        for result in alk_kpi_result.objects.select_related('kpi').order_by('?')[:50]:
+            self.assertEqual(result.final_result, Decimal(result.calculate_final_result()).quantize(Decimal('0.001')))
+            self.assertEqual(result.period_code, period_code(result.year, result.semester, result.month))
+
+        with self.assertRaises(CommandError):
+            self.generate()
+        self.generate('--clear-only')
+        self.assertFalse(alk_kpi_result.objects.exists())
+        self.assertFalse(alk_kpi.objects.exists())
+        self.assertFalse(User.objects.exists())
+
+    def test_benchmark_views_json(self):
+        self.generate('--password', 'secret')
+        self.assertTrue(self.client.login(username='syn_000005', password='secret'))
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir, ignore_errors=True)
+        path = os.path.join(output_dir, 'bench.json')
+        out = StringIO()
+        call_command('benchmark_views', '--repeat', '1', '--output', path, stdout=out)
+        call_command('benchmark_views', '--repeat', '1', '--views', 'manager', '--compare', path, stdout=out)
+        with open(path, encoding='utf-8') as f:
+            report = json.load(f)
+        [run] = report['runs']
+        self.assertEqual(run['results'], 900)
+        self.assertIn('admin_result_changelist', run['views'])
+        self.assertIn('export_stream_xlsx', run['views'])
+        self.assertGreater(run['views']['manager_dashboard']['queries'], 0)
+        self.assertIn('manager_dashboard                  p50', out.getvalue())
+        self.assertIn('Compared with', out.getvalue())
+
+
+class MonthEndSimulationTests(TransactionTestCase):
+    """simulate_month_end replays save / approve sessions, checks for lost updates and restores the rows."""
+
+    def setUp(self):
+        synthetic_data.generate(employees=12, groups=1, depts_per_group=2, kpis=6, kpis_per_employee=3, semesters=1)
+        self.period = {'year': 2025, 'semester': '2nd SEM', 'month': '1st'}
+
+    def test_command_report_and_restore(self):
+        rows = alk_kpi_result.objects.filter(**self.period).order_by('id')
+        before = list(rows.values_list('id', 'achievement', 'is_locked'))
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir, ignore_errors=True)
+        path = os.path.join(output_dir, 'load.json')
+        out = StringIO()
+        # Một worker: các phiên chạy lần lượt, nên không có lỗi khoá hay mất cập nhật
+        call_command('simulate_month_end', '--workers', '1', '--cells', '2', '--output', path, stdout=out)
+        with open(path, encoding='utf-8') as f:
+            report = json.load(f)
+
+        self.assertEqual(report['sessions'], 10 + 2)
+        self.assertEqual(report['actions']['open_input']['count'], 10)
+        self.assertEqual(report['actions']['approve']['count'], 10)
+        self.assertEqual(report['actions']['save']['count'], sum(
+            min(2, n) for n in alk_kpi_result.objects.filter(
+                **self.period, employee__level__gte=2, kpi__from_sap=False, active=True, is_locked=False,
+            ).values('employee').annotate(n=Count('id')).values_list('n', flat=True)
+        ))
+        self.assertEqual((report['lock_errors'], report['other_errors']), (0, 0))
+        self.assertEqual((report['lost_saves'], report['lost_approvals']), ([], []))
+        self.assertIn('Lost approvals: 0', out.getvalue())
+
+        # Dữ liệu được trả lại như trước khi chạy
+        self.assertEqual(list(rows.values_list('id', 'achievement', 'is_locked')), before)
+
+    def test_verify_finds_lost_updates(self):
+        saved, approved = alk_kpi_result.objects.filter(**self.period, is_locked=False).order_by('id')[:2]
+        results = [{'requests': [], 'saved': {saved.id: '123.45'}, 'approved': [approved.id]}]
+        self.assertEqual(load_simulation.verify(results), ([saved.id], [approved.id]))
+
+        alk_kpi_result.objects.filter(id=saved.id).update(achievement=Decimal('123.45'))
+        alk_kpi_result.objects.filter(id=approved.id).update(is_locked=True)
+        self.assertEqual(load_simulation.verify(results), ([], []))
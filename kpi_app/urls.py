@@ -10,17 +10,26 @@ urlpatterns = [
     path('profile/', views.profile, name='profile'),
     path('accounts/logout/', views.user_logout, name='accounts_logout'),
     path('export-alk-kpi-result/', views.export_alk_kpi_result, name='export_alk_kpi_result'),  # Thêm url xuất báo cáo
+    path('export-alk-kpi-result/stream/', views.export_alk_kpi_result_stream, name='export_alk_kpi_result_stream'),
     path('manage/', views.manage_kpi_result, name='manage_kpi_result'),
 
     # PORTAL URLS
     path('portal/', portal_views.dashboard, name='portal_dashboard'),
     path('portal/manager/', portal_views.manager_dashboard, name='manager_dashboard'),
+    # Bản async (chạy dưới ASGI: alkana_kpi/asgi.py)
+    path('portal/async/', portal_views.dashboard_async, name='portal_dashboard_async'),
+    path('portal/manager/async/', portal_views.manager_dashboard_async, name='manager_dashboard_async'),
     path('portal/manager/reports/', portal_views.manager_reports, name='manager_reports'),
     path('portal/manager/reports/export/', portal_views.export_manager_reports, name='export_manager_reports'),
     path('portal/manager/review/<int:emp_id>/', portal_views.manager_review_employee, name='manager_review_employee'),
     path('portal/manager/toggle-approval/<int:emp_id>/', portal_views.manager_toggle_approval, name='manager_toggle_approval'),
     path('portal/input/', portal_views.input_form, name='portal_input'),
     path('portal/input/<int:year>/<str:semester>/<str:month>/', portal_views.input_form, name='portal_input_params'),
+    path('portal/save-kpi/batch/', portal_views.save_kpi_batch, name='portal_save_kpi_batch'),
     path('portal/save-kpi/<int:result_id>/', portal_views.save_kpi_result, name='portal_save_kpi'),
+    path('portal/jobs/<int:job_id>/', portal_views.job_detail, name='job_detail'),
+    path('portal/jobs/<int:job_id>/status/', portal_views.job_status, name='job_status'),
+    path('portal/jobs/<int:job_id>/download/', portal_views.job_download, name='job_download'),
     path('portal/manager/save/<int:result_id>/', portal_views.manager_save_kpi, name='manager_save_kpi'),
+    path('portal/timings/', portal_views.request_timings, name='request_timings'),
 ]
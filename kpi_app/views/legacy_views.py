@@ -6,16 +6,21 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib import messages
 from kpi_app.models import alk_employee, alk_job_title, alk_dept, alk_dept_group, alk_kpi_result
+from kpi_app.employee_context import get_employee_context, get_request_employee
+from kpi_app.exports import stream_export
+from kpi_app.jobs import enqueue
+from kpi_app.periods import period_lookup
+from kpi_app.period_catalogue import all_periods
 from django.contrib.auth import update_session_auth_hash
 import csv
-import pandas as pd
 from django.core.paginator import Paginator
+from django.utils import timezone
 
 @login_required
 def home(request):
     user = request.user
     try:
-        employee = alk_employee.objects.get(user_id=user)
+        employee = get_request_employee(request)
         user_dept = alk_dept.objects.filter(alk_employee__user_id=user).distinct()
     except alk_employee.DoesNotExist:
         user_dept = alk_dept.objects.none()
@@ -34,7 +39,7 @@ def home(request):
         if not user.is_superuser:
             # Lọc theo bộ phận của employee có user_id là username của user đang đăng nhập
             try:
-                employee = alk_employee.objects.get(user_id=user)
+                employee = get_request_employee(request)
                 results = results.filter(employee__dept=employee.dept)
             except alk_employee.DoesNotExist:
                 results = results.none()
@@ -98,7 +103,7 @@ def user_logout(request):
 def profile(request):
     user = request.user
     try:
-        employee = alk_employee.objects.get(user_id=user)
+        employee = get_request_employee(request)
     except alk_employee.DoesNotExist:
         employee = None
     if request.method == 'POST':
@@ -153,53 +158,46 @@ def profile(request):
         'level_choices': level_choices,
     })
 
+@login_required
 def export_alk_kpi_result(request):
+    """Excel report of the home page: queued as a job (worker run_jobs), downloaded from the job page."""
+    job = enqueue('export_kpi_report', user=request.user, params={
+        field: request.GET.get(field) for field in ('year', 'semester', 'month', 'user_id', 'name')
+    })
+    return redirect('job_detail', job_id=job.id)
+
+@login_required
+def export_alk_kpi_result_stream(request):
+    """Xuất toàn bộ dòng alk_kpi_result (xlsx hoặc csv) theo bộ lọc, bộ nhớ không tăng theo số dòng."""
+    results = alk_kpi_result.objects.all()
+    if not request.user.is_superuser:
+        emp_ctx = get_employee_context(request)
+        if emp_ctx is None:
+            return HttpResponse("Unauthorized", status=403)
+        results = results.filter(employee__id__in=emp_ctx.team_scope_ids)
+
     year = request.GET.get('year')
     semester = request.GET.get('semester')
     month = request.GET.get('month')
-    user_id = request.GET.get('user_id')
-    name = request.GET.get('name')
+    file_format = request.GET.get('format', 'xlsx')
 
-    results = alk_kpi_result.objects.all()
-    if year:
-        results = results.filter(year=year)
-    if semester:
-        results = results.filter(semester=semester)
-    if month:
-        results = results.filter(month=month)
-    if user_id:
-        results = results.filter(employee__user_id__username__icontains=user_id)
-    if name:
-        results = results.filter(employee__name__icontains=name)
-
-    from django.db.models import Sum
-    grouped = results.values(
-        'year', 'semester', 'month',
-        'employee__user_id__username', 'employee__name', 'employee__dept__dept_name'
-    ).annotate(subtotal=Sum('final_result'))
-
-    # Xuất ra Excel
-    df = pd.DataFrame(list(grouped))
-    df.rename(columns={
-        'year': 'Year',
-        'semester': 'Semester',
-        'month': 'Month',
-        'employee__user_id__username': 'Employee User ID',
-        'employee__name': 'Employee Name',
-        'employee__dept__dept_name': 'Department',
-        'subtotal': 'Subtotal (Final Result)'
-    }, inplace=True)
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = 'attachment; filename="alk_kpi_result_report.xlsx"'
-    with pd.ExcelWriter(response, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='KPI Report')
-    return response
+    # background=1: xếp hàng job, worker run_jobs tạo file, người dùng tải khi xong
+    if request.GET.get('background'):
+        job = enqueue('export_kpi_results', user=request.user, params={
+            'year': year, 'semester': semester, 'month': month, 'format': file_format,
+        })
+        return redirect('job_detail', job_id=job.id)
+
+    if year or semester or month:
+        results = results.filter(**period_lookup(year, semester, month))
+    return stream_export(results, file_format=file_format)
 
 def manage_kpi_result(request):
     if not request.user.is_superuser:
         return redirect('/admin/')
-    years = alk_kpi_result.objects.values_list('year', flat=True).distinct().order_by('year')
-    semesters = alk_kpi_result.objects.values_list('semester', flat=True).distinct().order_by('semester')
+    periods = all_periods()
+    years = sorted(periods.years)
+    semesters = periods.semesters
     if request.method == 'GET':
         active = request.GET.get('active', 'true')
         year = request.GET.get('year')
@@ -207,7 +205,7 @@ def manage_kpi_result(request):
         # Nếu có các tham số và bấm submit thì cập nhật
         if 'year' in request.GET and 'semester' in request.GET and 'active' in request.GET:
             is_active = True if active == 'true' else False
-            alk_kpi_result.objects.filter(year=year, semester=semester).update(active=is_active)
+            alk_kpi_result.objects.filter(year=year, semester=semester).update(active=is_active, updated_at=timezone.now())
             if not request.path.startswith('/admin/'):
                 from django.utils.safestring import mark_safe
                 year_link = f'<a href="?year={year}">{year}</a>'
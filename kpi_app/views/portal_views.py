@@ -1,12 +1,26 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import render_to_string
 from django.contrib.auth.decorators import login_required
 from django.http import HttpResponse, JsonResponse, HttpResponseForbidden
-from django.core.paginator import Paginator
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
 from django.contrib import messages
-from kpi_app.models import alk_kpi_result, alk_employee
-from django.db.models import Count, Avg, Q, Max, Sum, Value, CharField
+from kpi_app.models import alk_job, alk_kpi_result, alk_kpi_summary, alk_employee
+from kpi_app.periods import period_lookup
+from kpi_app.period_catalogue import all_periods, employee_periods, team_periods
+from kpi_app.ranking import SCOPE_DEPT, SCOPE_LABELS, allowed_scopes, employee_ranking
+from kpi_app.employee_context import get_employee_context, get_request_employee
+from kpi_app.formatting import attach_formats
+from kpi_app.jobs import enqueue
+from kpi_app.query_fanout import gather_queries, run_queries
+from kpi_app.request_timing import is_enabled as request_timing_enabled, reset_timings, timing_summary
+from django.db.models import Count, Avg, Q, F, Max, Sum, Value, Case, When, CharField
 from django.views.decorators.http import require_POST
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils.html import escape
+from django.utils import timezone
 from django.contrib.auth.views import LoginView
 from django.shortcuts import resolve_url
 
@@ -40,22 +54,59 @@ def dashboard(request):
     user = request.user
 
     try:
-        employee = alk_employee.objects.get(user_id=user)
+        employee = get_request_employee(request)
     except alk_employee.DoesNotExist:
         messages.error(request, "Employee profile not found.")
         return redirect('logout')
 
-    # Dynamic filter options from DB
-    available_years = alk_kpi_result.objects.filter(employee=employee).exclude(year__isnull=True).values_list('year', flat=True).distinct().order_by('-year')
-    available_sems = alk_kpi_result.objects.filter(employee=employee).exclude(semester__isnull=True).exclude(semester__exact='').values_list('semester', flat=True).distinct().order_by('semester')
-
-    if not available_years:
+    # Dynamic filter options from the (cached) period catalogue
+    periods = employee_periods(employee)
+    if not periods.years:
         context = {'page_title': 'Dashboard', 'no_data': True}
         return render(request, 'kpi_app/portal/dashboard.html', context)
 
+    current_year, year_int, current_sem = _dashboard_period(request, periods)
+    monthly_data = _dashboard_summary(employee, year_int, current_sem)
+    context = _dashboard_context(employee, periods, monthly_data, current_year, current_sem)
+    return render(request, 'kpi_app/portal/dashboard.html', context)
+
+
+@login_required
+async def dashboard_async(request):
+    """
+    Async Employee Dashboard (ASGI). When the period is in the URL, the period
+    catalogue and the month summary are read concurrently.
+    """
+    emp_ctx = await sync_to_async(get_employee_context)(request)
+    if emp_ctx is None:
+        await sync_to_async(messages.error)(request, "Employee profile not found.")
+        return redirect('logout')
+    employee = emp_ctx.employee
+
+    queries = {'periods': lambda: employee_periods(employee)}
+    if request.GET.get('year') and request.GET.get('semester'):
+        # Kỳ đã có trên URL: không cần chờ danh mục kỳ để lấy giá trị mặc định
+        current_year, year_int, current_sem = _dashboard_period(request, None)
+        queries['monthly_data'] = lambda: _dashboard_summary(employee, year_int, current_sem)
+    data = await gather_queries(queries)
+    periods = data['periods']
+
+    if not periods.years:
+        context = {'page_title': 'Dashboard', 'no_data': True}
+        return await sync_to_async(render)(request, 'kpi_app/portal/dashboard.html', context)
+
+    if 'monthly_data' not in data:
+        current_year, year_int, current_sem = _dashboard_period(request, periods)
+        data['monthly_data'] = await sync_to_async(_dashboard_summary)(employee, year_int, current_sem)
+    context = _dashboard_context(employee, periods, data['monthly_data'], current_year, current_sem)
+    return await sync_to_async(render)(request, 'kpi_app/portal/dashboard.html', context)
+
+
+def _dashboard_period(request, periods):
+    """(current_year, year as int, current_sem) from the query string, defaulting to the newest period."""
     from datetime import datetime as dt
-    default_year = str(available_years[0])
-    default_sem = available_sems[0] if available_sems else ''
+    default_year = str(periods.years[0]) if periods else ''
+    default_sem = periods.semesters[0] if periods and periods.semesters else ''
 
     current_year = request.GET.get('year', default_year)
     current_sem = request.GET.get('semester', default_sem)
@@ -65,21 +116,29 @@ def dashboard(request):
     except (ValueError, TypeError):
         year_int = dt.now().year
         current_year = str(year_int)
+    return current_year, year_int, current_sem
+
+
+def _dashboard_summary(employee, year, semester):
+    # Base queryset: employee + year + semester (all months = full semester view),
+    # read from the per-period summary table instead of raw results
+    qs = alk_kpi_summary.objects.filter(employee=employee, **period_lookup(year, semester))
+
+    # Chart Data: Total Score per Month across the selected semester
+    return list(qs.values('month').annotate(
+        total_score=Sum('total_score'),
+        kpi_count=Sum('kpi_count'),
+        locked_count=Sum('locked_count'),
+    ).order_by('month'))
 
-    # Base queryset: employee + year + semester (all months = full semester view)
-    qs = alk_kpi_result.objects.filter(employee=employee, year=year_int)
-    if current_sem:
-        qs = qs.filter(semester__icontains=current_sem)
 
+def _dashboard_context(employee, periods, monthly_data, current_year, current_sem):
     # Stats
-    total_kpis = qs.count()
-    approved_count = qs.filter(is_locked=True).count()
+    total_kpis = sum(item['kpi_count'] for item in monthly_data)
+    approved_count = sum(item['locked_count'] for item in monthly_data)
     pending_count = total_kpis - approved_count
     completion_rate = int((approved_count / total_kpis * 100)) if total_kpis > 0 else 0
 
-    # Chart Data: Total Score per Month across the selected semester
-    monthly_data = qs.values('month').annotate(total_score=Sum('final_result')).order_by('month')
-
     chart_labels = []
     chart_data = []
     for item in monthly_data:
@@ -87,41 +146,41 @@ def dashboard(request):
         val = item['total_score'] if item['total_score'] else 0
         chart_data.append(round(float(val) * 100, 2))
 
-    context = {
+    return {
         'page_title': 'Employee Dashboard',
         'user_employee': employee,
         'employee': employee,
         'current_year': str(current_year),
         'current_sem': current_sem,
-        'available_years': available_years,
-        'available_sems': available_sems,
+        'available_years': periods.years,
+        'available_sems': periods.semesters,
         'completion_rate': completion_rate,
         'approved_count': approved_count,
         'pending_count': pending_count,
         'chart_labels': chart_labels,
         'chart_data': chart_data,
     }
-    return render(request, 'kpi_app/portal/dashboard.html', context)
 
 @login_required
-def input_form(request):
-    """Main data entry grid for employees."""
+def input_form(request, year=None, semester=None, month=None):
+    """Main data entry grid for employees (period from the query string or the URL)."""
     user = request.user
     try:
-        employee = alk_employee.objects.get(user_id=user)
+        employee = get_request_employee(request)
     except alk_employee.DoesNotExist:
         messages.error(request, "Employee profile not found.")
         return redirect('logout')
 
     # Get Filter Options
-    years = alk_kpi_result.objects.values_list('year', flat=True).distinct().order_by('-year')
-    semesters = alk_kpi_result.objects.values_list('semester', flat=True).distinct().order_by('semester')
+    periods = all_periods()
+    years = periods.years
+    semesters = periods.semesters
     months = alk_kpi_result.MONTH_CHOICES
 
     # Default to current/latest
-    current_year = request.GET.get('year') or (years[0] if years else None)
-    current_sem = request.GET.get('semester') or (semesters[0] if semesters else None)
-    current_month = request.GET.get('month') or (months[0][0] if months else None)
+    current_year = request.GET.get('year') or year or (years[0] if years else None)
+    current_sem = request.GET.get('semester') or semester or (semesters[0] if semesters else None)
+    current_month = request.GET.get('month') or month or (months[0][0] if months else None)
 
     # Convert to int if possible for Year
     try:
@@ -138,11 +197,10 @@ def input_form(request):
         kpi_results = kpi_results.filter(month=current_month)
 
     # Ordering
-    kpi_results = kpi_results.order_by('kpi__kpi_name')
+    kpi_results = kpi_results.select_related('kpi').order_by('kpi__kpi_name')
     
     # Attach Admin Display Formats
-    for result in kpi_results:
-        _attach_admin_formats(result)
+    attach_formats(kpi_results)
 
     # Calculate Total Score
     from django.db.models import Sum
@@ -173,23 +231,10 @@ def save_kpi_result(request, result_id):
     result = get_object_or_404(alk_kpi_result, id=result_id)
     
     # Identify User Role & Permissions
-    user = request.user
-    is_owner = (result.employee.user_id == user)
-    is_manager = False
-
-    try:
-        requester_emp = alk_employee.objects.get(user_id=user)
-        # Manager Check (Level 0 or 1)
-        if requester_emp.level <= 1:
-            # Scope Check
-            if requester_emp.level == 0:
-                if requester_emp.dept.group == result.employee.dept.group:
-                    is_manager = True
-            elif requester_emp.level == 1:
-                if requester_emp.dept == result.employee.dept:
-                    is_manager = True
-    except:
-        pass
+    emp_ctx = get_employee_context(request)
+    is_owner = emp_ctx is not None and result.employee_id == emp_ctx.employee.id
+    # Manager Check (Level 0 or 1) + Scope Check
+    is_manager = emp_ctx is not None and emp_ctx.is_manager and emp_ctx.in_scope(result.employee_id)
 
     # --- NEW GUARD: ACTIVE CHECK ---
     if not result.active:
@@ -242,7 +287,7 @@ def save_kpi_result(request, result_id):
         return HttpResponse(f"Error saving: {str(e)}", status=500)
 
     # Apply Admin-like display formatting
-    _attach_admin_formats(result)
+    attach_formats([result])
 
     # Persist Checkbox State (for Bulk Approval UI)
     show_checkbox = request.POST.get('show_checkbox') == 'true'
@@ -263,83 +308,132 @@ def save_kpi_result(request, result_id):
     return render(request, 'kpi_app/portal/partials/kpi_row.html', {
         'result': result,
         'show_checkbox': show_checkbox,
-        'is_manager': request.user.alk_employee_set.first().level <= 1 if hasattr(request.user, 'alk_employee_set') else False,
+        'is_manager': emp_ctx is not None and emp_ctx.is_manager,
         'total_score': total_score,
         'is_htmx_update': True
     })
 
-def _attach_admin_formats(obj):
+@login_required
+def save_kpi_batch(request):
     """
-    Replicates the display logic from AlkKpiResultAdmin to attach formatted strings to the object.
-    These attributes are temporary and used for template rendering.
+    HTMX Endpoint to save every changed cell of one period in a single POST.
+
+    Fields are named `achievement-<id>` / `target_input-<id>`. Permissions are
+    checked once for the period, every value is validated before anything is
+    written, and the rows are saved with one bulk_update. Returns only the
+    submitted rows plus the period total, as out-of-band swaps.
     """
-    # 1. Weight: weigth_percent_1f
-    if obj.weigth is not None:
-        obj.display_weight = f"{round(obj.weigth * 100, 1)}%"
-    else:
-        obj.display_weight = ""
-
-    # 2. Target Set: target_set_1f
-    if obj.target_set is not None:
-        if obj.target_set == 0:
-             obj.display_target_set = f"{obj.target_set:,.4f}"
-        elif obj.kpi and hasattr(obj.kpi, 'percent_display') and obj.kpi.percent_display:
-             obj.display_target_set = f"{round(obj.target_set * 100, 3):,.3f}%"
-        elif obj.kpi and hasattr(obj.kpi, 'percentage_cal'):
-             if obj.kpi.percentage_cal:
-                  obj.display_target_set = f"{round(obj.target_set * 100, 3):,.3f}%"
-             elif obj.target_set < 1:
-                  obj.display_target_set = f"{round(obj.target_set * 100, 3):,.3f}%"
-             else:
-                  obj.display_target_set = f"{obj.target_set:,.4f}"
-        else:
-             obj.display_target_set = f"{obj.target_set:,.4f}"
-    else:
-        obj.display_target_set = ""
-
-    # 3. Target Input: target_input_1f
-    if obj.target_input is not None:
-        # Prepare Form Value (Comma Separated, Raw Number)
-        obj.form_value_target_input = f"{obj.target_input:,.4f}"
-
-        if obj.target_set == 0:
-             obj.display_target_input = f"{obj.target_input:,.4f}"
-        elif obj.kpi and hasattr(obj.kpi, 'percent_display') and obj.kpi.percent_display:
-             obj.display_target_input = f"{round(obj.target_input * 100, 3):,.3f}%"
-        elif obj.kpi and hasattr(obj.kpi, 'percentage_cal') and obj.kpi.percentage_cal:
-             obj.display_target_input = f"{round(obj.target_input * 100, 3):,.3f}%"
-        elif obj.kpi and hasattr(obj.kpi, 'percentage_cal') and obj.kpi.percentage_cal is False and obj.target_set is not None and obj.target_set < 1:
-             obj.display_target_input = f"{round(obj.target_input * 100, 3):,.3f}%"
-        else:
-             obj.display_target_input = f"{obj.target_input:,.4f}"
-    else:
-        obj.display_target_input = ""
-        obj.form_value_target_input = ""
-
-    # 4. Achievement: achievement_1f
-    if obj.achievement is not None:
-        # Prepare Form Value (Comma Separated, Raw Number)
-        obj.form_value_achievement = f"{obj.achievement:,.4f}"
-
-        if obj.target_set == 0:
-             obj.display_achievement = f"{obj.achievement:,.4f}"
-        elif obj.kpi and hasattr(obj.kpi, 'percent_display') and obj.kpi.percent_display:
-             obj.display_achievement = f"{round(obj.achievement * 100, 3):,.3f}%"
-        elif obj.kpi and hasattr(obj.kpi, 'percentage_cal') and obj.kpi.percentage_cal:
-             obj.display_achievement = f"{round(obj.achievement * 100, 3):,.3f}%"
-        elif obj.kpi and hasattr(obj.kpi, 'percentage_cal') and obj.kpi.percentage_cal is False and obj.target_set is not None and obj.target_set < 1:
-             obj.display_achievement = f"{round(obj.achievement * 100, 3):,.3f}%"
-        else:
-             obj.display_achievement = f"{obj.achievement:,.4f}"
-    else:
-        obj.display_achievement = ""
-        obj.form_value_achievement = ""
+    if request.method != "POST":
+        return HttpResponse(status=405)
 
-    # 5. Final Result: final_result_percent_1f
-    if obj.final_result is not None:
-        obj.display_final_result = f"{round(obj.final_result * 100, 1)}%"
-    else:
-        obj.display_final_result = ""
+    emp_ctx = get_employee_context(request)
+    if emp_ctx is None:
+        return HttpResponse("Unauthorized", status=403)
+
+    # Owner saves own rows; managers may pass employee_id of a team member
+    employee = emp_ctx.employee
+    if request.POST.get('employee_id') and str(employee.pk) != request.POST['employee_id']:
+        employee = alk_employee.objects.filter(pk=request.POST['employee_id']).first()
+        if employee is None:
+            return HttpResponse("Employee not found", status=404)
+    # Cùng quy tắc với save_kpi_result: quản lý (kể cả trên dòng của chính mình) được sửa dòng đã khoá
+    is_manager = emp_ctx.is_manager and emp_ctx.in_scope(employee.id)
+    if employee.id != emp_ctx.employee.id and not is_manager:
+        return HttpResponse("Unauthorized", status=403)
+
+    year = request.POST.get('year')
+    semester = request.POST.get('semester')
+    month = request.POST.get('month')
+    try:
+        year = int(year)
+    except (TypeError, ValueError):
+        return HttpResponse("Missing period", status=400)
+    if not (semester and month):
+        return HttpResponse("Missing period", status=400)
+
+    results = list(
+        alk_kpi_result.objects.filter(employee=employee, year=year, semester=semester, month=month)
+        .select_related('kpi').order_by('kpi__kpi_name')
+    )
+    by_id = {str(r.id): r for r in results}
+
+    # Validate all cells first; nothing is written if one of them is wrong
+    changes = {}
+    submitted = set()
+    errors = []
+    for name, raw in request.POST.items():
+        field, _, result_id = name.rpartition('-')
+        if field not in ('achievement', 'target_input'):
+            continue
+        result = by_id.get(result_id)
+        if result is None:
+            errors.append(f"KPI result {result_id} is not in this period.")
+            continue
+        if not result.active:
+            errors.append(f"{result.kpi.kpi_name}: inactive and cannot be edited.")
+            continue
+        if result.is_locked and not is_manager:
+            errors.append(f"{result.kpi.kpi_name}: record is locked.")
+            continue
+        # Giống save_kpi_result: bỏ qua KPI từ SAP, target_input chỉ cho percentage_cal
+        if result.kpi.from_sap or (field == 'target_input' and not result.kpi.percentage_cal):
+            continue
+        try:
+            value = _parse_decimal(raw, alk_kpi_result._meta.get_field(field))
+        except ValidationError:
+            errors.append(f"{result.kpi.kpi_name}: invalid number for {field.replace('_', ' ')}.")
+            continue
+        submitted.add(result)
+        if getattr(result, field) != value:
+            changes.setdefault(result, {})[field] = value
+
+    if errors:
+        return HttpResponse("<br>".join(escape(e) for e in errors), status=400)
+
+    changed = []
+    now = timezone.now()
+    for result, values in changes.items():
+        for field, value in values.items():
+            setattr(result, field, value)
+        # Cùng logic với alk_kpi_result.save()
+        if result.kpi.percentage_cal is False:
+            result.target_input = result.target_set
+        result.final_result = result.calculate_final_result()
+        result.updated_at = now
+        changed.append(result)
+
+    if changed:
+        with transaction.atomic():
+            alk_kpi_result.objects.bulk_update(
+                changed, ['achievement', 'target_input', 'final_result', 'updated_at']
+            )
+            alk_kpi_summary.refresh_keys([(employee.id, year, semester, month)])
+
+    # Chỉ render lại các dòng đã gửi (chuẩn hoá lại giá trị ô nhập); dòng khác giữ nguyên
+    rows = attach_formats([r for r in results if r in submitted])
+    total_val = sum((r.final_result or 0) for r in results)
+
+    return render(request, 'kpi_app/portal/partials/kpi_table_body.html', {
+        'table_rows': rows,
+        'is_manager': is_manager,
+        'batch_mode': True,
+        'oob': True,
+        'total_score': f"{round(total_val * 100, 2):,.2f}%",
+        'is_htmx_update': True,
+    })
+
+def _parse_decimal(value, field):
+    """Parse a grid cell ('1,234.5' or empty) and run the model field's validators."""
+    value = (value or '').replace(',', '').strip()
+    if not value:
+        return None
+    try:
+        number = Decimal(value)
+    except InvalidOperation:
+        raise ValidationError("Invalid number")
+    if not number.is_finite():
+        raise ValidationError("Invalid number")
+    return field.clean(number, None)
 
 @login_required
 def manager_dashboard(request):
@@ -349,7 +443,7 @@ def manager_dashboard(request):
     user = request.user
     
     try:
-        current_employee = alk_employee.objects.get(user_id=user)
+        current_employee = get_request_employee(request)
     except alk_employee.DoesNotExist:
         return redirect('portal_dashboard')
 
@@ -358,137 +452,143 @@ def manager_dashboard(request):
         # Unauthorized for dashboard, redirect to personal portal
         return redirect('portal_dashboard')
 
+    filters = _manager_dashboard_filters(request)
+    data = run_queries(_manager_dashboard_queries(
+        get_employee_context(request), *filters, request.GET.get('anomaly_page')
+    ))
+    context = _manager_dashboard_context(current_employee, data, *filters, request.GET.get('page'))
+    return render(request, 'kpi_app/portal/manager_dashboard.html', context)
+
+
+@login_required
+async def manager_dashboard_async(request):
+    """
+    Async Manager Dashboard (ASGI): the independent queries (period catalogue,
+    team, status counts, average score, anomalies) run concurrently.
+    """
+    emp_ctx = await sync_to_async(get_employee_context)(request)
+    if emp_ctx is None or emp_ctx.employee.level > 1:
+        return redirect('portal_dashboard')
+
+    filters = _manager_dashboard_filters(request)
+    data = await gather_queries(_manager_dashboard_queries(emp_ctx, *filters, request.GET.get('anomaly_page')))
+    context = _manager_dashboard_context(emp_ctx.employee, data, *filters, request.GET.get('page'))
+    return await sync_to_async(render)(request, 'kpi_app/portal/manager_dashboard.html', context)
+
+
+def _manager_dashboard_filters(request):
+    return (
+        request.GET.get('year', 2025),
+        request.GET.get('semester', '2nd SEM'),
+        request.GET.get('month', '1st'),
+    )
+
+
+def _manager_dashboard_queries(emp_ctx, selected_year, selected_sem, selected_month, anomaly_page):
+    """The independent queries of the manager dashboard, as {name: callable}."""
+    current_employee = emp_ctx.employee
+
     # 2. Scope Definition
-    if current_employee.level == 0:
-        # Group Manager: Filter by Dept Group based on string match in Dept Table
-        # Logic: All employees whose Department belongs to the same Group Name as the Manager's Department
-        my_group_name = current_employee.dept.group
-        team_scope = alk_employee.objects.filter(dept__group=my_group_name)
-    else:
-        # Dept Manager (Level 1): Filter by Department
-        team_scope = alk_employee.objects.filter(dept=current_employee.dept)
+    # Group Manager (Level 0): same Dept Group; Dept Manager (Level 1): same Department
+    team_scope = alk_employee.objects.filter(id__in=emp_ctx.team_scope_ids)
     
     # Exclude manager themselves from the stats
     team_scope_ids = team_scope.exclude(id=current_employee.id).values_list('id', flat=True)
 
     # 3. Data Fetching - Filter Logic
-    # Get available filter choices from database (distinct values)
-    available_years = alk_kpi_result.objects.filter(
-        employee__id__in=team_scope_ids
-    ).values_list('year', flat=True).distinct().order_by('-year')
-    
-    available_semesters = alk_kpi_result.objects.filter(
-        employee__id__in=team_scope_ids
-    ).values_list('semester', flat=True).distinct().order_by('semester')
-    
-    available_months = alk_kpi_result.objects.filter(
-        employee__id__in=team_scope_ids
-    ).values_list('month', flat=True).distinct().order_by('month')
+    # Build query filters dynamically: exact / range lookups on the period code
+    # ('All' widens the period, spelling differences are normalized)
+    scope_filters = period_lookup(selected_year, selected_sem, selected_month)
+    results = alk_kpi_result.objects.filter(
+        employee__id__in=team_scope_ids, **scope_filters
+    ).select_related('employee', 'kpi')
+
+    def status_counts():
+        # One grouped query gives total / locked counts for every team member
+        # (manager included, so the Team Overview shows their own status too).
+        return list(alk_kpi_result.objects.filter(
+            employee__in=team_scope, **scope_filters
+        ).values('employee').annotate(
+            locked_count=Count('id', filter=Q(is_locked=True)),
+            total_kpis=Count('id')
+        ).order_by())
+
+    def anomalies():
+        # Ngưỡng theo từng KPI (mặc định > 1.2 (120%) hoặc < 0.4 (40%)); lọc, sắp xếp
+        # (worst performers first) và phân trang đều làm trong DB
+        anomalies = results.filter(
+            Q(final_result__gt=F('kpi__anomaly_high')) | Q(final_result__lt=F('kpi__anomaly_low'))
+        ).annotate(
+            alert_reason=Case(
+                When(final_result__gt=F('kpi__anomaly_high'), then=Value('TYPO')),
+                default=Value('LOW'),
+                output_field=CharField(),
+            )
+        ).order_by('final_result', 'id')
+
+        # PAGINATION FOR ANOMALIES
+        # Show only 5 rows per page for better layout (COUNT + LIMIT/OFFSET)
+        anomalies_paginator = Paginator(anomalies, 5)
+        try:
+            anomalies_page = anomalies_paginator.page(anomaly_page)
+        except PageNotAnInteger:
+            anomalies_page = anomalies_paginator.page(1)
+        except EmptyPage:
+            anomalies_page = anomalies_paginator.page(anomalies_paginator.num_pages)
+
+        # Format anomalies for display (only the rows on this page)
+        anomalies_page.object_list = attach_formats(list(anomalies_page.object_list))
+        return anomalies_page
+
+    return {
+        # Available filter choices of the team, from the (cached) period catalogue
+        'periods': lambda: team_periods(emp_ctx),
+        'team_members': lambda: list(team_scope.select_related('user_id', 'job_title')),
+        'status_counts': status_counts,
+        'avg_score': lambda: results.aggregate(Avg('final_result'))['final_result__avg'] or 0,
+        'anomalies': anomalies,
+    }
+
+
+def _manager_dashboard_context(current_employee, data, selected_year, selected_sem, selected_month, page):
+    periods = data['periods']
+    available_years = periods.years
+    available_semesters = periods.semesters
+    available_months = periods.months
     
     # Convert to lists and ensure we have data
     year_choices = list(available_years) if available_years else [2025]
     sem_choices = list(available_semesters) if available_semesters else ['1st SEM', '2nd SEM']
     month_choices = list(available_months) if available_months else ['1st', '2nd', '3rd', '4th', '5th', '6th']
-    
-    selected_year = request.GET.get('year', 2025)
-    selected_sem = request.GET.get('semester', '2nd SEM')
-    selected_month = request.GET.get('month', '1st')
-
-    # Build query filters dynamically
-    filter_kwargs = {'employee__id__in': team_scope_ids}
-    
-    # Force defaults to string for SAFE comparison if mixed types exist
-    if str(selected_year) != 'All':
-        filter_kwargs['year'] = selected_year
-    
-    if selected_sem != 'All':
-        filter_kwargs['semester'] = selected_sem
-    
-
-
-    if selected_month != 'All':
-        # RELAXED FILTER ATTEMPT 2: Use __icontains for maximum flexibility
-        filter_kwargs['month__icontains'] = selected_month
-    
-    if selected_sem != 'All':
-        filter_kwargs['semester__icontains'] = selected_sem
-
-    results = alk_kpi_result.objects.filter(**filter_kwargs).select_related('employee', 'kpi')
-
-    # ... (Stats calculation steps) ...
-    # Note: re-using existing logic but adding debug trace
 
     # 4. Calculate Statistics (The "Big Picture")
-    total_staff = team_scope.count()
-    
-    # Identify employees who have NO KPIs generated for this period
-    employees_with_kpis_ids = results.values_list('employee_id', flat=True).distinct()
-    employees_missing_kpis = team_scope.exclude(id__in=employees_with_kpis_ids)
-    missing_kpi_count = employees_missing_kpis.count()
-
-    status_counts = results.values('employee').annotate(
-        locked_count=Count('id', filter=Q(is_locked=True)),
-        total_kpis=Count('id')
-    )
+    team_members = data['team_members']
+    total_staff = len(team_members)
 
-    employees_done = 0
-    done_emp_ids = set()
-    
-    # Store KPI counts for debug display
-    emp_kpi_counts = {} 
+    emp_counts = {s['employee']: (s['total_kpis'], s['locked_count']) for s in data['status_counts']}
 
-    for s in status_counts:
-        # Populate counts map
-        emp_kpi_counts[s['employee']] = s['total_kpis']
-
-        if s['total_kpis'] > 0 and s['locked_count'] == s['total_kpis']:
-            employees_done += 1
-            done_emp_ids.add(s['employee'])
+    # Stats exclude the manager themselves
+    done_emp_ids = set(
+        emp_id for emp_id, (total_kpis, locked_count) in emp_counts.items()
+        if emp_id != current_employee.id and total_kpis > 0 and locked_count == total_kpis
+    )
+    employees_done = len(done_emp_ids)
 
     # FIXED LOGIC: Pending is simply the remainder
     employees_pending = total_staff - employees_done
 
-    avg_score = results.aggregate(Avg('final_result'))['final_result__avg'] or 0
+    avg_score = data['avg_score']
 
-    # 5. Anomalies
-    # > 1.2 (120%) or < 0.4 (40%)
-    potential_typos = results.filter(final_result__gt=1.2).annotate(
-        alert_reason=Value('TYPO', output_field=CharField())
-    )
-    under_performers = results.filter(final_result__lt=0.4).annotate(
-        alert_reason=Value('LOW', output_field=CharField())
-    )
-    
-    anomalies = list(potential_typos) + list(under_performers)
-    anomalies.sort(key=lambda x: x.final_result, reverse=True) # Sort desc by score
-    
-    # Format anomalies for display
-    for a in anomalies:
-        _attach_admin_formats(a)
+    # 5. Anomalies (already filtered, paginated and formatted)
+    anomalies_page = data['anomalies']
 
-    # --- UI Status Annotations ---
-    anomaly_emp_ids = set(r.employee_id for r in anomalies)
-    
     team_data = [] # New Data Structure for Template
     
-    for emp in team_scope:
-        # 1. Filter strictly for this employee to get ACCURATE status
-        emp_filters = filter_kwargs.copy()
-        if 'employee__id__in' in emp_filters:
-            del emp_filters['employee__id__in']
-        emp_filters['employee'] = emp
-        
-        emp_results = alk_kpi_result.objects.filter(**emp_filters)
-        
-        # 2. EXPLICIT COUNTING (No shortcuts)
-        total_kpis = int(emp_results.count())
-        locked_count = 0
-        
-        for r in emp_results:
-            if r.is_locked:
-                locked_count += 1
-        
-        # 3. ABSOLUTE LOGIC (No ambiguity) - USER OVERRIDE DEPLOYMENT #34
+    for emp in team_members:
+        # 1. Counts for this employee from the grouped query
+        total_kpis, locked_count = emp_counts.get(emp.id, (0, 0))
+
+        # 2. ABSOLUTE LOGIC (No ambiguity) - USER OVERRIDE DEPLOYMENT #34
         if total_kpis == 0:
             status = 'No Data'
             status_class = 'secondary'
@@ -499,10 +599,7 @@ def manager_dashboard(request):
             status = 'Pending'
             status_class = 'warning text-dark'
 
-        # 4. FINAL DEBUG PRINT for Ardyatma
-
-
-        # 5. Populate Dictionary
+        # 3. Populate Dictionary
         team_data.append({
             'employee': emp,
             'job_title': emp.job_title,
@@ -520,9 +617,7 @@ def manager_dashboard(request):
     no_kpi_count = len(missing_kpi_employees)
 
     # Paginate DICTIONARY list
-    from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
     paginator = Paginator(team_data, 20) # Show 20 contacts per page
-    page = request.GET.get('page')
     
     try:
         employees_page = paginator.page(page)
@@ -531,21 +626,7 @@ def manager_dashboard(request):
     except EmptyPage:
         employees_page = paginator.page(paginator.num_pages)
 
-    # Sort anomalies by final_result (ascending) to show worst performers first
-    anomalies.sort(key=lambda x: x.final_result if x.final_result is not None else 0)
-
-    # PAGINATION FOR ANOMALIES
-    # Show only 5 rows per page for better layout
-    anomalies_paginator = Paginator(anomalies, 5)
-    anomalies_page_num = request.GET.get('anomaly_page')
-    try:
-        anomalies_page = anomalies_paginator.page(anomalies_page_num)
-    except PageNotAnInteger:
-        anomalies_page = anomalies_paginator.page(1)
-    except EmptyPage:
-        anomalies_page = anomalies_paginator.page(anomalies_paginator.num_pages)
-
-    context = {
+    return {
         'page_title': 'Manager Dashboard',
         'user_employee': current_employee,
         'no_kpi_count': no_kpi_count, # New Count
@@ -558,7 +639,7 @@ def manager_dashboard(request):
             'avg_score': f"{round(avg_score * 100, 1)}%",
             'completion_rate': round((employees_done / total_staff * 100), 1) if total_staff > 0 else 0
         },
-        'missing_kpi_list': employees_missing_kpis,
+        'missing_kpi_list': [m['employee'] for m in missing_kpi_employees],
         'team_data': employees_page, # Renamed from team_scope to match template
         'anomalies': anomalies_page,
         
@@ -585,7 +666,6 @@ def manager_dashboard(request):
         }
     }
 
-    return render(request, 'kpi_app/portal/manager_dashboard.html', context)
 
 from django.views.decorators.http import require_POST
 
@@ -597,7 +677,7 @@ def manager_review_employee(request, emp_id):
     """
     user = request.user
     try:
-        current_employee = alk_employee.objects.get(user_id=user)
+        current_employee = get_request_employee(request)
     except alk_employee.DoesNotExist:
         return redirect('portal_dashboard')
 
@@ -608,17 +688,11 @@ def manager_review_employee(request, emp_id):
 
     target_emp = get_object_or_404(alk_employee, id=emp_id)
 
-    # SCOPE CHECK
-    if current_employee.level == 0:
-        # Group Manager Check
-        if target_emp.dept.group != current_employee.dept.group:
-             messages.error(request, "Employee not in your Group scope.")
-             return redirect('manager_dashboard')
-    elif current_employee.level == 1:
-        # Dept Manager Check
-        if target_emp.dept != current_employee.dept:
-             messages.error(request, "Employee not in your Department scope.")
-             return redirect('manager_dashboard')
+    # SCOPE CHECK (Group Manager: same group, Dept Manager: same dept)
+    if not get_employee_context(request).in_scope(target_emp.id):
+        scope_name = "Group" if current_employee.level == 0 else "Department"
+        messages.error(request, f"Employee not in your {scope_name} scope.")
+        return redirect('manager_dashboard')
     
     # 1. Get Filter Params — derive sensible defaults from DB, never hardcode
     _year_param = request.GET.get('year', '').strip()
@@ -639,22 +713,18 @@ def manager_review_employee(request, emp_id):
     current_sem = _sem_param or ''
     current_month = _month_param or ''
 
-    # 2. Filter QuerySet (Relaxed matching to align with Dashboard)
+    # 2. Filter QuerySet (normalized period code, same matching as the Dashboard)
     results_qs = alk_kpi_result.objects.filter(
         employee=target_emp,
-        year=current_year,
-        semester__icontains=current_sem,
-        month__icontains=current_month
-    ).order_by('kpi__kpi_name')
+        **period_lookup(current_year or None, current_sem, current_month)
+    ).select_related('kpi').order_by('kpi__kpi_name')
 
     # Check approval status using queryset (efficient DB query before list conversion)
     is_fully_approved = not results_qs.filter(is_locked=False).exists() and results_qs.exists()
 
     # Convert to list and attach display formats (must be list so paginator slices
     # don't re-query DB and lose the dynamically attached attributes)
-    results = list(results_qs)
-    for res in results:
-        _attach_admin_formats(res)
+    results = attach_formats(list(results_qs))
 
     # 3. Context for Dropdowns
     months = ['1st', '2nd', '3rd', '4th', '5th', 'Final']
@@ -687,11 +757,12 @@ def manager_toggle_approval(request, emp_id):
     """
     Toggles the 'is_locked' status of selected KPI Results.
     Supports BULK operations via 'selected_kpi' list.
-    After toggling, triggers a table refresh with the correct year/semester/month filters.
+    After toggling, returns the status message plus the rows whose status
+    actually changed, as out-of-band swaps.
     """
     user = request.user
     try:
-        current_employee = alk_employee.objects.get(user_id=user)
+        current_employee = get_request_employee(request)
     except alk_employee.DoesNotExist:
         return HttpResponse("Unauthorized", status=403)
 
@@ -722,22 +793,29 @@ def manager_toggle_approval(request, emp_id):
         if count == 0:
             return HttpResponse('<span class="badge bg-secondary">No matching records found</span>')
 
-        # 4. Apply Action
+        # 4. Apply Action (only rows whose status changes get a new version)
         if action == 'approve':
-            results.update(is_locked=True)
+            changed_ids = list(results.filter(is_locked=False).values_list('id', flat=True))
+            alk_kpi_result.objects.filter(id__in=changed_ids).update(is_locked=True, updated_at=timezone.now())
+            alk_kpi_summary.refresh_queryset(results)
             msg = f'<span class="fw-bold text-success"><i class="bi bi-check-circle me-1"></i>Approved {count} item(s)</span>'
         elif action == 'reject':
-            results.update(is_locked=False)
+            changed_ids = list(results.filter(is_locked=True).values_list('id', flat=True))
+            alk_kpi_result.objects.filter(id__in=changed_ids).update(is_locked=False, updated_at=timezone.now())
+            alk_kpi_summary.refresh_queryset(results)
             msg = f'<span class="fw-bold text-warning"><i class="bi bi-unlock me-1"></i>Unlocked {count} item(s)</span>'
         else:
             return HttpResponse('<span class="badge bg-secondary">Unknown Action</span>')
 
-        # 5. Build response — trigger table reload with correct filter params
-        response = HttpResponse(msg)
-        # The tbody listens to 'kpi_table_update from:body' and will re-GET with
-        # its hx-get URL (which already has year/semester/month baked in from template).
-        response['HX-Trigger'] = 'kpi_table_update'
-        return response
+        # 5. Build response — message + out-of-band swaps of the changed rows only
+        changed_rows = attach_formats(list(
+            alk_kpi_result.objects.filter(id__in=changed_ids).select_related('kpi').order_by('kpi__kpi_name')
+        ))
+        return HttpResponse(msg + render_to_string(
+            'kpi_app/portal/partials/review_rows_oob.html',
+            {'changed_rows': changed_rows, 'total_score': None, 'is_manager': True},
+            request=request,
+        ))
 
     except Exception as e:
         return HttpResponse(f'<span class="badge bg-danger">Error: {str(e)}</span>')
@@ -747,31 +825,22 @@ def manager_toggle_approval(request, emp_id):
 @login_required
 @require_POST
 def manager_save_kpi(request, result_id):
-    import sys
-    print(f"--- DEBUG: Attempting to SAVE KPI ID: {result_id} ---", file=sys.stderr)
-    print(f"DEBUG: POST Data: {request.POST}", file=sys.stderr)
-    
     result = get_object_or_404(alk_kpi_result, id=result_id)
-    
+
     # --- NEW GUARD: ACTIVE CHECK ---
     if not result.active:
-        print(f"ERROR: Attempt to edit INACTIVE KPI {result_id}", file=sys.stderr)
         return HttpResponseForbidden("This KPI result is inactive and cannot be edited.")
 
     # Security Check: Ensure user has rights to edit this result
-    user = request.user
     try:
-        current_employee = alk_employee.objects.get(user_id=user)
+        current_employee = get_request_employee(request)
         # Add team scope check here if needed in future
         if current_employee.level > 1: # Basic Manager Check
-            print(f"ERROR: Unauthorized - User level {current_employee.level} > 1", file=sys.stderr)
             return HttpResponse("Unauthorized", status=403)
     except alk_employee.DoesNotExist:
-        print("ERROR: Employee profile not found", file=sys.stderr)
         return HttpResponse("Unauthorized", status=403)
 
     if result.is_locked:
-        print("ERROR: Result is locked", file=sys.stderr)
         return HttpResponse("Locked", status=403)
 
     # DYNAMIC KEYS
@@ -779,51 +848,38 @@ def manager_save_kpi(request, result_id):
     tgt_key = f'target_input_{result_id}'
 
     # --- 1. HANDLE ACHIEVEMENT UPDATE ---
-    # Only allow update if NOT from SAP
+    # Only allow update if NOT from SAP; an invalid number keeps the old value
     if ach_key in request.POST and not result.kpi.from_sap:
-        val = request.POST.get(ach_key)
-        print(f"DEBUG: Processing Achievement: '{val}'", file=sys.stderr)
         try:
-            # Handle empty string as None, remove commas
-            clean_val = val.replace(',', '') if val else None
-            # Handle "None" string explicitly if passed
-            if clean_val == '' or clean_val is None:
-                result.achievement = None
-            else:
-                result.achievement = Decimal(clean_val)
-            print(f"DEBUG: Achievement Updated to: {result.achievement}", file=sys.stderr)
-        except ValueError as e:
-            print(f"ERROR: Achievement Conversion Failed: {e}", file=sys.stderr)
-            pass # Keep old value on error
+            result.achievement = _parse_decimal(request.POST[ach_key], alk_kpi_result._meta.get_field('achievement'))
+        except ValidationError:
+            pass
 
     # --- 2. HANDLE TARGET INPUT UPDATE ---
     # Only allow update if KPI uses Percentage Calculation logic and not from SAP
     if tgt_key in request.POST and result.kpi.percentage_cal and not result.kpi.from_sap:
-        val = request.POST.get(tgt_key)
-        print(f"DEBUG: Processing Target Input: '{val}'", file=sys.stderr)
         try:
-            clean_val = val.replace(',', '') if val else None
-             # Handle "None" string explicitly
-            if clean_val == '' or clean_val is None:
-                result.target_input = None
-            else:
-                result.target_input = Decimal(clean_val)
-            print(f"DEBUG: Target Input Updated to: {result.target_input}", file=sys.stderr)
-        except ValueError as e:
-            print(f"ERROR: Target Input Conversion Failed: {e}", file=sys.stderr)
+            result.target_input = _parse_decimal(request.POST[tgt_key], alk_kpi_result._meta.get_field('target_input'))
+        except ValidationError:
             pass
 
-    # --- 3. RECALCULATE & SAVE ---
-    # Always recalculate the final score because inputs changed
-    result.calculate_final_result() 
+    # --- 3. SAVE (save() recalculates final_result) ---
     result.save()
-    print("--- DEBUG: Save Complete & Signal Sent ---", file=sys.stderr)
 
-    # --- 4. TRIGGER HTMX REFRESH ---
-    # This header forces the frontend table to reload itself
-    response = HttpResponse("")
-    response['HX-Trigger'] = 'kpi_table_update'
-    return response
+    # --- 4. OUT-OF-BAND SWAP OF THIS ROW + PERIOD TOTAL ---
+    # Các dòng khác không đổi nên không render lại cả bảng
+    attach_formats([result])
+    total_val = alk_kpi_result.objects.filter(
+        employee_id=result.employee_id,
+        year=result.year,
+        semester=result.semester,
+        month=result.month
+    ).aggregate(Sum('final_result'))['final_result__sum'] or 0
+    return render(request, 'kpi_app/portal/partials/review_rows_oob.html', {
+        'changed_rows': [result],
+        'total_score': total_val * 100,
+        'is_manager': True,
+    })
 
 
 @login_required
@@ -834,20 +890,18 @@ def manager_reports(request):
     """
     # Authorization: Only managers (level <= 1) can access
     try:
-        employee = alk_employee.objects.get(user_id=request.user)
+        employee = get_request_employee(request)
         if employee.level > 1:
             return HttpResponseForbidden("Access denied: Manager privileges required")
     except alk_employee.DoesNotExist:
         messages.error(request, "Employee profile not found.")
         return redirect('logout')
 
-    # Department isolation: managers see only their own dept
-    manager_dept = employee.dept
-
-    # 1. Get distinct filter options from DB for dropdowns
-    available_years = alk_kpi_result.objects.exclude(year__isnull=True).values_list('year', flat=True).distinct().order_by('-year')
-    available_sems = alk_kpi_result.objects.exclude(semester__isnull=True).exclude(semester__exact='').values_list('semester', flat=True).distinct().order_by('semester')
-    available_months = alk_kpi_result.objects.exclude(month__isnull=True).exclude(month__exact='').values_list('month', flat=True).distinct().order_by('month')
+    # 1. Filter options for the dropdowns from the (cached) period catalogue
+    periods = all_periods()
+    available_years = periods.years
+    available_sems = periods.semesters
+    available_months = periods.months
 
     # Default to first available option from DB
     from datetime import datetime
@@ -866,46 +920,15 @@ def manager_reports(request):
         year_int = datetime.now().year
         current_year = str(year_int)
 
-    # 2. Query Approved KPI Data (historical: active=True no longer required)
-    valid_results = alk_kpi_result.objects.filter(
-        year=year_int,
-        semester__icontains=current_sem,
-        month__icontains=current_month,
-        is_locked=True,
-    )
-    if manager_dept:
-        valid_results = valid_results.filter(employee__dept=manager_dept)
-
-    # 3. Aggregate Total Score per Employee with percentage calculation in DB
-    from django.db.models.functions import Coalesce
-    ranking_data = (
-        valid_results.values(
-            'employee__id',
-            'employee__name',
-            'employee__job_title__job_title'
-        )
-        .annotate(
-            total_score=Coalesce(Sum('final_result'), Decimal('0.0')),
-            percentage_score=Coalesce(Sum('final_result'), Decimal('0.0')) * 100
-        )
-        .order_by('-percentage_score')  # Sort descending (Highest score first)
-    )
-
-    # 4. Process for UI (Add ranking)
-    processed_ranking = []
-    rank = 1
-    for emp in ranking_data:
-        processed_ranking.append({
-            'rank': rank,
-            'id': emp['employee__id'],
-            'name': emp['employee__name'],
-            'job_title': emp['employee__job_title__job_title'],
-            'score': round(float(emp['percentage_score']), 2)
-        })
-        rank += 1
+    # 2. Ranking scope: managers see their own dept (group managers may widen to their dept group)
+    scopes = allowed_scopes(request.user, employee)
+    current_scope = request.GET.get('scope', SCOPE_DEPT)
+    if current_scope not in scopes:
+        current_scope = SCOPE_DEPT
 
-    # Pagination
-    paginator = Paginator(processed_ranking, 20)
+    # 3. Rank approved scores in the DB (RANK: ties share a rank), paginated with LIMIT/OFFSET
+    ranking = employee_ranking(employee, current_scope, year_int, current_sem, current_month)
+    paginator = Paginator(ranking, 20)
     page_number = request.GET.get('page', 1)
     page_obj = paginator.get_page(page_number)
 
@@ -916,6 +939,8 @@ def manager_reports(request):
         'available_years': available_years,
         'available_sems': available_sems,
         'available_months': available_months,
+        'current_scope': current_scope,
+        'scope_options': [(scope, SCOPE_LABELS[scope]) for scope in scopes],
         'page_obj': page_obj,
     }
     return render(request, 'kpi_app/portal/manager_reports.html', context)
@@ -923,21 +948,15 @@ def manager_reports(request):
 
 @login_required
 def export_manager_reports(request):
-    """Export manager reports ranking to Excel (.xlsx)."""
-    import openpyxl
-    from openpyxl.styles import Font, Alignment, PatternFill
-
+    """Export manager reports ranking to Excel (.xlsx), as a background job."""
     # 1. Authorization: managers only
     try:
-        employee = alk_employee.objects.get(user_id=request.user)
+        employee = get_request_employee(request)
         if employee.level > 1:
             return HttpResponseForbidden('Access denied: Manager privileges required')
     except alk_employee.DoesNotExist:
         return HttpResponseForbidden('Employee profile not found')
 
-    # Department isolation
-    manager_dept = employee.dept
-
     # 2. Get filters from request
     current_year = request.GET.get('year', '')
     current_sem  = request.GET.get('semester', '')
@@ -949,70 +968,73 @@ def export_manager_reports(request):
     except (ValueError, TypeError):
         from datetime import datetime
         year_int = datetime.now().year
-        current_year = str(year_int)
 
-    # 3. Query approved KPI data (historical: active=True removed)
-    valid_results = alk_kpi_result.objects.filter(
-        year=year_int,
-        semester__icontains=current_sem,
-        month__icontains=current_month,
-        is_locked=True,
-    )
-    if manager_dept:
-        valid_results = valid_results.filter(employee__dept=manager_dept)
-
-    from django.db.models.functions import Coalesce
-    ranking_data = (
-        valid_results.values(
-            'employee__id',
-            'employee__name',
-            'employee__job_title__job_title'
-        )
-        .annotate(total_score=Coalesce(Sum('final_result'), Decimal('0.0')))
-        .order_by('-total_score')
-    )
+    scope = request.GET.get('scope', SCOPE_DEPT)
+    if scope not in allowed_scopes(request.user, employee):
+        scope = SCOPE_DEPT
 
-    # 4. Build Excel workbook
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = f'Ranking {current_month} {current_year}'
-
-    # Header style
-    header_font = Font(bold=True, color='FFFFFF')
-    header_fill = PatternFill(start_color='4E73DF', end_color='4E73DF', fill_type='solid')
-    header_align = Alignment(horizontal='center')
-
-    headers = ['RANK', 'EMPLOYEE NAME', 'JOB TITLE', 'TOTAL SCORE (%)']
-    ws.append(headers)
-    for cell in ws[1]:
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_align
-
-    # Column widths
-    ws.column_dimensions['A'].width = 10
-    ws.column_dimensions['B'].width = 30
-    ws.column_dimensions['C'].width = 25
-    ws.column_dimensions['D'].width = 20
-
-    # 5. Data rows
-    rank = 1
-    for emp in ranking_data:
-        raw_score = emp['total_score'] if emp['total_score'] else 0
-        percentage_score = round(float(raw_score) * 100, 2)
-        ws.append([
-            rank,
-            emp['employee__name'],
-            emp['employee__job_title__job_title'],
-            percentage_score
-        ])
-        rank += 1
-
-    # 6. Return file response
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    filename = f'KPI_Ranking_{current_year}_{current_month}.xlsx'
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    wb.save(response)
-    return response
+    # 3. Same ranking query as the Reports screen, run by the job worker (run_jobs)
+    job = enqueue('export_manager_ranking', user=request.user, params={
+        'year': year_int, 'semester': current_sem, 'month': current_month, 'scope': scope,
+    })
+    return redirect('job_detail', job_id=job.id)
+
+
+def _get_job_for_user(request, job_id):
+    """Job visible to its creator and superusers only."""
+    job = get_object_or_404(alk_job, id=job_id)
+    if not request.user.is_superuser and job.created_by_id != request.user.id:
+        return None
+    return job
+
+@login_required
+def job_detail(request, job_id):
+    """Progress page of a background job; shows the download link when ready."""
+    job = _get_job_for_user(request, job_id)
+    if job is None:
+        return HttpResponseForbidden("Access denied")
+    return render(request, 'kpi_app/portal/job_detail.html', {'page_title': 'Background Job', 'job': job})
+
+@login_required
+def job_status(request, job_id):
+    """JSON progress API polled by job_detail."""
+    job = _get_job_for_user(request, job_id)
+    if job is None:
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    return JsonResponse({
+        'id': job.id,
+        'job_type': job.job_type,
+        'status': job.status,
+        'processed': job.processed,
+        'total': job.total,
+        'percent': job.percent,
+        'message': job.message.splitlines()[0] if job.message else '',
+        'download_url': resolve_url('job_download', job.id) if job.result_file else None,
+    })
+
+@login_required
+def job_download(request, job_id):
+    from django.http import FileResponse, Http404
+
+    job = _get_job_for_user(request, job_id)
+    if job is None:
+        return HttpResponseForbidden("Access denied")
+    if job.status != alk_job.STATUS_DONE or not job.result_file:
+        raise Http404("Result not ready")
+    return FileResponse(job.result_file.open('rb'), as_attachment=True,
+                        filename=job.result_file.name.rsplit('/', 1)[-1])
+
+
+@login_required
+def request_timings(request):
+    """p50 / p95 per URL name of the requests timed by RequestTimingMiddleware (staff only)."""
+    if not request.user.is_staff:
+        return HttpResponseForbidden("Access denied")
+    if request.method == 'POST':
+        reset_timings()
+        return redirect('request_timings')
+    return render(request, 'kpi_app/portal/request_timings.html', {
+        'page_title': 'Request Timings',
+        'enabled': request_timing_enabled(),
+        'rows': timing_summary(),
+    })